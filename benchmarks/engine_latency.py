@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Compare per-URL extraction latency of the subprocess and library engines.
+
+Usage: benchmarks/engine_latency.py [--runs N] URL [URL ...]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+start = time.perf_counter()
+import grab_engine  # noqa: E402
+import_time = time.perf_counter() - start
+
+
+def measure(engine, url, runs):
+    """Return the extraction times of a URL in seconds"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            engine.extract_info(url)
+        except (grab_engine.EngineError, OSError) as e:
+            print(f"  {engine.name}: {e}", file=sys.stderr)
+            return []
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help="extractions per URL and engine")
+    parser.add_argument('urls', nargs='+')
+    args = parser.parse_args()
+
+    engines = [grab_engine.SubprocessEngine()]
+    if grab_engine.LibraryEngine.available():
+        engines.append(grab_engine.LibraryEngine())
+        print(f"yt_dlp import (paid once by the library engine): {import_time * 1000:.0f} ms")
+    else:
+        print("yt_dlp module not installed, only the subprocess engine is measured")
+
+    print(f"{'engine':<12}{'min ms':>10}{'median ms':>12}{'mean ms':>10}  url")
+    totals = {engine.name: [] for engine in engines}
+    for url in args.urls:
+        for engine in engines:
+            times = measure(engine, url, args.runs)
+            if not times:
+                continue
+            totals[engine.name].extend(times)
+            print(f"{engine.name:<12}{min(times) * 1000:>10.0f}"
+                  f"{statistics.median(times) * 1000:>12.0f}"
+                  f"{statistics.mean(times) * 1000:>10.0f}  {url}")
+
+    print()
+    for name, times in totals.items():
+        if times:
+            print(f"{name}: median {statistics.median(times) * 1000:.0f} ms per URL over {len(times)} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Compare download throughput with one and with several connections per job.
+
+Serves a progressive file and an HLS stream from a local HTTP server that
+throttles every connection, like most media hosts do, then downloads both
+with the commands GRAB builds for each connection setting.
+
+Usage: benchmarks/fragment_throughput.py [--size MIB] [--rate KIB] [-N N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grab_core import DownloadSlot, build_download_command, downloader_available  # noqa: E402
+from grab_engine import SubprocessEngine  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    """Serve /media.mp4 with range support, and /media.m3u8 with its segments"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        server = self.server
+        if self.path == "/media.m3u8":
+            return self.send(200, "application/vnd.apple.mpegurl", server.playlist.encode(), send_body)
+        if self.path.startswith("/seg") and self.path.endswith(".ts"):
+            return self.send(200, "video/mp2t", server.segment, send_body)
+        if self.path != "/media.mp4":
+            return self.send(404, "text/plain", b"Not found", send_body)
+
+        data = server.media
+        start, end = 0, len(data) - 1
+        header = self.headers.get("Range", "")
+        if header.startswith("bytes="):
+            first, _, last = header[6:].split(",")[0].partition("-")
+            start = int(first or 0)
+            end = min(int(last), end) if last else end
+            return self.send(206, "video/mp4", data[start:end + 1], send_body,
+                             {"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+        self.send(200, "video/mp4", data, send_body)
+
+    def send(self, status, content_type, body, send_body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not send_body:
+            return
+
+        # Every connection gets at most server.rate bytes per second
+        try:
+            for offset in range(0, len(body), CHUNK):
+                self.wfile.write(body[offset:offset + CHUNK])
+                time.sleep(CHUNK / self.server.rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(size, rate, segments):
+    """Start the throttled server on a free port and return it"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledHandler)
+    server.daemon_threads = True
+    server.rate = rate
+    server.media = os.urandom(size)
+    server.segment = server.media[:size // segments]
+    duration = 4
+    server.playlist = "\n".join(
+        ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}", "#EXT-X-MEDIA-SEQUENCE:0"]
+        + [line for i in range(segments) for line in (f"#EXTINF:{duration}.0,", f"seg{i}.ts")]
+        + ["#EXT-X-ENDLIST", ""]
+    )
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def run_case(url, directory, connections, downloader):
+    """Download url once and return (seconds, bytes, progress updates), or None"""
+    output_path = tempfile.mkdtemp(dir=directory)
+    cmd = build_download_command(url, output_path=output_path, embed_metadata=False, embed_thumbnail=False,
+                                 concurrent_fragments=connections, external_downloader=downloader)
+    # The random payload is no real video, so leave it as downloaded
+    cmd = cmd[:-1] + ['--fixup', 'never', '--no-cache-dir', cmd[-1]]
+
+    slot = DownloadSlot(0, url, cmd)
+    output = []
+    updates = []
+    start = time.perf_counter()
+    try:
+        code = SubprocessEngine().download(cmd, slot, output.append, updates.append, lambda name: None)
+    except OSError as e:
+        print(f"  cannot run yt-dlp: {e}", file=sys.stderr)
+        return None
+    elapsed = time.perf_counter() - start
+    if code != 0:
+        print("  " + "  ".join(output[-5:]), file=sys.stderr)
+        return None
+
+    size = sum(os.path.getsize(os.path.join(output_path, name)) for name in os.listdir(output_path))
+    return elapsed, size, len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=16, help="MiB per download (default: 16)")
+    parser.add_argument('--rate', type=int, default=2048, help="KiB/s per connection (default: 2048)")
+    parser.add_argument('--segments', type=int, default=32, help="HLS segments (default: 32)")
+    parser.add_argument('-N', '--connections', type=int, default=8, help="connections to compare (default: 8)")
+    args = parser.parse_args()
+    if shutil.which("yt-dlp") is None:
+        parser.exit(1, "yt-dlp is not installed\n")
+
+    server = start_server(args.size * 1024 * 1024, args.rate * 1024, args.segments)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cases = [
+        ("progressive", f"{base}/media.mp4", 1, ""),
+        ("progressive", f"{base}/media.mp4", args.connections, "aria2c"),
+        ("hls", f"{base}/media.m3u8", 1, ""),
+        ("hls", f"{base}/media.m3u8", args.connections, ""),
+        ("hls", f"{base}/media.m3u8", args.connections, "aria2c"),
+    ]
+
+    directory = tempfile.mkdtemp(prefix="grab_fragments_")
+    print(f"{args.size} MiB per download, {args.rate} KiB/s per connection\n")
+    print(f"{'stream':<13}{'downloader':<12}{'conns':>6}{'seconds':>10}{'MiB/s':>8}{'speedup':>9}{'updates':>9}")
+    try:
+        baseline = {}
+        for stream, url, connections, downloader in cases:
+            if downloader and not downloader_available(downloader):
+                print(f"{stream:<13}{downloader:<12}  not installed, skipped")
+                continue
+            result = run_case(url, directory, connections, downloader)
+            if result is None:
+                print(f"{stream:<13}{downloader or 'yt-dlp':<12}  failed")
+                continue
+            elapsed, size, updates = result
+            throughput = size / elapsed / 1024 / 1024
+            baseline.setdefault(stream, throughput)
+            print(f"{stream:<13}{downloader or 'yt-dlp':<12}{connections:>6}{elapsed:>10.2f}{throughput:>8.2f}"
+                  f"{throughput / baseline[stream]:>8.1f}x{updates:>9}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Index of downloaded media, in the format of yt-dlp's --download-archive."""
+
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from grab_cache import canonical_url
+
+ARCHIVE_FILE = os.path.expanduser("~/.grab/archive.txt")
+
+
+def archive_key(info):
+    """Return the archive key of an info dict or flat playlist entry, or None
+
+    Keys are "<extractor> <id>" with the extractor key in lower case, the
+    same lines yt-dlp writes to a --download-archive file.
+    """
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    video_id = info.get('id')
+    if not extractor or not video_id:
+        return None
+    return f"{extractor.lower()} {video_id}"
+
+
+def url_archive_key(url):
+    """Return the archive key of a URL when it can be told without extraction"""
+    parts = urlsplit(canonical_url(url))
+    if parts.netloc == 'youtube.com' and parts.path == '/watch':
+        video_id = parse_qs(parts.query).get('v')
+        if video_id:
+            return f"youtube {video_id[0]}"
+    return None
+
+
+class DownloadArchive:
+    """Set of archive keys backed by a download archive file
+
+    yt-dlp appends to the file itself when it is passed as
+    --download-archive; refresh() reads only the lines added since the
+    last read, so lookups stay in memory however long the file grows.
+    The file is first read on a background thread and lookups wait for
+    it to finish.
+    """
+    def __init__(self, path=None):
+        self.path = path or ARCHIVE_FILE
+        self.keys = set()
+        self.offset = 0
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+
+        thread = threading.Thread(target=self.load)
+        thread.daemon = True
+        thread.start()
+
+    def load(self):
+        try:
+            self.refresh()
+        finally:
+            self.loaded.set()
+
+    def refresh(self):
+        """Add the keys appended to the archive file since the last read"""
+        with self.lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    # Start over if the file was replaced by a shorter one
+                    if os.fstat(f.fileno()).st_size < self.offset:
+                        self.keys.clear()
+                        self.offset = 0
+                    f.seek(self.offset)
+                    data = f.read()
+            except OSError:
+                return
+
+            # A line still being written is read next time
+            end = data.rfind(b"\n") + 1
+            self.offset += end
+            for line in data[:end].decode('utf-8', errors='replace').splitlines():
+                line = line.strip()
+                if line:
+                    self.keys.add(line)
+
+    def __contains__(self, key):
+        self.loaded.wait()
+        return key in self.keys
+
+    def __len__(self):
+        self.loaded.wait()
+        return len(self.keys)
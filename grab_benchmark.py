@@ -0,0 +1,144 @@
+"""Scripted GRAB session against a stub yt-dlp, run by `grab --benchmark`.
+
+Every run cold-starts the headless core, fetches media info, lists a
+playlist into a fresh queue and downloads it. The stub prints the same
+kind of output as yt-dlp without touching the network, so the timings
+show GRAB's own overhead. Percentiles of every recorded span are printed
+at the end.
+"""
+
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from grab_core import DEFAULT_SETTINGS, PlaylistExpansion, QueueRunner, build_download_command, expand_playlist
+from grab_engine import SubprocessEngine
+from grab_metrics import MetricsStore
+from grab_store import QueueStore
+from grab_trace import span, tracer
+
+STUB_YT_DLP = '''#!/usr/bin/env python3
+import json, os, sys
+
+args = sys.argv[1:]
+if '--flat-playlist' in args:
+    for i in range(int(os.environ['GRAB_STUB_ENTRIES'])):
+        print(json.dumps({'_type': 'url', 'ie_key': 'Stub', 'id': f'v{i}',
+                          'url': f'https://stub.invalid/watch?v={i}', 'title': f'Video {i}'}), flush=True)
+elif '--dump-json' in args:
+    print(json.dumps({'id': 'v0', 'extractor_key': 'Stub', 'title': 'Stub video', 'duration': 60,
+                      'formats': [{'format_id': '18', 'ext': 'mp4', 'height': 360, 'filesize': 1048576}]}))
+else:
+    lines = int(os.environ['GRAB_STUB_LINES'])
+    print('[download] Destination: ' + args[args.index('-o') + 1].replace('%(title)s.%(ext)s', 'video.mp4'), flush=True)
+    for i in range(1, lines + 1):
+        print(f'[download] {i * 100 / lines:5.1f}% of 10.00MiB at 5.00MiB/s ETA 00:01', flush=True)
+'''
+
+VIDEO_URL = "https://stub.invalid/watch?v=v0"
+PLAYLIST_URL = "https://stub.invalid/playlist?list=benchmark"
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def install_stub(directory, entries, lines):
+    """Put the stub yt-dlp first on PATH"""
+    path = os.path.join(directory, "yt-dlp")
+    with open(path, 'w') as f:
+        f.write(STUB_YT_DLP)
+    os.chmod(path, 0o755)
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    os.environ['GRAB_STUB_ENTRIES'] = str(entries)
+    os.environ['GRAB_STUB_LINES'] = str(lines)
+
+
+def run_session(directory, jobs):
+    """Run one scripted session in a fresh queue"""
+    engine = SubprocessEngine()
+    settings = dict(DEFAULT_SETTINGS, engine=SubprocessEngine.name, download_archive="",
+                    default_output_path=os.path.join(directory, "downloads"))
+
+    # Without GRAB_TRACE, the child would overwrite our trace file at exit
+    env = dict(os.environ)
+    env.pop('GRAB_TRACE', None)
+    with span("bench.headless_startup"):
+        subprocess.run([sys.executable, "-c", "import grab_core"], check=True, env=env,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    with span("bench.fetch_info"):
+        engine.extract_info(VIDEO_URL)
+
+    store_path = os.path.join(directory, "queue.db")
+    store = QueueStore(store_path)
+    try:
+        with span("bench.list_playlist"):
+            cmd = build_download_command(PLAYLIST_URL, output_path=settings["default_output_path"])
+            error = expand_playlist(engine, PlaylistExpansion(PLAYLIST_URL, cmd), store,
+                                    lambda items: None, lambda key: False)
+            if error:
+                raise RuntimeError(error)
+
+        with open(os.devnull, 'w') as devnull, span("bench.download_queue"):
+            runner = QueueRunner(settings, store=store, out=devnull, log_dir=os.path.join(directory, "logs"),
+                                 metrics=MetricsStore(os.path.join(directory, "metrics.jsonl")))
+            if runner.run(jobs) != 0:
+                raise RuntimeError("a stub download failed")
+    finally:
+        store.close()
+        for name in os.listdir(directory):
+            if name.startswith("queue.db"):
+                os.unlink(os.path.join(directory, name))
+
+
+def print_report(durations, out):
+    """Print count and percentiles in milliseconds for every span"""
+    print(f"{'span':<26}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+    for name in sorted(durations):
+        values = durations[name]
+        print(f"{name:<26}{len(values):>8}"
+              f"{percentile(values, 0.5) * 1000:>10.2f}{percentile(values, 0.9) * 1000:>10.2f}"
+              f"{percentile(values, 0.99) * 1000:>10.2f}{max(values) * 1000:>10.2f}", file=out)
+
+
+def main(argv=None):
+    """Entry point of grab --benchmark"""
+    parser = argparse.ArgumentParser(
+        prog="grab --benchmark",
+        description="Replay a scripted session against a stub yt-dlp and print span percentiles."
+    )
+    parser.add_argument("--benchmark", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5, help="sessions to run (default: 5)")
+    parser.add_argument("--entries", type=int, default=50, help="playlist entries per session (default: 50)")
+    parser.add_argument("--lines", type=int, default=200, help="progress lines per download (default: 200)")
+    parser.add_argument("-j", "--jobs", type=int, default=3, help="concurrent downloads (default: 3)")
+    parser.add_argument("--trace", metavar="FILE", help="also write the spans as a Chrome trace file")
+    args = parser.parse_args(argv)
+
+    tracer.enable(args.trace)
+    directory = tempfile.mkdtemp(prefix="grab_benchmark_")
+    try:
+        install_stub(directory, args.entries, args.lines)
+        started = time.perf_counter()
+        for run in range(args.runs):
+            with span("bench.session", run=run):
+                run_session(directory, args.jobs)
+        elapsed = time.perf_counter() - started
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{args.runs} session(s), {args.entries} downloads of {args.lines} lines each, "
+          f"{args.jobs} at a time, {elapsed:.2f} s\n")
+    print_report(tracer.durations(), sys.stdout)
+    return 0
@@ -0,0 +1,259 @@
+"""On-disk caches under the GRAB data directory."""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+CACHE_DIR = os.path.expanduser("~/.grab/cache")
+
+# Query parameters that never change what a URL points to
+TRACKING_PARAMS = {'feature', 'si', 'pp', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src'}
+
+# Mobile hosts serving the same media as the site itself; elsewhere an
+# m. host may be a different site or extract differently
+MOBILE_HOSTS = {
+    'm.youtube.com': 'youtube.com',
+    'm.facebook.com': 'facebook.com',
+    'm.twitch.tv': 'twitch.tv',
+    'm.dailymotion.com': 'dailymotion.com',
+    'm.soundcloud.com': 'soundcloud.com',
+    'm.vk.com': 'vk.com',
+    'm.bilibili.com': 'bilibili.com',
+    'mobile.twitter.com': 'twitter.com',
+    'mobile.x.com': 'x.com',
+}
+
+
+def canonical_url(url):
+    """Normalize a URL so equivalent links share one cache entry"""
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    host = MOBILE_HOSTS.get(host, host)
+    path = parts.path.rstrip('/') or '/'
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in TRACKING_PARAMS and not key.startswith('utm_')]
+
+    # Short YouTube links point to the same video as the watch page
+    if host == 'youtu.be' and len(path) > 1:
+        query.insert(0, ('v', path[1:]))
+        host, path = 'youtube.com', '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query.insert(0, ('v', path[len('/shorts/'):]))
+        path = '/watch'
+    if host == 'youtube.com' and path == '/watch':
+        # Timestamps and list positions do not change the extracted video
+        query = [(key, value) for key, value in query if key not in ('t', 'index', 'start_radio')]
+
+    if scheme == 'http':
+        scheme = 'https'
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+
+def remove_file(path):
+    """Delete a file, ignoring files that are already gone"""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class InfoCache:
+    """Media info dicts keyed by canonical URL and cookie profile
+
+    Entries expire ttl seconds after they were written, which their
+    file's modification time keeps. Once the cache grows beyond
+    max_bytes the least recently used entries are removed, by the
+    access time get() sets.
+    """
+    def __init__(self, directory=None, ttl=24 * 3600, max_bytes=100 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_DIR, "info")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, url, cookie_file=None):
+        """Return the cache key for a URL and cookie profile"""
+        profile = os.path.abspath(cookie_file) if cookie_file else ""
+        return hashlib.sha256(f"{canonical_url(url)}\n{profile}".encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json.gz")
+
+    def get(self, url, cookie_file=None):
+        """Return the cached info dict, or None if missing or expired"""
+        path = self.path(self.key(url, cookie_file))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get('time', 0) > self.ttl:
+            remove_file(path)
+            return None
+
+        # Mark the entry as recently used for eviction, keeping the
+        # modification time the TTL counts from
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+        return entry.get('info')
+
+    def put(self, url, cookie_file, info):
+        """Store an info dict and evict old entries if over budget"""
+        entry = {'url': canonical_url(url), 'time': time.time(), 'info': info}
+        path = self.path(self.key(url, cookie_file))
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError):
+            remove_file(temp_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove expired entries, then the least recently used ones until under max_bytes"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+
+            now = time.time()
+            total = 0
+            for atime, mtime, size, path in sorted(entries, reverse=True):
+                if now - mtime > self.ttl or total + size > self.max_bytes:
+                    remove_file(path)
+                else:
+                    total += size
+
+    def clear(self):
+        """Remove every entry"""
+        for name in os.listdir(self.directory):
+            remove_file(os.path.join(self.directory, name))
+
+
+class ThumbnailCache:
+    """Scaled thumbnail images stored by content hash
+
+    refs/ maps a thumbnail URL and size to the hash of the scaled image,
+    blobs/ holds each distinct image once. Blobs are touched when read and
+    the least recently used ones are removed once the cache grows beyond
+    max_bytes.
+    """
+    def __init__(self, directory=None, max_bytes=50 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_DIR, "thumbnails")
+        self.refs_dir = os.path.join(self.directory, "refs")
+        self.blobs_dir = os.path.join(self.directory, "blobs")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.refs_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+
+    def key(self, url, width, height):
+        """Return the reference key for a thumbnail URL at a size"""
+        return hashlib.sha256(f"{url}\n{width}x{height}".encode()).hexdigest()
+
+    def get(self, url, width, height):
+        """Return the scaled image bytes, or None if not cached"""
+        ref_path = os.path.join(self.refs_dir, self.key(url, width, height))
+        try:
+            with open(ref_path, 'r') as f:
+                blob_path = os.path.join(self.blobs_dir, f.read().strip())
+            with open(blob_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            os.utime(blob_path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, url, width, height, data):
+        """Store scaled image bytes and evict old images if over budget"""
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.blobs_dir, digest)
+        ref_path = os.path.join(self.refs_dir, self.key(url, width, height))
+        try:
+            if not os.path.exists(blob_path):
+                self._write(self.blobs_dir, blob_path, data)
+            self._write(self.refs_dir, ref_path, digest.encode())
+        except OSError:
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used images until under max_bytes"""
+        with self.lock:
+            blobs = []
+            for name in os.listdir(self.blobs_dir):
+                path = os.path.join(self.blobs_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in blobs)
+            if total <= self.max_bytes:
+                return
+
+            for _, size, path in sorted(blobs):
+                remove_file(path)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+            # Drop references to removed images
+            for name in os.listdir(self.refs_dir):
+                ref_path = os.path.join(self.refs_dir, name)
+                try:
+                    with open(ref_path, 'r') as f:
+                        digest = f.read().strip()
+                except OSError:
+                    continue
+                if not os.path.exists(os.path.join(self.blobs_dir, digest)):
+                    remove_file(ref_path)
+
+    def clear(self):
+        """Remove every image and reference"""
+        for directory in (self.refs_dir, self.blobs_dir):
+            for name in os.listdir(directory):
+                remove_file(os.path.join(directory, name))
+
+    @staticmethod
+    def _write(directory, path, data):
+        """Write a file atomically"""
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            remove_file(temp_path)
+            raise
@@ -0,0 +1,248 @@
+"""Control API: queue, list, cancel, pause, resume and reorder downloads from other programs.
+
+Requests arrive through the status endpoint (see grab_status) when
+control is enabled. They change the queue journal on the request
+thread and tell whoever runs the downloads through on_change, so a
+request never waits for the GUI main loop.
+
+    GET  /jobs?state=queued&limit=100&offset=0
+    POST /jobs           {"urls": [...], "options": {...}, "front": false, "start": false}
+                         or {"items": [{"url": ..., "options": {...}}, ...], ...}
+    POST /jobs/cancel    {"ids": [...]}
+    POST /jobs/pause     {"ids": [...]}
+    POST /jobs/resume    {"ids": [...]}
+    POST /jobs/move      {"ids": [...], "to": "front" or "back"}
+
+Item options are those of grab_core.ITEM_OPTIONS, anything not given
+comes from the GRAB settings.
+"""
+
+import os
+import secrets
+
+from grab_archive import url_archive_key
+from grab_engine import looks_like_playlist
+from grab_import import UrlImport, clean_url
+from grab_store import DOWNLOADING, FAILED, PAUSED, QUEUED, STOPPED
+
+TOKEN_FILE = os.path.expanduser("~/.grab/control_token")
+
+# Largest page of GET /jobs
+MAX_LIST_LIMIT = 1000
+
+
+def control_token(path=None):
+    """Return the secret TCP clients must send, creating it on first use"""
+    path = path or TOKEN_FILE
+    try:
+        with open(path, 'r') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token + "\n")
+    return token
+
+
+class ControlError(Exception):
+    """A request that cannot be served, with the HTTP status to answer"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def item_status(item):
+    """Describe a QueueItem for API clients"""
+    return {
+        'id': item.id,
+        'url': None if item.private else item.url,
+        'state': item.state,
+        'error': item.error,
+        'failure': item.failure,
+        'retry_at': item.retry_at,
+        'bytes_done': item.bytes_done,
+        'attempts': item.attempts,
+        'private': item.private,
+        'created_at': item.created_at,
+        'started_at': item.started_at,
+        'finished_at': item.finished_at,
+    }
+
+
+def item_ids(request):
+    ids = request.get('ids')
+    if not isinstance(ids, list) or not all(type(item_id) is int for item_id in ids):
+        raise ControlError("ids must be a list of item ids")
+    return ids
+
+
+class QueueControl:
+    """Serve control requests against a QueueStore
+
+    build_command(url, options) returns the yt-dlp command for a URL with
+    per-item options, raising ValueError for invalid ones. is_archived(key)
+    tells whether an archive key was downloaded before, and private()
+    whether new items are private. on_change(action, data) is called from
+    the request thread after the journal changed:
+
+        'added'   (items, [(playlist url, cmd)], start, front)
+        'state'   ([item ids], new state)
+        'cancel'  [ids of running items to stop]
+        'pause'   [ids of running items to interrupt and keep paused]
+        'move'    ([item ids], to_front)
+    """
+    def __init__(self, store, build_command, is_archived=None, on_change=None, private=lambda: False):
+        self.store = store
+        self.build_command = build_command
+        self.is_archived = is_archived or (lambda key: False)
+        self.on_change = on_change or (lambda action, data: None)
+        self.private = private
+        self.routes = {
+            ('GET', '/jobs'): self.list_jobs,
+            ('POST', '/jobs'): self.enqueue,
+            ('POST', '/jobs/cancel'): self.cancel,
+            ('POST', '/jobs/pause'): self.pause,
+            ('POST', '/jobs/resume'): self.resume,
+            ('POST', '/jobs/move'): self.move,
+        }
+
+    def handle(self, method, path, request):
+        """Serve one request, return (HTTP status, JSON-serializable result)
+
+        request is the query of a GET or the JSON body of a POST.
+        """
+        route = self.routes.get((method, path.rstrip('/')))
+        if route is None:
+            return 404, {'error': f"No such endpoint: {method} {path}"}
+        if not isinstance(request, dict):
+            return 400, {'error': "The request body must be a JSON object"}
+        try:
+            return route(request)
+        except ControlError as e:
+            return e.status, {'error': str(e)}
+
+    def list_jobs(self, request):
+        try:
+            limit = min(int(request.get('limit', 100)), MAX_LIST_LIMIT)
+            offset = int(request.get('offset', 0))
+        except (TypeError, ValueError):
+            raise ControlError("limit and offset must be numbers")
+        if limit < 0 or offset < 0:
+            raise ControlError("limit and offset must not be negative")
+        items = self.store.list_items(request.get('state') or None, limit, offset)
+        return 200, {'jobs': [item_status(item) for item in items]}
+
+    def enqueue(self, request):
+        """Queue many URLs at once, each with its own options"""
+        if 'items' in request:
+            entries = request['items']
+        else:
+            urls = request.get('urls', [])
+            if not isinstance(urls, list):
+                raise ControlError("urls must be a list")
+            entries = [{'url': url} for url in urls]
+        defaults = request.get('options') or {}
+        if not isinstance(entries, list) or not isinstance(defaults, dict):
+            raise ControlError("items and urls must be lists and options an object")
+
+        # Every item is checked before anything is saved
+        checked = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not isinstance(entry.get('url'), str):
+                raise ControlError("Every item needs a url")
+            options = entry.get('options') or {}
+            if not isinstance(options, dict):
+                raise ControlError(f"{entry['url']}: options must be an object")
+            options = {**defaults, **options}
+            if isinstance(options.get('output_path'), str):
+                options['output_path'] = os.path.expanduser(options['output_path'])
+            checked.append((entry['url'], options))
+
+        def archived(url):
+            key = url_archive_key(url)
+            return key is not None and self.is_archived(key)
+
+        # Only the submitted URLs are looked up in the journal
+        submitted = [clean_url(text) for text, options in checked]
+        url_import = UrlImport(self.store.pending_among(url for url in submitted if url), archived)
+        entries = []
+        playlists = []
+        for text, options in checked:
+            count = len(url_import.urls)
+            url_import.add(text)
+            if len(url_import.urls) == count:
+                continue
+            url = url_import.urls[-1]
+            try:
+                cmd = self.build_command(url, options)
+            except ValueError as e:
+                raise ControlError(f"{url}: {e}")
+
+            # Playlists are listed into one item per entry like single adds
+            if looks_like_playlist(url):
+                playlists.append((url, cmd))
+                continue
+            item_options = {'cmd': cmd}
+            key = url_archive_key(url)
+            if key:
+                item_options['archive_key'] = key
+            entries.append((url, item_options))
+
+        items = self.store.add_many(entries, private=self.private())
+        front = bool(request.get('front'))
+        if front and items:
+            self.store.move([item.id for item in items], to_front=True)
+        if items or playlists:
+            self.on_change('added', (items, playlists, bool(request.get('start')), front))
+        return 201, {
+            'added': [item.id for item in items],
+            'playlists': [url for url, cmd in playlists],
+            'duplicates': url_import.duplicates,
+            'archived': url_import.archived,
+            'invalid': url_import.invalid,
+        }
+
+    def change(self, request, new_state, from_states, interrupt=None):
+        """Move waiting items to new_state and have running ones interrupted"""
+        ids = item_ids(request)
+        changed = self.store.change_state(ids, new_state, from_states)
+        if changed:
+            self.on_change('state', (changed, new_state))
+
+        running = []
+        if interrupt:
+            running = [item_id for item_id, state in self.store.states(ids).items() if state == DOWNLOADING]
+            if running:
+                self.on_change(interrupt, running)
+        return 200, {'changed': changed, 'interrupted': running}
+
+    def cancel(self, request):
+        return self.change(request, STOPPED, (QUEUED, PAUSED), interrupt='cancel')
+
+    def pause(self, request):
+        return self.change(request, PAUSED, (QUEUED,), interrupt='pause')
+
+    def resume(self, request):
+        """Queue items again with a fresh retry count"""
+        from_states = (PAUSED, STOPPED, FAILED)
+        self.store.reset_retries([item_id for item_id, state in self.store.states(item_ids(request)).items()
+                                  if state in from_states])
+        return self.change(request, QUEUED, from_states)
+
+    def move(self, request):
+        ids = item_ids(request)
+        if request.get('to', 'front') not in ('front', 'back'):
+            raise ControlError("to must be 'front' or 'back'")
+        to_front = request.get('to', 'front') == 'front'
+        existing = self.store.states(ids)
+        ids = [item_id for item_id in ids if item_id in existing]
+        if ids:
+            self.store.move(ids, to_front)
+            self.on_change('move', (ids, to_front))
+        return 200, {'moved': ids}
@@ -0,0 +1,856 @@
+"""GUI-free core of GRAB: settings, download commands and the download queue.
+
+Nothing here imports GTK, so the queue also runs on machines without a
+display through `grab --headless`.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+
+from grab_archive import ARCHIVE_FILE, DownloadArchive, archive_key, url_archive_key
+from grab_control import TOKEN_FILE, QueueControl
+from grab_engine import EngineError, entry_url, get_engine, looks_like_playlist
+from grab_formats import FormatRules
+from grab_log import JobLog
+from grab_metrics import JobMetrics, MetricsStore, average_speed, format_duration, format_size
+from grab_postprocess import PostprocessPool, info_file_path, remove_info_file, split_command
+from grab_retry import FAILURE_LABELS, RetryPolicy, classify_failure, error_lines
+from grab_scheduler import BandwidthBudget, DiskSpace, HostLimits, MediaSize, output_directory, size_factor
+from grab_status import QueueStatus, StatusServer
+from grab_trace import span
+from grab_store import COMPLETED, FAILED, PAUSED, QUEUED, STOPPED, QueueStore
+
+SETTINGS_FILE = os.path.expanduser("~/.grab_settings.json")
+
+# Choices of the format and media type combos, settings store their index
+OUTPUT_FORMATS = ["mp4", "mkv", "webm", "mp3", "m4a", "flac", "best"]
+MEDIA_TYPES = ["Video", "Audio"]
+
+# SponsorBlock categories to remove for each choice of the SponsorBlock combo
+SPONSORBLOCK_CATEGORIES = [None, "sponsor", "sponsor,intro,outro", "all"]
+
+DEFAULT_SETTINGS = {
+    "use_dark_theme": True,
+    "theme_follows_system": True,
+    "default_format": 6,  # best
+    "default_media_type": 0,  # Video
+    "default_output_path": os.path.expanduser("~/Downloads"),
+    "sponsorblock": 0,  # None
+    "embed_metadata": True,
+    "embed_thumbnail": True,
+    "max_concurrent_downloads": 3,
+    "max_per_host": 0,  # No limit
+    "host_limits": {},  # Site -> concurrent downloads, overrides max_per_host
+    "bandwidth_limit_kib": 0,  # No limit
+    "concurrent_fragments": 1,  # Connections per download
+    "external_downloader": "",  # yt-dlp's own downloader
+    "engine": "subprocess",
+    "info_cache_ttl_hours": 24,
+    "info_cache_max_mb": 100,
+    "thumbnail_cache_max_mb": 50,
+    "download_archive": ARCHIVE_FILE,
+    "max_retries": 3,  # Automatic retries of downloads failing for network reasons
+    "min_free_space_mb": 1024,  # Downloads that would leave less free space wait
+    "auto_quality": False,  # Queued items get their format from format_rules
+    "format_rules": {"max_height": 0, "codecs": [], "max_size_mb": 0, "prefer_no_reencode": True},
+    "status_endpoint": "",  # Port, host:port or socket path, empty for none
+    "control_api": False  # Accept queue commands on the status endpoint
+}
+
+# External downloaders that split one file across connections, with the
+# arguments that make them do so; {n} is the number of connections
+EXTERNAL_DOWNLOADERS = {
+    "aria2c": "aria2c:-x {n} -s {n} -k 1M --summary-interval=1",
+}
+
+# Options a single queue item may set for itself, see settings_command
+ITEM_OPTIONS = {
+    "quality": str,
+    "media_type": str,
+    "output_format": str,
+    "output_path": str,
+    "cookie_file": str,
+    "sponsorblock": int,
+    "embed_metadata": bool,
+    "embed_thumbnail": bool,
+    "concurrent_fragments": int,
+    "external_downloader": str,
+}
+
+# Output lines kept per download to tell why it failed
+FAILURE_LINES = 50
+
+# Playlist entries are added to the queue in batches of this size,
+# or of whatever was found within PLAYLIST_BATCH_SECONDS
+PLAYLIST_BATCH_SIZE = 100
+PLAYLIST_BATCH_SECONDS = 0.5
+
+
+def read_settings(path=None):
+    """Return the saved settings merged over the defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path or SETTINGS_FILE, 'r') as f:
+            settings.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return settings
+
+
+def write_settings(settings, path=None):
+    """Save settings as JSON"""
+    path = path or SETTINGS_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(settings, f, indent=4)
+
+
+def build_download_command(url, quality="best", media_type="video", output_format="best",
+                           output_path=None, cookie_file=None, sponsorblock=0,
+                           embed_metadata=True, embed_thumbnail=True, archive_path=None,
+                           concurrent_fragments=1, external_downloader="", format_spec=None):
+    """Build the yt-dlp command for a URL, the URL is always the last argument
+
+    concurrent_fragments is the number of connections per download: DASH
+    and HLS fragments fetched at once, or the segments an external
+    downloader splits a file into. The external downloader is only used
+    when it is installed. format_spec is a complete yt-dlp format
+    selection, such as format rules make, used instead of quality for
+    video and audio.
+    """
+    cmd = ['yt-dlp']
+
+    if media_type == 'audio':
+        cmd.extend(['-x', '--audio-format', output_format])
+        if format_spec:
+            cmd.extend(['-f', format_spec])
+    else:
+        if not format_spec:
+            format_spec = f'{quality}+bestaudio/{quality}' if quality not in ['best', 'worst'] else quality
+        cmd.extend(['-f', format_spec])
+        if output_format != 'best':
+            cmd.extend(['--merge-output-format', output_format])
+
+    cmd.extend([
+        '-o', os.path.join(output_path or os.path.expanduser("~/Downloads"), '%(title)s.%(ext)s'),
+        '--newline',  # Get progress updates per line
+        '--continue',  # Resume from .part files and fragments already on disk
+    ])
+
+    if cookie_file:
+        cmd.extend(['--cookies', cookie_file])
+
+    if concurrent_fragments > 1:
+        cmd.extend(['--concurrent-fragments', str(concurrent_fragments)])
+    if downloader_available(external_downloader):
+        cmd.extend([
+            '--downloader', external_downloader,
+            '--downloader-args', EXTERNAL_DOWNLOADERS[external_downloader].format(n=max(concurrent_fragments, 1)),
+        ])
+
+    # yt-dlp records finished downloads in the archive and skips listed ones
+    if archive_path:
+        cmd.extend(['--download-archive', archive_path])
+
+    if SPONSORBLOCK_CATEGORIES[sponsorblock]:
+        cmd.extend(['--sponsorblock-remove', SPONSORBLOCK_CATEGORIES[sponsorblock]])
+
+    if embed_metadata:
+        cmd.append('--embed-metadata')
+    if embed_thumbnail and media_type == 'video':
+        cmd.append('--embed-thumbnail')
+
+    cmd.append(url)
+    return cmd
+
+
+def settings_command(url, settings, **options):
+    """Build the download command for a URL from GRAB settings
+
+    options are build_download_command arguments that replace what the
+    settings say. A quality of 'auto', or none with auto_quality set,
+    downloads the format the saved format rules pick.
+    """
+    arguments = dict(
+        media_type=MEDIA_TYPES[settings["default_media_type"]].lower(),
+        output_format=OUTPUT_FORMATS[settings["default_format"]],
+        output_path=settings["default_output_path"],
+        sponsorblock=settings["sponsorblock"],
+        embed_metadata=settings["embed_metadata"],
+        embed_thumbnail=settings["embed_thumbnail"],
+        archive_path=settings["download_archive"] or None,
+        concurrent_fragments=settings["concurrent_fragments"],
+        external_downloader=settings["external_downloader"],
+    )
+    arguments.update(options)
+    quality = arguments.pop('quality', None)
+    if quality == 'auto' or (quality is None and settings["auto_quality"]):
+        rules = FormatRules.from_dict(settings["format_rules"])
+        arguments['format_spec'] = rules.selector(arguments['media_type'], arguments['output_format'])
+    elif quality:
+        arguments['quality'] = quality
+    return build_download_command(url, **arguments)
+
+
+def check_item_options(options):
+    """Raise ValueError unless options are valid ITEM_OPTIONS values"""
+    for name, value in options.items():
+        kind = ITEM_OPTIONS.get(name)
+        if kind is None:
+            raise ValueError(f"unknown option {name!r}")
+        # bool is an int, but not the other way round
+        if type(value) is not kind:
+            raise ValueError(f"{name} must be a {kind.__name__}")
+
+    if options.get("media_type", "video") not in [media_type.lower() for media_type in MEDIA_TYPES]:
+        raise ValueError("media_type must be 'video' or 'audio'")
+    if options.get("output_format", "best") not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if not 0 <= options.get("sponsorblock", 0) < len(SPONSORBLOCK_CATEGORIES):
+        raise ValueError(f"sponsorblock must be 0 to {len(SPONSORBLOCK_CATEGORIES) - 1}")
+    if not 1 <= options.get("concurrent_fragments", 1) <= 16:
+        raise ValueError("concurrent_fragments must be 1 to 16")
+    if options.get("external_downloader", "") not in [""] + list(EXTERNAL_DOWNLOADERS):
+        raise ValueError(f"unknown external_downloader {options['external_downloader']!r}")
+
+
+def downloader_available(name):
+    """Whether an external downloader is known to GRAB and installed"""
+    return name in EXTERNAL_DOWNLOADERS and shutil.which(name) is not None
+
+
+def pick_thumbnail_url(info):
+    """Pick a thumbnail URL, preferring formats GdkPixbuf can always decode"""
+    url = info.get('thumbnail')
+    if url and not url.split('?')[0].endswith('.webp'):
+        return url
+
+    for thumbnail in reversed(info.get('thumbnails') or []):
+        candidate = thumbnail.get('url') or ""
+        if candidate.split('?')[0].endswith(('.jpg', '.jpeg', '.png')):
+            return candidate
+    return url
+
+
+class DownloadSlot:
+    """One running download with its own process, progress and queue row"""
+    def __init__(self, item_id, url, cmd):
+        self.item_id = item_id  # QueueStore item this slot is downloading
+        self.url = url
+        self.cmd = cmd
+        self.process = None
+        self.progress = 0.0
+        self.bytes_done = 0
+        self.speed = None  # Bytes per second and seconds left, from the last progress
+        self.eta = None
+        self.bytes_saved_at = 0.0
+        self.rate_limit = None  # Bytes per second from the bandwidth budget
+        self.rate_live = False  # Whether the engine applies rate_limit changes while running
+        self.download_name = ""
+        self.stopped = False  # Stopped by the user
+        self.paused = False  # Interrupted to be resumed later
+        self.singled_out = False  # Paused or stopped by itself, the rest of the queue goes on
+        self.private = False  # Started in incognito mode, forgotten when finished
+        self.log = None  # JobLog with the full output of this download
+        self.metrics = None  # JobMetrics of the last run
+        self.attempt = 1  # Failure number of this run should it fail, see RetryPolicy.delay
+        self.failure = None  # Failure category of the last run, see grab_retry
+        self.postprocess_cmd = None  # Run on the post-processing pool after cmd, see split_stages
+        self.info_file = None
+        self.output_dir = output_directory(cmd)
+        self.size_factor = size_factor(cmd)  # Disk space needed per byte of media
+        self.expected_bytes = None  # Size of the media, estimated or from the first progress
+        self.no_space = False  # Interrupted because it does not fit on the disk
+
+    def split_stages(self):
+        """Move the post-processing options of cmd into postprocess_cmd"""
+        info_file = info_file_path(self.item_id)
+        self.cmd, self.postprocess_cmd = split_command(self.cmd, info_file)
+        if self.postprocess_cmd:
+            self.info_file = info_file
+
+    @property
+    def cancelled(self):
+        """Whether the engine should stop this download"""
+        return self.stopped or self.paused
+
+    @property
+    def label(self):
+        """Short name shown next to log lines"""
+        return f"#{self.item_id}"
+
+
+class PlaylistExpansion:
+    """A playlist being listed into queue items, one per entry"""
+    def __init__(self, url, cmd, start=False):
+        self.url = url
+        self.cmd = cmd  # Template command, the URL is replaced per entry
+        self.start = start  # Start downloading entries as they are found
+        self.process = None
+        self.stopped = False
+        self.private = False
+        self.found = 0
+        self.skipped = 0  # Entries already in the download archive
+
+    @property
+    def cancelled(self):
+        """Whether the engine should stop listing"""
+        return self.stopped
+
+    def entry_command(self, url):
+        """Return the download command for one entry"""
+        return self.cmd[:-1] + ['--no-playlist', url]
+
+
+def run_download(engine, slot, on_line, on_progress, on_destination):
+    """Run a slot's command with an engine and return (success, message)
+
+    The timings and throughput of the run are collected in slot.metrics,
+    and why it failed in slot.failure. A slot with a postprocess_cmd
+    still needs run_postprocess after a successful download. Progress
+    dicts get 'media_bytes', the size of all files so far.
+    """
+    metrics = slot.metrics = JobMetrics(slot.url)
+    media_size = MediaSize()
+
+    def progress_received(progress):
+        metrics.on_progress(progress)
+        progress['media_bytes'] = media_size.on_progress(progress)
+        on_progress(progress)
+
+    def destination_received(filename):
+        metrics.on_destination(filename)
+        media_size.on_destination()
+        on_destination(filename)
+
+    with span("download", url=slot.url):
+        return run_stage(engine, slot, slot.cmd, on_line, progress_received, destination_received)
+
+
+def run_postprocess(engine, slot, on_line):
+    """Run a slot's postprocess_cmd after its download, return (success, message)
+
+    A slot paused or stopped while it waited for the pool does not run.
+    The info JSON of the download stage is removed afterwards.
+    """
+    slot.metrics.start_postprocess()
+    try:
+        with span("postprocess", url=slot.url):
+            return run_stage(engine, slot, slot.postprocess_cmd, on_line)
+    finally:
+        remove_info_file(slot.info_file)
+
+
+def run_stage(engine, slot, cmd, on_line, on_progress=None, on_destination=None):
+    """Run one command of a slot, return (success, message) and set slot.failure"""
+    metrics = slot.metrics
+    recent = deque(maxlen=FAILURE_LINES)
+    slot.failure = None
+
+    def line_received(line):
+        metrics.on_line(line)
+        recent.append(line)
+        on_line(line)
+
+    def ignore(value):
+        pass
+
+    return_code = None
+    if not slot.cancelled:
+        try:
+            return_code = engine.download(cmd, slot, line_received, on_progress or ignore, on_destination or ignore)
+        except Exception as e:
+            metrics.finish(False)
+            slot.failure = classify_failure(None, [str(e)])
+            return False, f"Error: {str(e)}"
+    metrics.finish(return_code == 0)
+
+    # A stage that ended well before an interrupt reached it is done
+    if return_code == 0:
+        return True, "Download completed successfully"
+    if slot.stopped:
+        return False, "Download stopped"
+    if slot.no_space:
+        return False, "Waiting for disk space"
+    if slot.paused:
+        return False, "Download paused"
+
+    slot.failure = classify_failure(return_code, list(recent))
+    errors = error_lines(recent)
+    if errors:
+        return False, f"{FAILURE_LABELS[slot.failure]}: {errors[-1]}"
+    return False, f"Download failed with code {return_code}"
+
+
+def finished_state(slot, success, paused):
+    """Return the queue state of a finished slot; paused is the queue's pause state
+
+    A successful run is completed even when it was stopped or paused
+    while it ended, otherwise it would be downloaded again.
+    """
+    if success:
+        return COMPLETED
+    if slot.stopped:
+        return STOPPED
+    if slot.no_space:
+        # Started again once there is room
+        return QUEUED
+    if slot.paused:
+        # Paused items wait for Resume, unless it was pressed already
+        return PAUSED if paused or slot.singled_out else QUEUED
+    return FAILED
+
+
+def expand_playlist(engine, expansion, store, on_items, is_archived, cookie_file=None):
+    """List a playlist into the queue store, return an error message or None
+
+    Entries are saved in batches and on_items is called with the new
+    QueueItems of every batch, from the calling thread. Entries for which
+    is_archived(key) is true are counted in expansion.skipped instead.
+    """
+    batch = []
+    flushed_at = [time.time()]
+
+    def flush():
+        items = store.add_many(batch, private=expansion.private)
+        batch.clear()
+        flushed_at[0] = time.time()
+        on_items(items)
+
+    def on_entry(entry):
+        url = entry_url(entry)
+        if not url:
+            return
+        key = archive_key(entry)
+        if is_archived(key):
+            expansion.skipped += 1
+            return
+        options = {"cmd": expansion.entry_command(url), "title": entry.get("title"), "archive_key": key}
+        entry_thumbnail = pick_thumbnail_url(entry)
+        if entry_thumbnail:
+            options["thumbnail"] = entry_thumbnail
+        batch.append((url, options))
+        if len(batch) >= PLAYLIST_BATCH_SIZE or time.time() - flushed_at[0] >= PLAYLIST_BATCH_SECONDS:
+            flush()
+
+    error = None
+    try:
+        engine.expand(expansion.url, expansion, on_entry, cookie_file)
+    except EngineError as e:
+        error = str(e)
+    except Exception as e:
+        error = f"Error listing playlist: {str(e)}"
+
+    if batch:
+        flush()
+    return error
+
+
+class QueueRunner:
+    """Run the download queue on worker threads and report to a stream
+
+    Uses the same queue journal, settings and download archive as the
+    GUI. run() returns once no item is queued and no playlist is being
+    listed.
+    """
+    def __init__(self, settings, store=None, quality=None, cookie_file=None, out=None, log_dir=None,
+                 metrics=None):
+        self.settings = settings
+        self.store = store or QueueStore()
+        self.engine = get_engine(settings["engine"])
+        self.archive = DownloadArchive(settings["download_archive"]) if settings["download_archive"] else None
+        self.quality = quality  # None for what the settings say
+        self.cookie_file = cookie_file
+        self.out = out or sys.stdout
+        self.log_dir = log_dir  # Directory of the job logs, default LOG_DIR
+        self.metrics = metrics or MetricsStore()
+        self.condition = threading.Condition()
+        self.output_lock = threading.Lock()
+        self.active = []  # DownloadSlot for every running download
+        self.postprocessing = []  # DownloadSlots downloaded and waiting for or in post-processing
+        self.postprocess = PostprocessPool()
+        self.expansions = []
+        self.stopping = False
+        self.failed = 0
+        self.running = 0  # Worker threads still running
+        self.host_limits = HostLimits(settings["max_per_host"], settings["host_limits"])
+        self.bandwidth = BandwidthBudget(settings["bandwidth_limit_kib"] * 1024)
+        self.disk = DiskSpace(settings["min_free_space_mb"] * 1024 * 1024)
+        self.waiting_for_space = False
+        self.status = QueueStatus(self.store, lambda: list(self.active), lambda: list(self.expansions),
+                                  lambda: self.stopping, lambda: list(self.postprocessing))
+        self.control = QueueControl(self.store, self.control_command, self.is_archived, self.control_changed)
+        self.keep_running = False  # Wait for new items once the queue is empty
+        self.retry = RetryPolicy(settings["max_retries"])
+
+    def report(self, text):
+        """Print one status line"""
+        with self.output_lock:
+            print(text, file=self.out, flush=True)
+
+    def is_archived(self, key):
+        return self.archive is not None and key is not None and key in self.archive
+
+    def build_command(self, url):
+        """Build the download command for a URL from the settings"""
+        return settings_command(
+            url, self.settings,
+            quality=self.quality,
+            cookie_file=self.cookie_file,
+            archive_path=self.archive.path if self.archive else None
+        )
+
+    def control_command(self, url, options):
+        """Build the download command of a control API item"""
+        check_item_options(options)
+        return settings_command(url, self.settings, **{
+            'quality': self.quality,
+            'cookie_file': self.cookie_file,
+            'archive_path': self.archive.path if self.archive else None,
+            **options
+        })
+
+    def control_changed(self, action, data):
+        """Apply a queue change made through the control API"""
+        if action == 'added':
+            items, playlists, start, front = data
+            if items:
+                self.report(f"{len(items)} item(s) queued through the control API")
+            for url, cmd in playlists:
+                self.expand(url, cmd)
+        elif action in ('cancel', 'pause'):
+            with self.condition:
+                for slot in self.active + self.postprocessing:
+                    if slot.item_id not in data:
+                        continue
+                    slot.singled_out = True
+                    if action == 'cancel':
+                        slot.stopped = True
+                    else:
+                        slot.paused = True
+                    self.engine.interrupt(slot)
+        with self.condition:
+            self.condition.notify_all()
+
+    def add(self, url):
+        """Queue a URL, listing playlists in the background"""
+        cmd = self.build_command(url)
+        if looks_like_playlist(url):
+            self.expand(url, cmd)
+            return
+
+        key = url_archive_key(url)
+        if self.is_archived(key):
+            self.report(f"Already downloaded, skipping: {url}")
+            return
+        self.store.add(url, {"cmd": cmd, "archive_key": key})
+
+    def expand(self, url, cmd):
+        """List a playlist in the background, its entries start as they are found"""
+        expansion = PlaylistExpansion(url, cmd, start=True)
+        with self.condition:
+            self.expansions.append(expansion)
+        thread = threading.Thread(target=self.expand_thread, args=(expansion,))
+        thread.daemon = True
+        thread.start()
+
+    def expand_thread(self, expansion):
+        """List a playlist and wake the workers for every batch"""
+        def on_items(items):
+            expansion.found += len(items)
+            with self.condition:
+                self.condition.notify_all()
+
+        self.report(f"Listing playlist: {expansion.url}")
+        error = expand_playlist(self.engine, expansion, self.store, on_items, self.is_archived, self.cookie_file)
+        if error:
+            self.report(error)
+        else:
+            self.report(f"Listed {expansion.found} entries, skipped {expansion.skipped} already downloaded: "
+                        f"{expansion.url}")
+
+        with self.condition:
+            self.expansions.remove(expansion)
+            self.condition.notify_all()
+
+    def next_slot(self):
+        """Claim the next queued item, waiting while playlists are listed
+
+        Returns None once there is nothing left to download.
+        """
+        with self.condition:
+            while not self.stopping:
+                active_ids = {slot.item_id for slot in self.active}
+                busy_hosts = self.host_limits.saturated(slot.url for slot in self.active)
+                disk_check = self.disk.check(self.active + self.postprocessing)
+                held = []
+
+                def accept(item):
+                    missing = disk_check.missing(item.cmd, item.options.get("expected_bytes"))
+                    if missing:
+                        held.append((item, missing))
+                        return False
+                    return True
+
+                item = self.store.next_queued(exclude=active_ids, accept=accept, skip_hosts=busy_hosts)
+                if held and not self.waiting_for_space:
+                    held_item, missing = held[0]
+                    self.report(f"#{held_item.id} Waiting for disk space in {output_directory(held_item.cmd)}, "
+                                f"{format_size(missing)} more needed")
+                self.waiting_for_space = bool(held)
+                if item is not None:
+                    if self.is_archived(item.options.get("archive_key")):
+                        self.store.set_state(item.id, COMPLETED)
+                        continue
+                    self.store.mark_started(item.id)
+                    slot = DownloadSlot(item.id, item.url, item.cmd)
+                    slot.split_stages()
+                    slot.expected_bytes = item.options.get("expected_bytes")
+                    slot.attempt = item.failures + 1
+                    slot.rate_live = self.engine.live_rate_limit
+                    self.active.append(slot)
+                    self.rebalance()
+                    return slot
+                # Items of busy sites wait for one of their downloads to finish,
+                # post-processing may still fail and schedule a retry, and
+                # items too large for the disk wait for space
+                if not (self.expansions or self.keep_running or self.active and self.store.count(QUEUED)
+                        or self.postprocessing or self.store.pending_retries()[0] or held):
+                    return None
+                self.condition.wait(1)
+        return None
+
+    def rebalance(self):
+        """Split the bandwidth budget across the running downloads"""
+        for slot, rate in self.bandwidth.shares(self.active).items():
+            slot.rate_limit = rate
+
+    def worker(self):
+        """Download queued items until the queue is empty"""
+        try:
+            while True:
+                slot = self.next_slot()
+                if slot is None:
+                    return
+                self.download(slot)
+        finally:
+            with self.condition:
+                self.running -= 1
+
+    def download(self, slot):
+        """Run one slot and save its outcome"""
+        slot.log = JobLog(slot.url, directory=self.log_dir)
+        reported_at = [0.0]
+        self.report(f"{slot.label} Downloading {slot.url}")
+
+        def on_progress(progress):
+            slot.progress = progress['fraction']
+            slot.speed = progress.get('speed')
+            slot.eta = progress.get('eta')
+            if progress.get('downloaded_bytes'):
+                slot.bytes_done = progress['downloaded_bytes']
+            if self.disk.learn(slot, progress):
+                self.store.set_option(slot.item_id, "expected_bytes", slot.expected_bytes)
+                with self.condition:
+                    fits = self.disk.still_fits(slot, self.active + self.postprocessing)
+                if not fits:
+                    self.report(f"{slot.label} Not enough disk space for {format_size(slot.expected_bytes)}, "
+                                f"waiting for space")
+                    slot.no_space = True
+                    slot.paused = True
+                    self.engine.interrupt(slot)
+            now = time.time()
+            if now - reported_at[0] >= 2:
+                reported_at[0] = now
+                self.report(f"{slot.label} {slot.progress * 100:5.1f}% {os.path.basename(slot.download_name)}")
+
+        def on_destination(filename):
+            slot.download_name = filename
+
+        success, message = run_download(self.engine, slot, slot.log.write, on_progress, on_destination)
+        if success and slot.postprocess_cmd:
+            # The next download starts while this one is post-processed
+            with self.condition:
+                self.active.remove(slot)
+                self.postprocessing.append(slot)
+                self.rebalance()
+                self.condition.notify_all()
+            self.report(f"{slot.label} Downloaded, post-processing")
+            self.postprocess.submit(self.postprocess_slot, slot)
+            return
+        self.finish(slot, success, message)
+
+    def postprocess_slot(self, slot):
+        """Run the post-processing stage of a downloaded slot, on a pool thread"""
+        success, message = run_postprocess(self.engine, slot, slot.log.write)
+        self.finish(slot, success, message)
+
+    def finish(self, slot, success, message):
+        """Save the outcome of a slot"""
+        slot.log.close()
+        state = finished_state(slot, success, True)
+        if slot.bytes_done:
+            self.store.set_bytes_done(slot.item_id, slot.bytes_done)
+        delay = self.retry.delay(slot.failure, slot.attempt) if state == FAILED else None
+        if delay is not None:
+            self.store.schedule_retry(slot.item_id, time.time() + delay, message, slot.failure)
+            message += f", retry {slot.attempt} in {format_duration(delay)}"
+            state = QUEUED
+        else:
+            self.store.set_state(slot.item_id, state, None if success else message, slot.failure)
+        if state == FAILED:
+            self.failed += 1
+        self.status.job_finished(slot, state, retrying=delay is not None)
+        if success and self.archive:
+            self.archive.refresh()
+        self.metrics.record(slot.metrics)
+
+        aggregate = slot.metrics.aggregate()
+        if success and average_speed(aggregate):
+            message += f" ({format_size(aggregate['bytes'])} at {format_size(average_speed(aggregate))}/s)"
+        self.report(f"{slot.label} {message}")
+
+        with self.condition:
+            if slot in self.active:
+                self.active.remove(slot)
+                self.rebalance()
+            else:
+                self.postprocessing.remove(slot)
+            self.condition.notify_all()
+
+    def stop(self):
+        """Interrupt every download so it resumes on the next run"""
+        with self.condition:
+            self.stopping = True
+            for slot in self.active + self.postprocessing:
+                slot.paused = True
+                self.engine.interrupt(slot)
+            for expansion in self.expansions:
+                expansion.stopped = True
+                self.engine.interrupt(expansion)
+            self.condition.notify_all()
+
+    def run(self, workers):
+        """Download until the queue is empty, return the exit status"""
+        # Items interrupted by the GUI or an earlier run continue now
+        self.store.recover()
+        self.store.move_state(PAUSED, QUEUED)
+        pending = self.store.count(QUEUED)
+        if pending:
+            self.report(f"{pending} item(s) queued")
+
+        self.running = max(1, workers)
+        self.bandwidth.slots = self.running
+        for _ in range(self.running):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+
+        # Polled with sleep, an interrupted Thread.join() may return early
+        try:
+            while self.running:
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            self.report("Interrupted, unfinished downloads resume on the next run")
+            self.stop()
+            while self.running or self.postprocessing:
+                time.sleep(0.2)
+            return 130
+        return 1 if self.failed else 0
+
+
+def read_url_list(path):
+    """Return the URLs of a batch file, '-' reads standard input"""
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+    # Comment lines as in yt-dlp batch files
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith(('#', ';', ']'))]
+
+
+def main(argv=None):
+    """Entry point of grab --headless"""
+    parser = argparse.ArgumentParser(
+        prog="grab --headless",
+        description="Download URLs with the GRAB queue and settings, without the GUI."
+    )
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("urls", nargs="*", metavar="URL", help="video, playlist or channel URLs to queue")
+    parser.add_argument("-a", "--batch-file", action="append", default=[], metavar="FILE",
+                        help="file with one URL per line, '-' for standard input")
+    parser.add_argument("-j", "--jobs", type=int, help="concurrent downloads (default: from the settings)")
+    parser.add_argument("-f", "--quality",
+                        help="yt-dlp format, or 'auto' for the format rules of the settings "
+                             "(default: auto when the settings turn it on, else best)")
+    parser.add_argument("--cookies", metavar="FILE", help="Netscape cookie file")
+    parser.add_argument("-N", "--concurrent-fragments", type=int, metavar="N",
+                        help="connections per download (default: from the settings)")
+    parser.add_argument("--downloader", choices=[""] + sorted(EXTERNAL_DOWNLOADERS),
+                        help="external downloader, '' for yt-dlp's own (default: from the settings)")
+    parser.add_argument("--retries", type=int, metavar="N",
+                        help="retries of downloads failing for network reasons (default: from the settings)")
+    parser.add_argument("--min-free-space", type=int, metavar="MB",
+                        help="free space downloads must leave on the disk (default: from the settings)")
+    parser.add_argument("--status", metavar="ADDRESS",
+                        help="serve the queue status on a port, host:port or socket path (default: from the settings)")
+    parser.add_argument("--control", action="store_true",
+                        help="accept queue commands on the status endpoint (default: from the settings)")
+    parser.add_argument("--wait", action="store_true",
+                        help="keep running when the queue is empty, for items added through the control API")
+    parser.add_argument("--settings", default=SETTINGS_FILE, metavar="FILE", help="GRAB settings file")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    try:
+        for path in args.batch_file:
+            urls.extend(read_url_list(path))
+    except OSError as e:
+        parser.error(f"cannot read batch file: {e}")
+
+    settings = read_settings(args.settings)
+    if args.concurrent_fragments:
+        settings["concurrent_fragments"] = args.concurrent_fragments
+    if args.downloader is not None:
+        settings["external_downloader"] = args.downloader
+    if args.retries is not None:
+        settings["max_retries"] = args.retries
+    if args.min_free_space is not None:
+        settings["min_free_space_mb"] = args.min_free_space
+    if args.status is not None:
+        settings["status_endpoint"] = args.status
+    if args.control:
+        settings["control_api"] = True
+    if settings["control_api"] and not settings["status_endpoint"]:
+        parser.error("the control API needs a status endpoint (--status)")
+    runner = QueueRunner(settings, quality=args.quality, cookie_file=args.cookies)
+    runner.keep_running = args.wait
+
+    status_server = None
+    if settings["status_endpoint"]:
+        status_server = StatusServer(runner.status, settings["status_endpoint"],
+                                     runner.control if settings["control_api"] else None)
+        try:
+            status_server.start()
+        except (OSError, ValueError) as e:
+            runner.store.close()
+            parser.error(f"cannot start the status endpoint: {e}")
+        runner.report(f"Status at {status_server.url}")
+        if status_server.control and not status_server.socket_path:
+            runner.report(f"Control token in {TOKEN_FILE}")
+
+    try:
+        for url in urls:
+            runner.add(url)
+        return runner.run(args.jobs or settings["max_concurrent_downloads"])
+    finally:
+        if status_server:
+            status_server.stop()
+        runner.store.close()
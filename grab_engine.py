@@ -0,0 +1,481 @@
+"""yt-dlp engines used by GRAB to extract media information and download.
+
+The subprocess engine runs the yt-dlp command for every action. The library
+engine drives yt_dlp.YoutubeDL inside the GRAB process, so Python startup,
+extractor imports and plugin loading are paid only once per session.
+"""
+
+import json
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import threading
+import urllib.request
+from urllib.parse import parse_qs, urlsplit
+
+from grab_trace import span
+
+try:
+    import yt_dlp
+    from yt_dlp.utils import DownloadCancelled, DownloadError
+except ImportError:
+    yt_dlp = None
+
+
+class EngineError(Exception):
+    """Raised when yt-dlp fails to extract information"""
+
+
+SIZE_UNITS = {
+    'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+    'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4,
+}
+
+
+def parse_size(text):
+    """Convert a yt-dlp size such as '10.50MiB' to bytes, or None"""
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            try:
+                return float(text[:-len(unit)]) * SIZE_UNITS[unit]
+            except ValueError:
+                return None
+    return None
+
+
+def parse_duration(text):
+    """Convert a yt-dlp ETA such as '01:02:03' or an aria2c one such as '4m51s' to seconds, or None"""
+    try:
+        if ':' in text:
+            seconds = 0
+            for part in text.split(':'):
+                seconds = seconds * 60 + int(part)
+            return seconds
+        match = re.fullmatch(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?', text)
+        if match and text:
+            hours, minutes, seconds = (int(group or 0) for group in match.groups())
+            return hours * 3600 + minutes * 60 + seconds
+    except ValueError:
+        pass
+    return None
+
+
+# Progress summary aria2c prints while it downloads for yt-dlp, such as
+# [#2089b0 400.0KiB/33.2MiB(1%) CN:4 DL:1.2MiB ETA:27s]
+ARIA2C_PROGRESS = re.compile(r'\[#\w+ (\S+?)/(\S+?)\((\d+)%\)([^\]]*)\]')
+
+# Fragment counter at the end of yt-dlp progress lines of DASH and HLS downloads
+FRAGMENT_PROGRESS = re.compile(r'\(frag (\d+)/(\d+)\)')
+
+
+def parse_progress(line):
+    """Return a progress dict from a yt-dlp or aria2c progress line, or None
+
+    The dict has the download 'fraction' and, when the line shows them,
+    'total_bytes' and 'downloaded_bytes', 'speed' in bytes per second,
+    'eta' in seconds, and 'fragment_index' and 'fragment_count'.
+    Fragmented downloads show the size estimated from the fragments done
+    so far.
+    """
+    match = ARIA2C_PROGRESS.search(line)
+    if match:
+        downloaded, total = parse_size(match.group(1)), parse_size(match.group(2))
+        if total and downloaded is not None:
+            progress = {'fraction': min(downloaded / total, 1.0), 'downloaded_bytes': downloaded, 'total_bytes': total}
+        else:
+            progress = {'fraction': int(match.group(3)) / 100.0}
+        for field in match.group(4).split():
+            name, _, value = field.partition(':')
+            if name == 'DL' and parse_size(value) is not None:
+                progress['speed'] = parse_size(value)
+            elif name == 'ETA' and parse_duration(value) is not None:
+                progress['eta'] = parse_duration(value)
+        return progress
+
+    if '[download]' not in line or '%' not in line:
+        return None
+    try:
+        percent_str = line.split('%')[0].split()[-1]
+        progress = {'fraction': float(percent_str) / 100.0}
+    except (ValueError, IndexError):
+        return None
+
+    parts = line.split()
+    if 'of' in parts:
+        size_index = parts.index('of') + 1
+        if size_index < len(parts) and parts[size_index] == '~':
+            size_index += 1
+        total = parse_size(parts[size_index]) if size_index < len(parts) else None
+        if total:
+            progress['total_bytes'] = total
+            progress['downloaded_bytes'] = total * progress['fraction']
+    if 'at' in parts:
+        speed_index = parts.index('at') + 1
+        if speed_index < len(parts) and parts[speed_index].endswith('/s'):
+            speed = parse_size(parts[speed_index][:-2])
+            if speed is not None:
+                progress['speed'] = speed
+    if 'ETA' in parts and parts.index('ETA') + 1 < len(parts):
+        eta = parse_duration(parts[parts.index('ETA') + 1])
+        if eta is not None:
+            progress['eta'] = eta
+
+    match = FRAGMENT_PROGRESS.search(line)
+    if match:
+        progress['fragment_index'] = int(match.group(1))
+        progress['fragment_count'] = int(match.group(2))
+    return progress
+
+
+# URL path parts of playlist, channel and album pages
+PLAYLIST_PATH_PARTS = ('/playlist', '/channel/', '/c/', '/user/', '/@', '/videos', '/streams', '/sets/', '/album/')
+
+
+def looks_like_playlist(url):
+    """Guess from the URL alone whether it points to several media"""
+    parts = urlsplit(url if '://' in url else 'https://' + url)
+    if 'list' in parse_qs(parts.query):
+        return True
+    # Single posts on sites with /@user profile pages
+    if '/video/' in parts.path or '/status/' in parts.path:
+        return False
+    return any(part in parts.path for part in PLAYLIST_PATH_PARTS)
+
+
+def entry_url(entry):
+    """Return the URL a playlist entry can be downloaded from, or None"""
+    for key in ('webpage_url', 'url', 'original_url'):
+        value = entry.get(key)
+        if value and '://' in value:
+            return value
+    return None
+
+
+def parse_destination(line):
+    """Return the file name from a yt-dlp 'Destination:' line, or None"""
+    if 'Destination:' not in line:
+        return None
+    return line.split('Destination:')[1].strip() or None
+
+
+class SubprocessEngine:
+    """Run a new yt-dlp process for every action"""
+    name = "subprocess"
+    live_rate_limit = False  # --limit-rate is fixed once yt-dlp runs
+
+    def extract_info(self, url, cookie_file=None):
+        """Return the info dict for a URL"""
+        cmd = ['yt-dlp', '--dump-json', '--no-warnings', url]
+        if cookie_file:
+            cmd.extend(['--cookies', cookie_file])
+
+        with span("engine.extract_info", engine=self.name):
+            stdout = self._run(cmd, "Error fetching media info")
+        try:
+            return json.loads(stdout)
+        except json.JSONDecodeError:
+            raise EngineError("Failed to parse media information")
+
+    def fetch_thumbnail(self, thumbnail_url):
+        """Return the image bytes of a thumbnail"""
+        request = urllib.request.Request(thumbnail_url, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+
+    def expand(self, url, control, on_entry, cookie_file=None):
+        """Pass every entry of a playlist to on_entry as it is listed
+
+        Entries come from flat extraction, so each one only has the data
+        shown in the listing. A URL of a single video yields its full info
+        dict. Returns the number of entries; control works as in download().
+        """
+        cmd = ['yt-dlp', '--flat-playlist', '--lazy-playlist', '--dump-json', '--no-warnings', url]
+        if cookie_file:
+            cmd.extend(['--cookies', cookie_file])
+
+        # Errors go to a file, a full stderr pipe would block the listing
+        with tempfile.TemporaryFile(mode='w+') as stderr, span("engine.expand", engine=self.name):
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                universal_newlines=True,
+                bufsize=1
+            )
+            control.process = process
+
+            count = 0
+            for line in iter(process.stdout.readline, ''):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                on_entry(entry)
+                count += 1
+
+            process.stdout.close()
+            process.wait()
+            if process.returncode != 0 and count == 0 and not control.cancelled:
+                stderr.seek(0)
+                raise EngineError(f"Error expanding playlist: {stderr.read()}")
+        return count
+
+    def download(self, cmd, control, on_line, on_progress, on_destination):
+        """Run a download command and return its exit code
+
+        control.process is set to the running process so interrupt() can
+        reach it. Output is read until yt-dlp exits, including the lines
+        it prints while shutting down after an interrupt. A rate_limit set
+        on control before the start is passed as --limit-rate.
+        """
+        if control.rate_limit:
+            # The URL stays the last argument
+            cmd = cmd[:-1] + ['--limit-rate', str(int(control.rate_limit)), cmd[-1]]
+
+        with span("engine.spawn", engine=self.name):
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1
+            )
+        control.process = process
+
+        # Read output line by line
+        for line in iter(process.stdout.readline, ''):
+            with span("engine.handle_line"):
+                on_line(line)
+
+                progress = parse_progress(line)
+                if progress is not None:
+                    on_progress(progress)
+
+                destination = parse_destination(line)
+                if destination:
+                    on_destination(destination)
+
+        process.stdout.close()
+        return process.wait()
+
+    def interrupt(self, control, grace=10):
+        """Ask a running download to stop, keeping its partial files
+
+        yt-dlp gets SIGINT so it can stop ffmpeg and leave .part files
+        and fragment state behind for --continue. It is killed if it has
+        not exited after grace seconds.
+        """
+        process = control.process
+        if process is None or process.poll() is not None:
+            return
+
+        if os.name == 'posix':
+            process.send_signal(signal.SIGINT)
+        else:
+            process.terminate()
+
+        def kill_if_running():
+            if process.poll() is None:
+                process.kill()
+
+        timer = threading.Timer(grace, kill_if_running)
+        timer.daemon = True
+        timer.start()
+
+    def _run(self, cmd, error_prefix):
+        """Run a command and return its output"""
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        stdout, stderr = process.communicate()
+        if process.returncode != 0:
+            raise EngineError(f"{error_prefix}: {stderr}")
+        return stdout
+
+
+class _LineLogger:
+    """yt-dlp logger that forwards every message as an output line"""
+    def __init__(self, on_line):
+        self.on_line = on_line
+
+    def debug(self, message):
+        self.on_line(message + "\n")
+
+    def info(self, message):
+        self.on_line(message + "\n")
+
+    def warning(self, message):
+        self.on_line(f"WARNING: {message}\n")
+
+    def error(self, message):
+        self.on_line(message + "\n")
+
+
+class _QuietLogger:
+    """yt-dlp logger that drops every message, errors arrive as exceptions"""
+    def debug(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+class LibraryEngine:
+    """Drive yt_dlp.YoutubeDL in-process, with progress from hooks"""
+    name = "library"
+    live_rate_limit = True  # The progress hook applies control.rate_limit
+
+    @staticmethod
+    def available():
+        """Whether the yt_dlp module can be imported"""
+        return yt_dlp is not None
+
+    def extract_info(self, url, cookie_file=None):
+        """Return the info dict for a URL"""
+        params = {'quiet': True, 'no_warnings': True, 'logger': _QuietLogger()}
+        if cookie_file:
+            params['cookiefile'] = cookie_file
+
+        try:
+            with span("engine.extract_info", engine=self.name), yt_dlp.YoutubeDL(params) as ydl:
+                info = ydl.extract_info(url, download=False)
+                return ydl.sanitize_info(info)
+        except DownloadError as e:
+            raise EngineError(f"Error fetching media info: {e}")
+
+    def fetch_thumbnail(self, thumbnail_url):
+        """Return the image bytes of a thumbnail"""
+        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            return ydl.urlopen(thumbnail_url).read()
+
+    def expand(self, url, control, on_entry, cookie_file=None):
+        """Pass every entry of a playlist to on_entry as it is listed
+
+        The entries of a lazy playlist are generated page by page, so the
+        first ones arrive before the listing is complete. Returns the
+        number of entries and stops early once control.cancelled is set.
+        """
+        params = {
+            'quiet': True,
+            'no_warnings': True,
+            'logger': _QuietLogger(),
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+        }
+        if cookie_file:
+            params['cookiefile'] = cookie_file
+
+        count = 0
+        try:
+            with span("engine.expand", engine=self.name), yt_dlp.YoutubeDL(params) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+                # Channel pages first resolve to one of their tabs
+                if info.get('_type') == 'url':
+                    info = ydl.extract_info(info['url'], download=False, process=False)
+
+                if info.get('_type') not in ('playlist', 'multi_video'):
+                    on_entry(ydl.sanitize_info(info))
+                    return 1
+
+                for entry in info.get('entries') or []:
+                    if control.cancelled:
+                        break
+                    if entry:
+                        on_entry(ydl.sanitize_info(entry))
+                        count += 1
+        except DownloadError as e:
+            if count == 0:
+                raise EngineError(f"Error expanding playlist: {e}")
+        return count
+
+    def download(self, cmd, control, on_line, on_progress, on_destination):
+        """Run a download command in-process and return its exit code
+
+        The yt-dlp command line is parsed into YoutubeDL options, so both
+        engines accept the same commands. Once control.cancelled is set
+        the next progress hook aborts the download, leaving the .part file
+        for a later resume. Changes to control.rate_limit take effect at
+        the next progress hook. A command with --load-info-json runs on
+        that file instead of URLs.
+        """
+        try:
+            parsed = yt_dlp.parse_options(cmd[1:])
+        except SystemExit as e:
+            on_line(f"Invalid yt-dlp options: {e}\n")
+            return 2
+
+        destination = [None]
+
+        def progress_hook(status):
+            if control.cancelled:
+                raise DownloadCancelled("Download interrupted")
+            ydl.params['ratelimit'] = control.rate_limit
+
+            filename = status.get('filename')
+            if filename and filename != destination[0]:
+                destination[0] = filename
+                on_destination(filename)
+
+            if status.get('status') == 'downloading':
+                total = status.get('total_bytes') or status.get('total_bytes_estimate')
+                if total:
+                    downloaded = status.get('downloaded_bytes', 0)
+                    progress = {
+                        'fraction': min(downloaded / total, 1.0),
+                        'downloaded_bytes': downloaded,
+                        'total_bytes': total,
+                    }
+                    for key in ('speed', 'eta', 'fragment_index', 'fragment_count'):
+                        if status.get(key) is not None:
+                            progress[key] = status[key]
+                    on_progress(progress)
+
+        def postprocessor_hook(status):
+            # Post-processors can only be stopped between each other
+            if control.cancelled:
+                raise DownloadCancelled("Post-processing interrupted")
+
+        params = dict(parsed.ydl_opts)
+        params['logger'] = _LineLogger(on_line)
+        params['progress_hooks'] = [progress_hook]
+        params['postprocessor_hooks'] = [postprocessor_hook]
+        params['noprogress'] = True
+        params['ratelimit'] = control.rate_limit
+
+        try:
+            with yt_dlp.YoutubeDL(params) as ydl:
+                if parsed.options.load_info_filename:
+                    return ydl.download_with_info_file(os.path.expanduser(parsed.options.load_info_filename))
+                return ydl.download(parsed.urls)
+        except DownloadCancelled:
+            return 1
+        except DownloadError:
+            # The error has already been reported through the logger
+            return 1
+
+    def interrupt(self, control, grace=10):
+        """Nothing to signal, the progress and post-processor hooks check control.cancelled"""
+
+
+ENGINES = {
+    SubprocessEngine.name: SubprocessEngine,
+    LibraryEngine.name: LibraryEngine,
+}
+
+
+def get_engine(name):
+    """Return the named engine, falling back to the subprocess engine"""
+    if name == LibraryEngine.name and LibraryEngine.available():
+        return LibraryEngine()
+    return SubprocessEngine()
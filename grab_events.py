@@ -0,0 +1,148 @@
+"""Typed event bus from worker threads to the UI thread.
+
+Workers never touch widgets or UI state. They post events, and the UI
+thread dispatches whatever has piled up at most once per frame, handing
+every run of events of one type to its handler at once.
+"""
+
+import threading
+import traceback
+from collections import namedtuple
+
+
+class Progress(namedtuple('Progress', 'job progress')):
+    """Newest progress dict of a job, older ones are dropped"""
+    __slots__ = ()
+    coalesce = True
+
+
+class Destination(namedtuple('Destination', 'job filename')):
+    """File a job writes to, older ones are dropped"""
+    __slots__ = ()
+    coalesce = True
+
+
+class LogLine(namedtuple('LogLine', 'job line')):
+    """One line of a job's output"""
+    __slots__ = ()
+    coalesce = False
+
+
+class JobFinished(namedtuple('JobFinished', 'job success message')):
+    """A job's worker has returned"""
+    __slots__ = ()
+    coalesce = False
+
+
+class PostprocessQueued(namedtuple('PostprocessQueued', 'job')):
+    """A job has downloaded and waits for the post-processing pool"""
+    __slots__ = ()
+    coalesce = False
+
+
+class PlaylistEntries(namedtuple('PlaylistEntries', 'expansion items')):
+    """Queue items saved for newly listed playlist entries"""
+    __slots__ = ()
+    coalesce = False
+
+
+class PlaylistDone(namedtuple('PlaylistDone', 'expansion error')):
+    """A playlist listing has ended, error is a message or None"""
+    __slots__ = ()
+    coalesce = False
+
+
+class Notice(namedtuple('Notice', 'text error')):
+    """Message for the user"""
+    __slots__ = ()
+    coalesce = False
+
+
+class QueueChange(namedtuple('QueueChange', 'action data')):
+    """Queue journal change made through the control API, see QueueControl"""
+    __slots__ = ()
+    coalesce = False
+
+
+class Call(namedtuple('Call', 'func args')):
+    """Result of a one-off background task, applied as func(*args)"""
+    __slots__ = ()
+    coalesce = False
+
+
+class EventBus:
+    """Collect worker events and dispatch them on the UI thread in batches
+
+    post() may be called from any thread. Events whose type has coalesce
+    set replace the pending event of the same type for the same job,
+    the others are kept in order. The first post after a dispatch calls
+    wakeup(), which should arrange for dispatch() to run on the UI
+    thread; posts until then are dispatched together.
+
+    Coalesced events are dispatched before the ordered ones, so a job's
+    last progress is applied before its JobFinished.
+    """
+    def __init__(self, wakeup=None):
+        self.lock = threading.Lock()
+        self.wakeup = wakeup
+        self.handlers = {}  # Event type -> handler(events)
+        self.latest = {}  # (event type, job) -> newest event
+        self.queue = []
+        self.scheduled = False
+        self.received = 0
+        self.dispatched = 0
+
+    def subscribe(self, event_type, handler):
+        """Call handler(events) on the UI thread with runs of events of a type"""
+        self.handlers[event_type] = handler
+
+    def post(self, event):
+        """Queue an event, from any thread"""
+        with self.lock:
+            self.received += 1
+            if event.coalesce:
+                self.latest[(type(event), event[0])] = event
+            else:
+                self.queue.append(event)
+            wake = not self.scheduled
+            self.scheduled = True
+        if wake and self.wakeup is not None:
+            self.wakeup()
+
+    def drain(self):
+        """Return and forget the pending events, coalesced ones first"""
+        with self.lock:
+            events = list(self.latest.values()) + self.queue
+            self.latest = {}
+            self.queue = []
+            self.scheduled = False
+            self.dispatched += len(events)
+        return events
+
+    def dispatch(self):
+        """Hand the pending events to their handlers, return how many there were"""
+        events = self.drain()
+        run = []
+        for event in events:
+            if run and type(event) is not type(run[0]):
+                self.deliver(run)
+                run = []
+            run.append(event)
+        if run:
+            self.deliver(run)
+        return len(events)
+
+    def deliver(self, events):
+        handler = self.handlers.get(type(events[0]))
+        if handler is None:
+            return
+        try:
+            handler(events)
+        except Exception:
+            # One failing handler must not drop the rest of the batch
+            traceback.print_exc()
+
+    def pending(self):
+        """Whether anything is waiting to be dispatched"""
+        with self.lock:
+            return bool(self.latest or self.queue)
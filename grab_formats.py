@@ -0,0 +1,243 @@
+"""Formats of an info dict as a model, and quality picked by saved rules.
+
+yt-dlp describes every format of a video in its info dict. MediaFormat
+keeps what GRAB reasons about: resolution, frame rate, codecs, bitrate
+and size. FormatRules rank these for a download: a largest height, the
+codecs preferred in order, a size cap, and whether to prefer codecs the
+output format holds without converting them.
+
+With the info at hand the rules pick a format locally, otherwise they
+are written as a yt-dlp format selection, so queued items get their
+format chosen when yt-dlp extracts them.
+"""
+
+from grab_scheduler import format_bytes
+
+# Codec families and how yt-dlp's codec strings start for them
+VIDEO_CODECS = {
+    'av1': ('av01', 'av1'),
+    'vp9': ('vp09', 'vp9'),
+    'hevc': ('hev1', 'hvc1', 'h265', 'hevc'),
+    'h264': ('avc1', 'avc3', 'h264'),
+}
+AUDIO_CODECS = {
+    'opus': ('opus',),
+    'aac': ('mp4a', 'aac'),
+    'vorbis': ('vorbis',),
+    'mp3': ('mp3',),
+    'flac': ('flac',),
+}
+
+# Codecs an output format takes as they are; the others are converted,
+# or, with --merge-output-format, end up in a container that plays them
+# poorly. Output formats not listed take anything.
+OUTPUT_CODECS = {
+    'mp4': ('h264', 'hevc', 'av1', 'aac', 'mp3'),
+    'webm': ('vp9', 'av1', 'opus', 'vorbis'),
+    'm4a': ('aac',),
+    'mp3': ('mp3',),
+    'flac': ('flac',),
+}
+
+
+def codec_family(codec, families):
+    """Return the family of a yt-dlp codec string, the string itself when unknown, or None"""
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for family, prefixes in families.items():
+        if codec.startswith(prefixes):
+            return family
+    return codec.split('.')[0]
+
+
+class MediaFormat:
+    """One format of an info dict
+
+    has_video and has_audio count unknown codecs as present, like yt-dlp
+    does for formats that do not tell.
+    """
+    def __init__(self, fmt, duration=None):
+        self.format_id = fmt.get('format_id')
+        self.ext = fmt.get('ext') or "unknown"
+        self.width = fmt.get('width')
+        self.height = fmt.get('height')
+        self.fps = fmt.get('fps')
+        self.vcodec = fmt.get('vcodec')
+        self.acodec = fmt.get('acodec')
+        self.video_codec = codec_family(self.vcodec, VIDEO_CODECS)
+        self.audio_codec = codec_family(self.acodec, AUDIO_CODECS)
+        self.tbr = fmt.get('tbr')  # kbit/s
+        self.abr = fmt.get('abr')
+        self.size = format_bytes(fmt, duration)
+        self.resolution = fmt.get('resolution')
+        self.note = fmt.get('format_note')
+
+    @property
+    def has_video(self):
+        return self.vcodec != 'none'
+
+    @property
+    def has_audio(self):
+        return self.acodec != 'none'
+
+    def codecs(self):
+        """Return the codec families of the format"""
+        return [codec for codec in (self.video_codec, self.audio_codec) if codec]
+
+    def label(self):
+        """Describe the format for the quality combo, the format id first"""
+        if not self.has_video:
+            resolution = "audio only"
+        elif self.width and self.height:
+            resolution = f"{self.width}x{self.height}"
+        else:
+            resolution = self.resolution or "unknown"
+        if self.has_video and self.fps:
+            resolution += f" {self.fps:g}fps"
+
+        parts = [self.format_id, resolution, self.ext]
+        codecs = "+".join(self.codecs())
+        if codecs:
+            parts.append(codecs)
+        if self.tbr:
+            parts.append(f"{self.tbr:.0f}k")
+        if self.size:
+            parts.append(f"{self.size / (1024 * 1024):.2f}MiB")
+        return " - ".join(parts)
+
+
+def media_formats(info):
+    """Return a MediaFormat for every format of an info dict with video or audio"""
+    formats = []
+    for fmt in info.get('formats') or []:
+        media_format = MediaFormat(fmt, info.get('duration'))
+        # Storyboards and the like have neither
+        if media_format.format_id and (media_format.has_video or media_format.has_audio):
+            formats.append(media_format)
+    return formats
+
+
+class FormatRules:
+    """Saved preferences that pick the format of a download
+
+    max_height and max_size_mb of 0 mean no limit. codecs lists codec
+    families (see VIDEO_CODECS and AUDIO_CODECS) from most to least
+    preferred, unlisted ones come last. prefer_no_reencode puts formats
+    whose codecs the output format holds as they are (OUTPUT_CODECS)
+    ahead of the others. Among formats alike in all that, the highest
+    wins.
+    """
+    FIELDS = ('max_height', 'codecs', 'max_size_mb', 'prefer_no_reencode')
+
+    def __init__(self, max_height=0, codecs=(), max_size_mb=0, prefer_no_reencode=True):
+        self.max_height = max_height
+        self.codecs = [codec.strip().lower() for codec in codecs if codec.strip()]
+        self.max_size_mb = max_size_mb
+        self.prefer_no_reencode = prefer_no_reencode
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build rules from their settings, ignoring unknown keys"""
+        return cls(**{name: value for name, value in (values or {}).items() if name in cls.FIELDS})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def codec_rank(self, codec):
+        """Return the place of a codec family in the preference, lower is better"""
+        return self.codecs.index(codec) if codec in self.codecs else len(self.codecs)
+
+    def choose(self, formats, media_type="video", output_format="best"):
+        """Return the MediaFormats to download together, best by the rules, or []"""
+        wanted = OUTPUT_CODECS.get(output_format)
+
+        def keeps(fmt):
+            return not self.prefer_no_reencode or not wanted or all(codec in wanted for codec in fmt.codecs())
+
+        audio = [fmt for fmt in formats if fmt.has_audio and not fmt.has_video]
+        best_audio = max(audio, default=None,
+                         key=lambda fmt: (keeps(fmt), -self.codec_rank(fmt.audio_codec), fmt.abr or fmt.tbr or 0))
+
+        if media_type == 'audio':
+            candidates = [[fmt] for fmt in audio] or [[fmt] for fmt in formats if fmt.has_audio]
+        else:
+            candidates = [
+                [fmt] if fmt.has_audio or best_audio is None else [fmt, best_audio]
+                for fmt in formats if fmt.has_video
+            ]
+        if not candidates:
+            return []
+
+        max_size = self.max_size_mb * 1024 * 1024
+
+        def rank(candidate):
+            main = candidate[0]
+            sizes = [fmt.size for fmt in candidate]
+            size = sum(sizes) if all(sizes) else None
+            # Unknown sizes pass, too large ones lose to all that fit and
+            # then to smaller ones
+            fits_size = not max_size or size is None or size <= max_size
+            height = main.height or 0
+            fits_height = not self.max_height or height <= self.max_height
+            return (
+                fits_size,
+                0 if fits_size else -size,
+                fits_height,
+                all(keeps(fmt) for fmt in candidate),
+                -self.codec_rank(main.video_codec if main.has_video else main.audio_codec),
+                height if fits_height else -height,
+                main.fps or 0,
+                sum(fmt.tbr or fmt.abr or 0 for fmt in candidate),
+            )
+
+        return max(candidates, key=rank)
+
+    def format_spec(self, formats, media_type="video", output_format="best"):
+        """Return the -f value of the formats the rules pick, or None"""
+        chosen = self.choose(formats, media_type, output_format)
+        return "+".join(fmt.format_id for fmt in chosen) or None
+
+    def selector(self, media_type="video", output_format="best"):
+        """Return a yt-dlp format selection following the rules
+
+        For downloads whose formats are not known yet. The size cap holds
+        for each format on its own, formats of unknown size pass. Among
+        formats alike by the rules, yt-dlp's own order decides.
+        """
+        wanted = OUTPUT_CODECS.get(output_format) if self.prefer_no_reencode else None
+        size = f"[filesize<?{self.max_size_mb}M][filesize_approx<?{self.max_size_mb}M]" if self.max_size_mb else ""
+
+        def codec_filter(field, families, codecs):
+            prefixes = [prefix for codec in codecs for prefix in families.get(codec, (codec,))]
+            return f"[{field}~='^({'|'.join(prefixes)})']"
+
+        audio_codecs = [codec for codec in self.codecs if codec in AUDIO_CODECS]
+        if wanted:
+            audio_codecs = [codec for codec in audio_codecs if codec in wanted] or \
+                [codec for codec in AUDIO_CODECS if codec in wanted]
+        audio = [f"ba{codec_filter('acodec', AUDIO_CODECS, audio_codecs)}{size}"] if audio_codecs else []
+        audio.append(f"ba{size}")
+
+        if media_type == 'audio':
+            return "/".join(audio + ["b"])
+
+        height = f"[height<=?{self.max_height}]" if self.max_height else ""
+        # Codecs kept as they are first, each preferred one on its own and
+        # then the rest together, so yt-dlp picks the best among those
+        preferred = [codec for codec in self.codecs if codec in VIDEO_CODECS]
+        groups = [[codec] for codec in preferred if not wanted or codec in wanted]
+        if wanted:
+            rest = [codec for codec in VIDEO_CODECS if codec in wanted and codec not in preferred]
+            if rest:
+                groups.append(rest)
+            groups.extend([codec] for codec in preferred if codec not in wanted)
+        video = [f"bv*{height}{codec_filter('vcodec', VIDEO_CODECS, codecs)}{size}" for codecs in groups]
+        video.append(f"bv*{height}{size}")
+
+        choices = [f"{v}+{a}" for v in video for a in audio]
+        choices.append(f"b{height}{size}")
+        if height or size:
+            # Better the smallest format than none at all
+            choices.append("wv*+ba/w")
+        return "/".join(choices)
@@ -0,0 +1,94 @@
+"""Bulk URL import: check and deduplicate URLs from files, the clipboard or drops."""
+
+from urllib.parse import unquote, urlsplit
+
+from grab_cache import canonical_url
+
+# Comment lines as in yt-dlp batch files
+COMMENT_PREFIXES = ('#', ';', ']')
+
+
+def clean_url(text):
+    """Return text as an http(s) URL, or None when it is not one"""
+    text = text.strip().strip('<>"\'')
+    if '://' not in text:
+        # Bare links such as youtube.com/watch?v=... as yt-dlp accepts them
+        if '.' not in text.split('/')[0]:
+            return None
+        text = 'https://' + text
+
+    try:
+        parts = urlsplit(text)
+        host = parts.hostname
+    except ValueError:
+        return None
+    if parts.scheme not in ('http', 'https') or not host or '.' not in host and host != 'localhost':
+        return None
+    return text
+
+
+def text_words(text):
+    """Yield the words of imported text that may be URLs, skipping comment lines"""
+    for line in text.splitlines():
+        if line.lstrip().startswith(COMMENT_PREFIXES):
+            continue
+        yield from line.split()
+
+
+def dropped_files(uris):
+    """Split dropped URIs into local file paths and other URIs"""
+    paths, others = [], []
+    for uri in uris:
+        if uri.startswith('file://'):
+            paths.append(unquote(urlsplit(uri).path))
+        else:
+            others.append(uri)
+    return paths, others
+
+
+class UrlImport:
+    """URLs found in imported text, with counts of what was left out
+
+    Text is split into whitespace-separated words, skipping comment
+    lines. A URL is left out when it is not an http(s) link, when an
+    equivalent link (see canonical_url) was seen before or is in known,
+    or when is_archived says it was downloaded already.
+    """
+    def __init__(self, known=(), is_archived=None):
+        self.seen = set(known)  # Canonical URLs
+        self.is_archived = is_archived
+        self.urls = []
+        self.invalid = 0
+        self.duplicates = 0
+        self.archived = 0
+
+    def add_text(self, text):
+        for word in text_words(text):
+            self.add(word)
+
+    def add(self, text):
+        url = clean_url(text)
+        if url is None:
+            self.invalid += 1
+            return
+        key = canonical_url(url)
+        if key in self.seen:
+            self.duplicates += 1
+            return
+        self.seen.add(key)
+        if self.is_archived is not None and self.is_archived(url):
+            self.archived += 1
+            return
+        self.urls.append(url)
+
+    def summary(self):
+        """Describe the outcome in one line"""
+        skipped = [f"{count} {reason}" for count, reason in (
+            (self.duplicates, "duplicate(s)"),
+            (self.archived, "already downloaded"),
+            (self.invalid, "invalid"),
+        ) if count]
+        text = f"Imported {len(self.urls)} URL(s)"
+        if skipped:
+            text += ", skipped " + ", ".join(skipped)
+        return text
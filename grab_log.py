@@ -0,0 +1,83 @@
+"""Per-download log files so the in-memory log view can stay small."""
+
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+
+LOG_DIR = os.path.expanduser("~/.grab/logs")
+
+
+class JobLog:
+    """Append-only log file holding every output line of one download
+
+    Private logs (incognito mode) go to the temp directory with the
+    grab_ prefix, so Clear Cache removes them.
+    """
+    def __init__(self, name, directory=None, private=False):
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:60] or "download"
+        if private:
+            fd, self.path = tempfile.mkstemp(prefix=f"grab_log_{safe_name}_", suffix=".log")
+        else:
+            directory = directory or LOG_DIR
+            os.makedirs(directory, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            fd, self.path = tempfile.mkstemp(prefix=f"{stamp}-{safe_name}-", suffix=".log", dir=directory)
+        self.file = os.fdopen(fd, 'w', encoding='utf-8', buffering=1)
+
+    def write(self, line):
+        """Append one output line"""
+        if self.file:
+            self.file.write(line if line.endswith("\n") else line + "\n")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def search_logs(paths, text, limit=1000):
+    """Return up to limit (path, line) pairs containing text, case-insensitive"""
+    needle = text.lower()
+    matches = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if needle in line.lower():
+                        matches.append((path, line.rstrip("\n")))
+                        if len(matches) >= limit:
+                            return matches
+        except OSError:
+            continue
+    return matches
+
+
+def export_logs(paths, destination):
+    """Concatenate log files into destination, each under a header line"""
+    with open(destination, 'w', encoding='utf-8') as out:
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    out.write(f"===== {os.path.basename(path)} =====\n")
+                    for line in f:
+                        out.write(line)
+            except OSError:
+                continue
+
+
+def prune_logs(directory=None, max_age_days=14):
+    """Delete log files older than max_age_days"""
+    directory = directory or LOG_DIR
+    if not os.path.isdir(directory):
+        return
+
+    cutoff = time.time() - max_age_days * 24 * 3600
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".log") and os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,235 @@
+"""Per-download metrics and their hourly history per site."""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from grab_scheduler import host_key
+
+METRICS_FILE = os.path.expanduser("~/.grab/metrics.jsonl")
+
+# Output of yt-dlp post-processors starts with one of these tags
+POSTPROCESSOR_TAGS = (
+    '[Merger]', '[ExtractAudio]', '[VideoConvertor]', '[VideoRemuxer]', '[EmbedThumbnail]',
+    '[EmbedSubtitle]', '[Metadata]', '[SponsorBlock]', '[ModifyChapters]', '[SplitChapters]',
+    '[ThumbnailsConvertor]', '[FixupM3u8]', '[FixupM4a]', '[FixupStretched]', '[FixupDuplicateMoov]',
+    '[FixupTimestamp]', '[FixupDuration]', '[MoveFiles]', '[Exec]',
+)
+
+# Fields of an aggregate; 'peak' is a maximum, the others are sums
+FIELDS = (
+    'jobs', 'failed', 'bytes', 'seconds', 'peak',
+    'first_byte', 'first_byte_jobs', 'extract', 'extract_jobs', 'postprocess', 'postprocess_jobs',
+)
+
+
+def format_size(size):
+    """Format a byte count as yt-dlp does, such as '10.50MiB'"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024:
+            return f"{size:.2f}{unit}" if unit != 'B' else f"{size:.0f}B"
+        size /= 1024
+    return f"{size:.2f}TiB"
+
+
+def format_duration(seconds):
+    """Format seconds as M:SS or H:MM:SS"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def merge(total, aggregate):
+    """Add an aggregate into total in place and return total"""
+    for field in FIELDS:
+        if field == 'peak':
+            total['peak'] = max(total.get('peak', 0), aggregate.get('peak', 0))
+        else:
+            total[field] = total.get(field, 0) + aggregate.get(field, 0)
+    return total
+
+
+def average(aggregate, field):
+    """Return the mean of a timed field over the jobs that have it, or None"""
+    jobs = aggregate.get(field + '_jobs', 0)
+    return aggregate[field] / jobs if jobs else None
+
+
+def average_speed(aggregate):
+    """Return bytes per second over the time spent transferring, or None"""
+    return aggregate['bytes'] / aggregate['seconds'] if aggregate.get('seconds') else None
+
+
+class JobMetrics:
+    """Timings and throughput of one download
+
+    Fed from the worker thread with the download's output and progress.
+    Durations are measured from the start of the job: extraction ends
+    when yt-dlp names the first file it writes, the first byte arrives
+    with the first progress that shows data, and post-processing starts
+    with the first post-processor message. Post-processing run as a
+    stage of its own is timed from start_postprocess, without the wait
+    for the post-processing pool.
+    """
+    def __init__(self, url):
+        self.host = host_key(url)
+        self.started_at = time.time()
+        self.start = time.monotonic()
+        self.download_start = None
+        self.first_byte = None
+        self.last_progress = None
+        self.postprocess_start = None
+        self.end = None
+        self.success = False
+        self.peak_speed = 0.0
+        self.bytes = 0  # Of the finished files of the job
+        self.file_base = None  # Bytes already on disk when the current file started
+        self.file_bytes = 0
+
+    def on_line(self, line):
+        if (self.postprocess_start is None and self.download_start is not None
+                and line.lstrip().startswith(POSTPROCESSOR_TAGS)):
+            self.postprocess_start = time.monotonic()
+
+    def on_destination(self, filename):
+        if self.download_start is None:
+            self.download_start = time.monotonic()
+        # Video and audio of a merged format are downloaded one after the other
+        self.bytes += self.file_bytes
+        self.file_base = None
+        self.file_bytes = 0
+
+    def on_progress(self, progress):
+        now = time.monotonic()
+        self.last_progress = now
+        downloaded = progress.get('downloaded_bytes') or 0
+        if self.file_base is None:
+            # A resumed download counts from what was on disk already
+            self.file_base = downloaded
+        self.file_bytes = max(downloaded - self.file_base, 0)
+        if self.first_byte is None and downloaded > 0:
+            self.first_byte = now
+        self.peak_speed = max(self.peak_speed, progress.get('speed') or 0)
+
+    def start_postprocess(self):
+        """Time the post-processing stage from now, on top of what the download did"""
+        done = 0.0
+        if self.postprocess_start is not None and self.end is not None:
+            done = self.end - self.postprocess_start
+        self.postprocess_start = time.monotonic() - done
+
+    def finish(self, success):
+        self.end = time.monotonic()
+        self.success = success
+        self.bytes += self.file_bytes
+        self.file_bytes = 0
+
+    def aggregate(self):
+        """Return this job as an aggregate of one job"""
+        aggregate = dict.fromkeys(FIELDS, 0)
+        aggregate['jobs'] = 1
+        aggregate['failed'] = 0 if self.success else 1
+        aggregate['bytes'] = self.bytes
+        aggregate['peak'] = self.peak_speed
+        if self.download_start is not None and self.last_progress is not None:
+            aggregate['seconds'] = max(self.last_progress - self.download_start, 0)
+        for field, moment in (('first_byte', self.first_byte), ('extract', self.download_start)):
+            if moment is not None:
+                aggregate[field] = moment - self.start
+                aggregate[field + '_jobs'] = 1
+        if self.postprocess_start is not None and self.end is not None:
+            aggregate['postprocess'] = self.end - self.postprocess_start
+            aggregate['postprocess_jobs'] = 1
+        return aggregate
+
+
+class MetricsStore:
+    """Hourly per-site aggregates of job metrics in an append-only file
+
+    Every finished job appends one JSON line holding its hour, site and
+    an aggregate of that one job. Lines of the same hour and site are
+    merged when the file is read, and once merging would shrink it to
+    less than half, the file is rewritten with one line per hour and
+    site, dropping hours older than keep_days. The file therefore grows
+    with the number of hours and sites, not with the number of jobs.
+    """
+    def __init__(self, path=None, keep_days=90):
+        self.path = path or METRICS_FILE
+        self.keep_days = keep_days
+        self.lock = threading.Lock()
+
+    def record(self, metrics):
+        """Append the aggregate of a finished job"""
+        aggregate = {field: round(value, 3) for field, value in metrics.aggregate().items()}
+        line = json.dumps({
+            'hour': int(metrics.started_at // 3600 * 3600),
+            'host': metrics.host,
+            **aggregate,
+        }, separators=(',', ':'))
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"Error saving download metrics: {e}")
+
+    def load(self):
+        """Return {(hour, site): aggregate}, compacting the file when worthwhile"""
+        with self.lock:
+            aggregates = {}
+            lines = 0
+            try:
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            key = (entry.pop('hour'), entry.pop('host'))
+                        except (ValueError, KeyError, AttributeError):
+                            continue
+                        lines += 1
+                        merge(aggregates.setdefault(key, {}), entry)
+            except OSError:
+                return {}
+
+            cutoff = time.time() - self.keep_days * 86400
+            kept = {key: value for key, value in aggregates.items() if key[0] >= cutoff}
+            if lines > 2 * len(kept):
+                self.rewrite(kept)
+            return kept
+
+    def rewrite(self, aggregates):
+        directory = os.path.dirname(self.path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for (hour, host), aggregate in sorted(aggregates.items()):
+                    f.write(json.dumps({'hour': hour, 'host': host, **aggregate}, separators=(',', ':')) + "\n")
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+    def summary(self, since):
+        """Return (total, [(hour, aggregate)], [(site, aggregate)]) for hours from since
+
+        Hours are in order and sites by bytes downloaded, most first.
+        """
+        total = {}
+        hours = {}
+        sites = {}
+        for (hour, host), aggregate in self.load().items():
+            if hour < since - 3599:
+                continue
+            merge(total, aggregate)
+            merge(hours.setdefault(hour, {}), aggregate)
+            merge(sites.setdefault(host, {}), aggregate)
+        return (
+            total,
+            sorted(hours.items()),
+            sorted(sites.items(), key=lambda item: item[1]['bytes'], reverse=True),
+        )
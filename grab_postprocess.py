@@ -0,0 +1,120 @@
+"""Post-processing stage of downloads, run on a worker pool of its own.
+
+Extracting audio, cutting SponsorBlock segments and embedding metadata
+and thumbnails keep ffmpeg busy after the network is done. A download
+command is split in two: the download stage saves the media and its
+info JSON, then yt-dlp runs again on that JSON with the post-processing
+options. The media is on disk by then, so the second run only fetches
+what the post-processors need, such as the thumbnail, and converts.
+
+The download slot is free for the next download once the first stage
+ends; the second waits for a thread of the pool, one per CPU core.
+"""
+
+import os
+import queue
+import threading
+import traceback
+
+POSTPROCESS_DIR = os.path.expanduser("~/.grab/postprocess")
+
+# Options acting after the download, with whether they take a value
+POSTPROCESS_OPTIONS = {
+    '-x': False,
+    '--extract-audio': False,
+    '--audio-format': True,
+    '--audio-quality': True,
+    '--sponsorblock-remove': True,
+    '--embed-metadata': False,
+    '--embed-thumbnail': False,
+}
+
+# yt-dlp names info JSON files after the template with this suffix
+INFO_SUFFIX = ".info.json"
+
+
+def info_file_path(item_id):
+    """Return where the download stage of a queue item saves its info JSON"""
+    return os.path.join(POSTPROCESS_DIR, f"{item_id}{INFO_SUFFIX}")
+
+
+def split_command(cmd, info_file):
+    """Split a download command into a download and a post-processing command
+
+    Returns (download command, post-processing command), or (cmd, None)
+    when cmd has none of the POSTPROCESS_OPTIONS. The download command
+    saves the info JSON to info_file and leaves out the download archive,
+    so yt-dlp only records the media once it is post-processed.
+    """
+    download = []
+    postprocess = False
+    args = iter(cmd[:-1])
+    for arg in args:
+        if arg in POSTPROCESS_OPTIONS:
+            postprocess = True
+            if POSTPROCESS_OPTIONS[arg]:
+                next(args, None)
+        elif arg == '--download-archive':
+            next(args, None)
+        else:
+            download.append(arg)
+    if not postprocess:
+        return cmd, None
+
+    options = cmd[:-1]
+    # What -x downloads when no format is given
+    if ('-x' in options or '--extract-audio' in options) and '-f' not in options:
+        download.extend(['-f', 'bestaudio/best'])
+    # yt-dlp merges webm into mkv when it embeds a thumbnail, both stages
+    # have to agree on the file name
+    if '--embed-thumbnail' in options and '--merge-output-format' not in options:
+        download.extend(['--merge-output-format', 'mp4/mkv'])
+        options = options + ['--merge-output-format', 'mp4/mkv']
+
+    template = info_file[:-len(INFO_SUFFIX)].replace('%', '%%')
+    download.extend(['--write-info-json', '-o', f'infojson:{template}', cmd[-1]])
+    # One argument, so the info file stays last like the URL
+    return download, options + [f'--load-info-json={info_file}']
+
+
+def remove_info_file(info_file):
+    """Delete the info JSON of a finished post-processing stage"""
+    if not info_file:
+        return
+    try:
+        os.unlink(info_file)
+    except OSError:
+        pass
+
+
+class PostprocessPool:
+    """Threads running post-processing work in the order it was submitted
+
+    At most workers run at once, by default one per CPU core. Threads
+    are started with the first submit.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.work = queue.Queue()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """Run func(*args) on a pool thread"""
+        with self.lock:
+            if not self.started:
+                self.started = True
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self.worker)
+                    thread.daemon = True
+                    thread.start()
+        self.work.put((func, args))
+
+    def worker(self):
+        while True:
+            func, args = self.work.get()
+            try:
+                func(*args)
+            except Exception:
+                # The other work goes on
+                traceback.print_exc()
@@ -0,0 +1,101 @@
+"""Failure classification of yt-dlp runs and the backoff of automatic retries."""
+
+import random
+
+# Failure categories
+NETWORK = "network"
+RATE_LIMITED = "rate_limited"
+AUTH = "auth"  # Login, cookies, geo or age restrictions
+UNAVAILABLE = "unavailable"
+DISK = "disk"  # Disk full, not writable or read-only
+POSTPROCESS = "postprocess"
+UNKNOWN = "unknown"
+
+FAILURE_LABELS = {
+    NETWORK: "Network error",
+    RATE_LIMITED: "Rate limited",
+    AUTH: "Login or region required",
+    UNAVAILABLE: "Unavailable",
+    DISK: "Disk full or not writable",
+    POSTPROCESS: "Post-processing failed",
+    UNKNOWN: "Failed",
+}
+
+# Failures that tend to go away by themselves
+RETRYABLE = (NETWORK, RATE_LIMITED)
+
+# Matched in order against yt-dlp's error lines in lower case, the
+# first category with a matching phrase wins. Errors that will not go
+# away by waiting come before the network patterns, so that "Unable to
+# download video data: HTTP Error 404" or "[Errno 28] No space left on
+# device" is not retried.
+FAILURE_PATTERNS = [
+    (RATE_LIMITED, ("http error 429", "too many requests", "rate limit", "rate-limit", "not a bot")),
+    # Before UNAVAILABLE, for "HTTP Error 503: Service Unavailable"
+    (NETWORK, ("http error 5",)),
+    (AUTH, ("sign in", "log in", "login", "--cookies", "private video", "video is private", "members-only",
+            "members only", "premium", "age-restricted", "age restricted", "confirm your age",
+            "in your country", "from your location", "geo restrict", "geo-restrict", "http error 401")),
+    (UNAVAILABLE, ("unavailable", "not available", "has been removed", "does not exist", "http error 404",
+                   "http error 410", "unsupported url", "no video formats", "copyright", "is not a valid url")),
+    (DISK, ("errno 28]", "no space left", "errno 13]", "permission denied", "errno 30]", "read-only file system",
+            "errno 122]", "disk quota")),
+    (POSTPROCESS, ("postprocessing", "ffmpeg", "ffprobe", "conversion failed")),
+    # Socket errnos: ECONNRESET, ECONNABORTED, ETIMEDOUT, ECONNREFUSED,
+    # ENETDOWN, ENETUNREACH, EHOSTUNREACH, EPIPE and the resolver's
+    # EAI_NONAME and EAI_AGAIN
+    (NETWORK, ("timed out", "timeout", "connection", "name resolution", "name or service", "network",
+               "unreachable", "remote end closed", "incompleteread", "incomplete read", "http error 403", "ssl",
+               "errno 104]", "errno 103]", "errno 110]", "errno 111]", "errno 100]", "errno 101]", "errno 113]",
+               "errno 32]", "errno -2]", "errno -3]", "giving up")),
+]
+
+# First retry after about this many seconds, doubling up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+# Rate limited sites get this many times the delay
+RATE_LIMIT_FACTOR = 4
+
+
+def error_lines(lines):
+    """Return the ERROR lines of yt-dlp output without their prefix"""
+    return [line.strip()[len("ERROR:"):].strip() for line in lines if line.lstrip().startswith("ERROR:")]
+
+
+def classify_failure(return_code, lines):
+    """Return the failure category of a failed run from its exit code and last output lines"""
+    if return_code == 2:
+        # yt-dlp rejected its options, running it again will not help
+        return UNKNOWN
+    text = "\n".join(error_lines(lines) or lines[-5:]).lower()
+    for category, phrases in FAILURE_PATTERNS:
+        if any(phrase in text for phrase in phrases):
+            return category
+    return UNKNOWN
+
+
+class RetryPolicy:
+    """When to run a failed download again
+
+    Retryable failures are tried again up to max_retries times. The delay
+    doubles with every attempt, from RETRY_BASE_DELAY up to
+    RETRY_MAX_DELAY, and is drawn between half and all of that so that
+    downloads failing together do not all come back at once.
+    """
+    def __init__(self, max_retries=3, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, failure, attempt):
+        """Return seconds until the next try after failed try number attempt, or None
+
+        attempt counts the failed runs of an item, this one included;
+        runs interrupted by pausing or for disk space do not count.
+        """
+        if failure not in RETRYABLE or attempt > self.max_retries:
+            return None
+        base = self.base_delay * (RATE_LIMIT_FACTOR if failure == RATE_LIMITED else 1)
+        delay = min(self.max_delay, base * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
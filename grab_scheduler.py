@@ -0,0 +1,284 @@
+"""Scheduling policy for the download queue: per-site slots, bandwidth and disk space."""
+
+import os
+import shutil
+from collections import Counter
+from urllib.parse import urlsplit
+
+from grab_cache import canonical_url
+from grab_postprocess import POSTPROCESS_OPTIONS
+
+# Lowest rate a download is given, so a share never rounds down to nothing
+MIN_RATE = 16 * 1024
+
+# Disk space a download needs per byte of media: .part files and
+# fragments take a little more than the finished file
+TEMP_OVERHEAD = 1.1
+
+# Merging or post-processing writes a new file before the old ones are
+# deleted, so the media is on disk twice for a while
+COPIES_WHILE_PROCESSING = 2
+
+
+def host_key(url):
+    """Return the site a URL belongs to, with short links mapped to their site"""
+    host = urlsplit(canonical_url(url)).netloc
+    return host.split(':')[0]
+
+
+class HostLimits:
+    """Limit how many downloads run at once per site
+
+    max_per_host applies to every site (0 means no limit) unless
+    overrides has an entry for the site, such as {"youtube.com": 1}.
+    """
+    def __init__(self, max_per_host=0, overrides=None):
+        self.max_per_host = max_per_host
+        self.overrides = overrides or {}
+
+    def limit(self, host):
+        """Return the slot limit of a site, 0 for no limit"""
+        return self.overrides.get(host, self.max_per_host)
+
+    def saturated(self, active_urls):
+        """Return the sites that use all their slots with the active downloads
+
+        Queued items of these sites wait, see QueueStore.next_queued.
+        """
+        running = Counter(host_key(url) for url in active_urls)
+        return {host for host, count in running.items() if 0 < self.limit(host) <= count}
+
+
+class BandwidthBudget:
+    """Split a global rate limit across the running downloads
+
+    Downloads whose rate can change while running get an equal share of
+    what is left, recomputed whenever a download starts or finishes.
+    A yt-dlp process keeps the rate it was started with, so it is given
+    the share it would have with every slot busy; the budget is then
+    never exceeded and is used fully while the queue keeps all slots busy.
+    """
+    def __init__(self, limit=0, slots=1):
+        self.limit = limit  # Bytes per second, 0 for no limit
+        self.slots = max(1, slots)
+
+    def fixed_rate(self):
+        """Return the rate for a download that cannot change it later"""
+        if not self.limit:
+            return None
+        return max(self.limit / self.slots, MIN_RATE)
+
+    def shares(self, controls):
+        """Return {control: rate} for the running downloads
+
+        Controls with rate_live set can change their rate while running,
+        the others keep their current rate_limit.
+        """
+        if not self.limit:
+            return {control: None for control in controls}
+
+        fixed = [control for control in controls if not control.rate_live]
+        adjustable = [control for control in controls if control.rate_live]
+        rates = {control: control.rate_limit or self.fixed_rate() for control in fixed}
+        if adjustable:
+            free = self.limit - sum(rates.values())
+            share = max(free / len(adjustable), MIN_RATE)
+            for control in adjustable:
+                rates[control] = share
+        return rates
+
+
+def format_bytes(fmt, duration=None):
+    """Return the size of one format of an info dict, or None
+
+    Without filesize or filesize_approx, the size follows from the
+    total bitrate and the duration.
+    """
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return size
+
+
+def best_audio(formats):
+    """Return the audio-only format with the highest bitrate, or None"""
+    audio = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    return max(audio, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0, default=None)
+
+
+def expected_size(info, format_spec=None):
+    """Estimate the bytes a download of an info dict writes, or None
+
+    format_spec is the -f value of the download command. Format ids as
+    GRAB builds them ('137+bestaudio/137', '137+140') are looked up in
+    the formats, 'bestaudio' is the best audio format. Anything else
+    counts as the formats yt-dlp selected when extracting.
+    """
+    formats = info.get('formats') or []
+    by_id = {fmt.get('format_id'): fmt for fmt in formats}
+    chosen = []
+    for part in (format_spec or '').split('/')[0].split('+'):
+        fmt = best_audio(formats) if part == 'bestaudio' else by_id.get(part)
+        if fmt is None:
+            chosen = []
+            break
+        chosen.append(fmt)
+    if not chosen:
+        chosen = info.get('requested_formats') or [info]
+
+    sizes = [format_bytes(fmt, info.get('duration')) for fmt in chosen]
+    if not all(sizes):
+        return None
+    return int(sum(sizes))
+
+
+def command_option(cmd, *names):
+    """Return the value of the first of names in a yt-dlp command, or None"""
+    for option, value in zip(cmd, cmd[1:]):
+        if option in names:
+            return value
+    return None
+
+
+def output_directory(cmd):
+    """Return the directory a yt-dlp command saves to"""
+    template = command_option(cmd, '-o', '--output') or ''
+    # Fields such as %(uploader)s may add directories below this one
+    return os.path.abspath(os.path.dirname(template.split('%(')[0]) or '.')
+
+
+def size_factor(cmd):
+    """Return the disk space a yt-dlp command needs per byte of media"""
+    merged = '+' in (command_option(cmd, '-f', '--format') or '')
+    processed = any(arg in POSTPROCESS_OPTIONS for arg in cmd)
+    return TEMP_OVERHEAD * (COPIES_WHILE_PROCESSING if merged or processed else 1)
+
+
+class MediaSize:
+    """Size of the media of a download, across the files yt-dlp writes in turn
+
+    Progress tells the size of the current file only. A merged download
+    fetches the video and then the audio, so the files done so far are
+    added when yt-dlp moves on to the next destination.
+    """
+    def __init__(self):
+        self.done = 0  # Bytes of the files before the current one
+        self.current = 0
+
+    def on_destination(self):
+        self.done += self.current
+        self.current = 0
+
+    def on_progress(self, progress):
+        """Return the bytes of all files so far, or None while unknown"""
+        if progress.get('total_bytes'):
+            self.current = int(progress['total_bytes'])
+        return self.done + self.current or None
+
+
+class DiskSpace:
+    """Hold downloads that would not fit on the disk they save to
+
+    Every running download reserves the disk space it is expected to
+    need, less what it has written so far. A download may start when
+    its own reservation, those of the running downloads on the same
+    filesystem and min_free together fit into the free space.
+
+    A download of unknown size reserves nothing, yet like any other it
+    waits while the disk has less than min_free free, since it could
+    only fill the disk further. Once its progress shows the size,
+    learn() and still_fits() decide whether it may go on.
+
+    Running downloads are DownloadSlots, with output_dir,
+    expected_bytes, size_factor and bytes_done. A pass over many queued
+    items uses one DiskCheck from check().
+    """
+    def __init__(self, min_free=0):
+        self.min_free = min_free  # Bytes left free on every disk
+
+    def usage(self, directory):
+        """Return (device, free bytes) of the filesystem of a directory, or None"""
+        # yt-dlp creates missing directories, their parent decides
+        path = directory
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        try:
+            return os.stat(path).st_dev, shutil.disk_usage(path).free
+        except OSError:
+            return None
+
+    def check(self, running):
+        """Return a DiskCheck for queued items to start next to the running downloads"""
+        return DiskCheck(self, running)
+
+    def missing(self, cmd, expected_bytes, running):
+        """Return the free space a download of cmd lacks to start next to the running ones, 0 when it may"""
+        return self.check(running).missing(cmd, expected_bytes)
+
+    def learn(self, slot, progress):
+        """Take the expected size of a slot from its progress, return whether it grew
+
+        progress['media_bytes'] is the size of all the files of the
+        download so far (see MediaSize); the first file of a merged
+        download is only its video. An estimate from the info stays
+        while it is larger.
+        """
+        total = progress.get('media_bytes') or progress.get('total_bytes')
+        if not total or (slot.expected_bytes and total <= slot.expected_bytes):
+            return False
+        slot.expected_bytes = int(total)
+        return True
+
+    def still_fits(self, slot, running):
+        """Whether a running slot fits next to the other running ones"""
+        others = [other for other in running if other is not slot]
+        remaining = max(slot.expected_bytes * slot.size_factor - slot.bytes_done, 0)
+        return self.check(others).shortfall(slot.output_dir, remaining) == 0
+
+
+class DiskCheck:
+    """Free space for downloads next to a fixed set of running ones
+
+    Every directory's filesystem and free space, and the reservations of
+    the running downloads on every device, are looked up once. One
+    DiskCheck serves one pass over the queue, while no download starts.
+    """
+    def __init__(self, disk, running):
+        self.disk = disk
+        self.running = running
+        self.usages = {}  # Directory -> DiskSpace.usage()
+        self.reservations = {}  # Device -> bytes still to be written by running downloads
+        self.directories = {}  # Output template -> output_directory()
+
+    def usage(self, directory):
+        if directory not in self.usages:
+            self.usages[directory] = self.disk.usage(directory)
+        return self.usages[directory]
+
+    def reserved(self, device):
+        """Return the bytes running downloads on a device are still expected to write"""
+        if device not in self.reservations:
+            reserved = 0
+            for slot in self.running:
+                usage = self.usage(slot.output_dir) if slot.expected_bytes else None
+                if usage is not None and usage[0] == device:
+                    reserved += max(slot.expected_bytes * slot.size_factor - slot.bytes_done, 0)
+            self.reservations[device] = reserved
+        return self.reservations[device]
+
+    def shortfall(self, directory, reservation):
+        """Return how many bytes are missing for a download to fit, 0 when it fits"""
+        usage = self.usage(directory)
+        if usage is None:
+            # A disk that cannot be checked holds nothing up
+            return 0
+        device, free = usage
+        return max(int(reservation + self.reserved(device) + self.disk.min_free - free), 0)
+
+    def missing(self, cmd, expected_bytes):
+        """Return the free space a download of cmd lacks to start, 0 when it may"""
+        template = command_option(cmd, '-o', '--output')
+        if template not in self.directories:
+            self.directories[template] = output_directory(cmd)
+        reservation = (expected_bytes or 0) * size_factor(cmd)
+        return self.shortfall(self.directories[template], reservation)
@@ -0,0 +1,323 @@
+"""Local status endpoint: queue state and live downloads as JSON or Prometheus text.
+
+GET /status (or /) answers with JSON, GET /metrics with the Prometheus
+text format. The endpoint listens on a loopback port or a Unix socket.
+With a QueueControl it also serves the control API under /jobs (see
+grab_control); over TCP those requests need the control token as
+"Authorization: Bearer <token>", on a Unix socket the file mode
+guards them.
+"""
+
+import hmac
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from grab_control import control_token
+from grab_scheduler import host_key
+from grab_store import COMPLETED, DOWNLOADING, FAILED, FINISHED_STATES, PAUSED, QUEUED, STOPPED
+
+# A download without progress for this long counts as stalled
+STALL_SECONDS = 120
+
+# Largest control request body
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+STATES = (QUEUED, DOWNLOADING, PAUSED, COMPLETED, FAILED, STOPPED)
+
+
+def parse_address(address):
+    """Return ('unix', path) or ('tcp', (host, port)) for a status address
+
+    Accepted are a port ('9180'), host:port ('127.0.0.1:9180') and a
+    socket path ('/run/user/1000/grab.sock' or 'unix:~/grab.sock').
+    """
+    address = address.strip()
+    if address.startswith('unix:'):
+        return 'unix', os.path.expanduser(address[5:])
+    if address.startswith(('/', '~', '.')):
+        return 'unix', os.path.expanduser(address)
+
+    host, _, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"Invalid status address: {address}")
+    return 'tcp', (host or '127.0.0.1', port)
+
+
+class QueueStatus:
+    """Snapshot source for the status endpoint
+
+    jobs, playlists and postprocessing are callables returning the
+    running DownloadSlots, PlaylistExpansions and the downloaded slots
+    waiting for or in post-processing, paused one returning whether the
+    queue is paused. They are called from the endpoint's threads, so they
+    should return copies. Private downloads are listed without URL or
+    file name.
+    """
+    def __init__(self, store, jobs, playlists=list, paused=lambda: False, postprocessing=list):
+        self.store = store
+        self.jobs = jobs
+        self.playlists = playlists
+        self.paused = paused
+        self.postprocessing = postprocessing
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.finished = dict.fromkeys(FINISHED_STATES, 0)  # Since start, per state
+        self.failures = {}  # Failed runs since start, per failure category
+        self.retries = 0  # Retries scheduled since start
+        self.bytes = 0  # Downloaded since start
+
+    def job_finished(self, slot, state, retrying=False):
+        """Count a finished run of a slot"""
+        with self.lock:
+            if state in self.finished:
+                self.finished[state] += 1
+            if slot.failure:
+                self.failures[slot.failure] = self.failures.get(slot.failure, 0) + 1
+            if retrying:
+                self.retries += 1
+            if slot.metrics is not None:
+                self.bytes += int(slot.metrics.bytes)
+
+    def job_status(self, slot, now):
+        metrics = slot.metrics
+        last_progress = metrics.last_progress if metrics else None
+        job = {
+            'id': slot.item_id,
+            'url': None if slot.private else slot.url,
+            'host': host_key(slot.url),
+            'file': None if slot.private else os.path.basename(slot.download_name) or None,
+            'private': slot.private,
+            'progress': round(slot.progress, 4),
+            'bytes': int(slot.bytes_done),
+            'speed': slot.speed,
+            'eta': slot.eta,
+            'rate_limit': slot.rate_limit,
+            'seconds_running': round(now - metrics.start, 1) if metrics else 0,
+            # Until the first progress, the time since the job started
+            'seconds_since_progress': round(now - (last_progress or metrics.start), 1) if metrics else 0,
+        }
+        job['stalled'] = job['seconds_since_progress'] >= STALL_SECONDS
+        return job
+
+    def snapshot(self):
+        """Return the current state as a JSON-serializable dict"""
+        now = time.monotonic()
+        counts = self.store.counts()
+        waiting, next_retry_at = self.store.pending_retries()
+        jobs = [self.job_status(slot, now) for slot in self.jobs()]
+        with self.lock:
+            finished = dict(self.finished)
+            failures = dict(self.failures)
+            retries = self.retries
+            downloaded = self.bytes
+        return {
+            'time': time.time(),
+            'uptime': round(time.time() - self.started_at, 1),
+            'paused': bool(self.paused()),
+            'queue': {state: counts.get(state, 0) for state in STATES},
+            'jobs': jobs,
+            'postprocessing': [self.job_status(slot, now) for slot in self.postprocessing()],
+            'playlists': [
+                {'url': None if expansion.private else expansion.url,
+                 'found': expansion.found, 'skipped': expansion.skipped}
+                for expansion in self.playlists()
+            ],
+            'retry_waiting': waiting,
+            'next_retry_at': next_retry_at,
+            'finished': finished,
+            'failures': failures,
+            'retries': retries,
+            'bytes': downloaded,
+        }
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(status):
+    """Render a snapshot in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+            value = round(value, 3) if isinstance(value, float) else int(value)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    jobs = status['jobs']
+    metric("grab_queue_items", "gauge", "Queue items by state.",
+           [({'state': state}, count) for state, count in status['queue'].items()])
+    metric("grab_active_downloads", "gauge", "Downloads running now.", [({}, len(jobs))])
+    metric("grab_stalled_downloads", "gauge", f"Running downloads without progress for {STALL_SECONDS}s.",
+           [({}, sum(job['stalled'] for job in jobs))])
+    metric("grab_postprocessing_jobs", "gauge", "Downloaded items waiting for or in post-processing.",
+           [({}, len(status['postprocessing']))])
+    metric("grab_playlists_listing", "gauge", "Playlists being listed into the queue.",
+           [({}, len(status['playlists']))])
+    metric("grab_queue_paused", "gauge", "Whether the queue is paused.", [({}, int(status['paused']))])
+    metric("grab_downloads_finished_total", "counter", "Finished download runs by outcome.",
+           [({'state': state}, count) for state, count in status['finished'].items()])
+    metric("grab_queue_retry_waiting", "gauge", "Queued items waiting for a retry after a failure.",
+           [({}, status['retry_waiting'])])
+    metric("grab_download_failures_total", "counter", "Failed download runs by reason.",
+           [({'reason': reason}, count) for reason, count in sorted(status['failures'].items())])
+    metric("grab_download_retries_total", "counter", "Retries scheduled after failures.", [({}, status['retries'])])
+    metric("grab_downloaded_bytes_total", "counter", "Bytes downloaded by finished runs.", [({}, status['bytes'])])
+    metric("grab_uptime_seconds", "gauge", "Seconds since the queue started.", [({}, status['uptime'])])
+
+    def job_labels(job):
+        return {'id': job['id'], 'host': job['host']}
+
+    metric("grab_job_progress_ratio", "gauge", "Progress of a running download, 0 to 1.",
+           [(job_labels(job), job['progress']) for job in jobs])
+    metric("grab_job_downloaded_bytes", "gauge", "Bytes on disk of a running download.",
+           [(job_labels(job), job['bytes']) for job in jobs])
+    metric("grab_job_speed_bytes_per_second", "gauge", "Current speed of a running download.",
+           [(job_labels(job), job['speed'] or 0) for job in jobs])
+    metric("grab_job_seconds_since_progress", "gauge", "Seconds since a running download made progress.",
+           [(job_labels(job), job['seconds_since_progress']) for job in jobs])
+    return "\n".join(lines) + "\n"
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Answer GET /status, / and /metrics from server.status, /jobs from server.control"""
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip('/')
+        if path.startswith('/jobs'):
+            return self.control_request('GET', path, dict(parse_qsl(parts.query)))
+        if path not in ('', '/status', '/metrics'):
+            return self.send(404, "text/plain", b"Not found\n")
+        try:
+            status = self.server.status.snapshot()
+        except Exception as e:
+            return self.send(500, "text/plain", f"{e}\n".encode())
+
+        if path == '/metrics':
+            self.send(200, "text/plain; version=0.0.4", prometheus_text(status).encode())
+        else:
+            self.send(200, "application/json", json.dumps(status).encode())
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_REQUEST_BYTES:
+            self.close_connection = True
+            return self.send_json(413, {'error': "Missing or too large Content-Length"})
+        body = self.rfile.read(length)
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': "The request body is not JSON"})
+        self.control_request('POST', path, request)
+
+    def control_request(self, method, path, request):
+        control = self.server.control
+        if control is None:
+            return self.send_json(404, {'error': "Control is disabled"})
+        token = self.server.token
+        if token is not None:
+            given = self.headers.get("Authorization", "")
+            if not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+                return self.send_json(401, {'error': "Missing or wrong control token"})
+        try:
+            status, result = control.handle(method, path, request)
+        except Exception as e:
+            status, result = 500, {'error': str(e)}
+        self.send_json(status, result)
+
+    def send_json(self, status, result):
+        self.send(status, "application/json", json.dumps(result).encode())
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+
+class StatusServer:
+    """Serve a QueueStatus, and optionally a QueueControl, on a loopback port or Unix socket"""
+    def __init__(self, status, address, control=None):
+        self.status = status
+        self.address = address
+        self.control = control
+        self.server = None
+        self.socket_path = None
+
+    def start(self):
+        """Start listening, raise OSError or ValueError when that fails"""
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            if os.path.exists(target):
+                # Left over from a crash, unless another GRAB answers on it
+                probe = socket.socket(socket.AF_UNIX)
+                try:
+                    probe.connect(target)
+                    raise OSError(f"Status socket is in use: {target}")
+                except ConnectionRefusedError:
+                    os.unlink(target)
+                finally:
+                    probe.close()
+            server = UnixHTTPServer(target, StatusHandler)
+            os.chmod(target, 0o600)
+            self.socket_path = target
+        else:
+            server = ThreadingHTTPServer(target, StatusHandler)
+            server.daemon_threads = True
+        server.status = self.status
+        server.control = self.control
+        server.token = control_token() if self.control and kind == 'tcp' else None
+        self.server = server
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def url(self):
+        """Where the status can be fetched, for messages"""
+        if self.socket_path:
+            return f"unix:{self.socket_path}"
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/status"
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        if self.socket_path:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            self.socket_path = None
@@ -0,0 +1,409 @@
+"""Crash-safe journal of download queue items, backed by SQLite."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from grab_cache import canonical_url
+from grab_scheduler import host_key
+
+QUEUE_DB = os.path.expanduser("~/.grab/queue.db")
+
+# Item states
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+PAUSED = "paused"
+COMPLETED = "completed"
+FAILED = "failed"
+STOPPED = "stopped"
+
+FINISHED_STATES = (COMPLETED, FAILED, STOPPED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'queued',
+    position REAL NOT NULL DEFAULT 0,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    canonical_url TEXT,
+    host TEXT,
+    error TEXT,
+    failure TEXT,
+    retry_at REAL,
+    private INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS items_state_position ON items (state, position);
+CREATE INDEX IF NOT EXISTS items_position ON items (position);
+"""
+
+# Created after migrate(), the column may be new
+INDEXES = """
+CREATE INDEX IF NOT EXISTS items_canonical_url ON items (canonical_url);
+"""
+
+# Largest number of parameters in one query
+MAX_QUERY_PARAMS = 500
+
+# Columns added after the first release, with their definitions
+ADDED_COLUMNS = {
+    'failure': "TEXT",  # Failure category of the last run, see grab_retry
+    'retry_at': "REAL",  # Queued items wait until then after a failure
+    'failures': "INTEGER NOT NULL DEFAULT 0",  # Failed runs retried since the item was queued or resumed
+    'canonical_url': "TEXT",  # canonical_url() of url, for duplicate checks
+    'host': "TEXT",  # host_key() of url, for the per-site limits
+}
+
+
+class QueueItem:
+    """One row of the queue journal"""
+    def __init__(self, row):
+        self.id = row['id']
+        self.url = row['url']
+        self.options = json.loads(row['options'] or '{}')
+        self.state = row['state']
+        self.position = row['position']
+        self.bytes_done = row['bytes_done']
+        self.attempts = row['attempts']  # Runs started, including resumed ones
+        self.failures = row['failures']  # Runs that failed and were retried
+        self.host = row['host']
+        self.error = row['error']
+        self.failure = row['failure']
+        self.retry_at = row['retry_at']
+        self.private = bool(row['private'])
+        self.created_at = row['created_at']
+        self.updated_at = row['updated_at']
+        self.started_at = row['started_at']
+        self.finished_at = row['finished_at']
+
+    @property
+    def cmd(self):
+        """The yt-dlp command saved when the item was added"""
+        return self.options.get('cmd')
+
+
+class QueueStore:
+    """Durable queue of download items
+
+    Every state change is committed right away in WAL mode, so a crash
+    loses at most the progress since the last saved byte count. All
+    methods may be called from any thread.
+    """
+    def __init__(self, path=None):
+        self.path = path or QUEUE_DB
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.conn.executescript(INDEXES)
+
+    def migrate(self):
+        """Add the columns a journal of an older version lacks"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(items)")}
+        with self.conn:
+            for name, definition in ADDED_COLUMNS.items():
+                if name not in columns:
+                    self.conn.execute(f"ALTER TABLE items ADD COLUMN {name} {definition}")
+            if 'canonical_url' not in columns:
+                rows = self.conn.execute("SELECT id, url FROM items").fetchall()
+                self.conn.executemany("UPDATE items SET canonical_url = ? WHERE id = ?",
+                                      [(canonical_url(row['url']), row['id']) for row in rows])
+            if 'host' not in columns:
+                rows = self.conn.execute("SELECT id, url FROM items").fetchall()
+                self.conn.executemany("UPDATE items SET host = ? WHERE id = ?",
+                                      [(host_key(row['url']), row['id']) for row in rows])
+
+    def add(self, url, options, private=False, state=QUEUED):
+        """Append an item to the end of the queue and return its id"""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT MAX(position) FROM items").fetchone()
+            position = (row[0] or 0) + 1
+            cursor = self.conn.execute(
+                "INSERT INTO items (url, canonical_url, host, options, state, position, private, created_at,"
+                " updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, canonical_url(url), host_key(url), json.dumps(options), state, position, int(private),
+                 now, now)
+            )
+            return cursor.lastrowid
+
+    def add_many(self, entries, private=False, state=QUEUED):
+        """Append (url, options) pairs in one transaction, return the new items"""
+        if not entries:
+            return []
+
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT MAX(position) FROM items").fetchone()
+            position = row[0] or 0
+            item_ids = []
+            for url, options in entries:
+                position += 1
+                cursor = self.conn.execute(
+                    "INSERT INTO items (url, canonical_url, host, options, state, position, private, created_at,"
+                    " updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, canonical_url(url), host_key(url), json.dumps(options), state, position,
+                     int(private), now, now)
+                )
+                item_ids.append(cursor.lastrowid)
+            rows = self.conn.execute(
+                "SELECT * FROM items WHERE id BETWEEN ? AND ? ORDER BY position",
+                (item_ids[0], item_ids[-1])
+            ).fetchall()
+        return [QueueItem(row) for row in rows]
+
+    def get(self, item_id):
+        """Return an item by id, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        return QueueItem(row) if row else None
+
+    def next_queued(self, exclude=(), accept=None, skip_hosts=(), batch_size=200):
+        """Return the first queued item not in exclude, or None
+
+        Items of the sites in skip_hosts are passed over in the query.
+        With accept, items for which accept(item) is false are passed over,
+        as are items whose retry is not due yet.
+        """
+        last_position = float('-inf')
+        now = time.time()
+        hosts = list(skip_hosts)
+        query = "SELECT * FROM items WHERE state = ? AND position > ? AND (retry_at IS NULL OR retry_at <= ?)"
+        if hosts:
+            query += f" AND host NOT IN ({','.join('?' * len(hosts))})"
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    query + " ORDER BY position LIMIT ?",
+                    (QUEUED, last_position, now, *hosts, batch_size)
+                ).fetchall()
+            if not rows:
+                return None
+            for row in rows:
+                if row['id'] in exclude:
+                    continue
+                item = QueueItem(row)
+                if accept is None or accept(item):
+                    return item
+            last_position = rows[-1]['position']
+
+    def iter_items(self, batch_size=500):
+        """Yield lists of items in queue order, one batch at a time"""
+        last_position = float('-inf')
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT * FROM items WHERE position > ? ORDER BY position LIMIT ?",
+                    (last_position, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_position = rows[-1]['position']
+            yield [QueueItem(row) for row in rows]
+
+    def list_items(self, state=None, limit=100, offset=0):
+        """Return one page of items in queue order, optionally only of a state"""
+        query = "SELECT * FROM items"
+        params = []
+        if state:
+            query += " WHERE state = ?"
+            params.append(state)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY position LIMIT ? OFFSET ?",
+                                     params + [limit, offset]).fetchall()
+        return [QueueItem(row) for row in rows]
+
+    def pending_among(self, urls):
+        """Return the canonical URLs of urls that unfinished items have
+
+        Looks up only the given URLs, through the canonical_url index.
+        """
+        keys = list({canonical_url(url) for url in urls})
+        pending = set()
+        with self.lock:
+            for start in range(0, len(keys), MAX_QUERY_PARAMS):
+                batch = keys[start:start + MAX_QUERY_PARAMS]
+                rows = self.conn.execute(
+                    f"SELECT canonical_url FROM items WHERE canonical_url IN ({','.join('?' * len(batch))})"
+                    f" AND state NOT IN ({','.join('?' * len(FINISHED_STATES))})",
+                    (*batch, *FINISHED_STATES)
+                ).fetchall()
+                pending.update(row[0] for row in rows)
+        return pending
+
+    def count(self, state):
+        """Return the number of items in a state"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE state = ?", (state,)).fetchone()[0]
+
+    def counts(self):
+        """Return {state: number of items} for the states that have items"""
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def mark_started(self, item_id):
+        """Record that a download attempt started"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE items SET state = ?, attempts = attempts + 1, started_at = ?,"
+                " updated_at = ?, error = NULL, retry_at = NULL WHERE id = ?",
+                (DOWNLOADING, now, now, item_id)
+            )
+
+    def set_state(self, item_id, state, error=None, failure=None):
+        """Move an item to a new state"""
+        now = time.time()
+        finished_at = now if state in FINISHED_STATES else None
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE items SET state = ?, error = ?, failure = ?, updated_at = ?,"
+                " finished_at = COALESCE(?, finished_at) WHERE id = ?",
+                (state, error, failure, now, finished_at, item_id)
+            )
+
+    def schedule_retry(self, item_id, retry_at, error, failure):
+        """Queue a failed item again, to be started from retry_at on, and count the failure"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE items SET state = ?, error = ?, failure = ?, retry_at = ?, failures = failures + 1,"
+                " updated_at = ? WHERE id = ?",
+                (QUEUED, error, failure, retry_at, time.time(), item_id)
+            )
+
+    def pending_retries(self):
+        """Return (number of queued items waiting for a retry, earliest retry time or None)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), MIN(retry_at) FROM items WHERE state = ? AND retry_at > ?",
+                (QUEUED, time.time())
+            ).fetchone()
+        return row[0], row[1]
+
+    def reset_retries(self, item_ids):
+        """Forget the runs, failures and pending retry of items, for a fresh start"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE items SET attempts = 0, failures = 0, retry_at = NULL, updated_at = ? WHERE id = ?",
+                [(time.time(), item_id) for item_id in item_ids]
+            )
+
+    def set_bytes_done(self, item_id, bytes_done):
+        """Save how much of an item has been downloaded"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE items SET bytes_done = ?, updated_at = ? WHERE id = ?",
+                (int(bytes_done), time.time(), item_id)
+            )
+
+    def set_option(self, item_id, name, value):
+        """Save one of an item's options"""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT options FROM items WHERE id = ?", (item_id,)).fetchone()
+            if row is None:
+                return
+            options = json.loads(row[0] or '{}')
+            options[name] = value
+            self.conn.execute(
+                "UPDATE items SET options = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(options), time.time(), item_id)
+            )
+
+    def states(self, item_ids):
+        """Return {item id: state} for the items that exist"""
+        states = {}
+        with self.lock:
+            for item_id in item_ids:
+                row = self.conn.execute("SELECT state FROM items WHERE id = ?", (item_id,)).fetchone()
+                if row:
+                    states[item_id] = row[0]
+        return states
+
+    def change_state(self, item_ids, new_state, from_states):
+        """Move the items that are in one of from_states, return their ids"""
+        now = time.time()
+        finished_at = now if new_state in FINISHED_STATES else None
+        changed = []
+        with self.lock, self.conn:
+            for item_id in item_ids:
+                cursor = self.conn.execute(
+                    f"UPDATE items SET state = ?, updated_at = ?, finished_at = ?"
+                    f" WHERE id = ? AND state IN ({','.join('?' * len(from_states))})",
+                    (new_state, now, finished_at, item_id, *from_states)
+                )
+                if cursor.rowcount:
+                    changed.append(item_id)
+        return changed
+
+    def move_state(self, old_state, new_state):
+        """Move every item in old_state to new_state, return their ids"""
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT id FROM items WHERE state = ?", (old_state,)).fetchall()
+            self.conn.execute(
+                "UPDATE items SET state = ?, updated_at = ? WHERE state = ?",
+                (new_state, time.time(), old_state)
+            )
+        return [row[0] for row in rows]
+
+    def delete(self, item_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+
+    def delete_many(self, item_ids):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM items WHERE id = ?", [(item_id,) for item_id in item_ids])
+
+    def move(self, item_ids, to_front=True):
+        """Move items to the front or the back of the queue, keeping their order"""
+        with self.lock, self.conn:
+            if to_front:
+                row = self.conn.execute("SELECT MIN(position) FROM items").fetchone()
+                start = (row[0] or 0) - len(item_ids)
+            else:
+                row = self.conn.execute("SELECT MAX(position) FROM items").fetchone()
+                start = (row[0] or 0) + 1
+            self.conn.executemany(
+                "UPDATE items SET position = ?, updated_at = ? WHERE id = ?",
+                [(start + i, time.time(), item_id) for i, item_id in enumerate(item_ids)]
+            )
+
+    def delete_finished(self):
+        """Remove completed, failed and stopped items, return their ids"""
+        states = ','.join('?' * len(FINISHED_STATES))
+        with self.lock, self.conn:
+            rows = self.conn.execute(f"SELECT id FROM items WHERE state IN ({states})", FINISHED_STATES).fetchall()
+            self.conn.execute(f"DELETE FROM items WHERE state IN ({states})", FINISHED_STATES)
+        return [row[0] for row in rows]
+
+    def recover(self):
+        """Prepare the journal after a restart
+
+        Items that were downloading when GRAB exited become paused so they
+        can be resumed from their partial files, and items started in
+        incognito mode are forgotten.
+        """
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM items WHERE private = 1")
+            self.conn.execute(
+                "UPDATE items SET state = ?, updated_at = ? WHERE state = ?",
+                (PAUSED, time.time(), DOWNLOADING)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
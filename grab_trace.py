@@ -0,0 +1,130 @@
+"""Opt-in timing spans for GRAB, written as a Chrome trace file.
+
+Tracing is off unless the GRAB_TRACE environment variable names an
+output file or enable() is called; a span then costs one flag check.
+The file can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+# Events beyond this are counted but not kept
+MAX_EVENTS = 1000000
+
+
+class _Span:
+    """Records the time between entering and leaving a with block"""
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class _NullSpan:
+    """Stands in for a span while tracing is off"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collect spans from any thread and write them as trace events"""
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.events = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.exit_hook = False
+
+    def enable(self, path=None):
+        """Start recording; with a path the trace is written at exit"""
+        self.enabled = True
+        self.path = path or self.path
+        if self.path and not self.exit_hook:
+            atexit.register(self.dump)
+            self.exit_hook = True
+
+    def span(self, name, **args):
+        """Return a context manager timing a block as one span"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        """Add a span given its perf_counter() start and end"""
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def durations(self):
+        """Return {span name: [duration in seconds, ...]}"""
+        result = {}
+        with self.lock:
+            for event in self.events:
+                result.setdefault(event['name'], []).append(event['dur'] / 1e6)
+        return result
+
+    def reset(self):
+        """Forget the recorded spans"""
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+
+    def dump(self, path=None):
+        """Write the recorded spans as a Chrome trace file"""
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            trace = {
+                'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped},
+            }
+        try:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        except OSError as e:
+            print(f"Error writing trace file: {e}")
+
+
+tracer = Tracer()
+if os.environ.get('GRAB_TRACE'):
+    tracer.enable(os.environ['GRAB_TRACE'])
+
+
+def span(name, **args):
+    """Time a block as a span of the global tracer"""
+    return tracer.span(name, **args)
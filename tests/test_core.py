@@ -0,0 +1,75 @@
+import io
+import time
+
+from grab_core import DownloadSlot, QueueRunner, finished_state, read_settings, run_download
+from grab_metrics import MetricsStore
+from grab_store import COMPLETED, FAILED, PAUSED, QUEUED, STOPPED, QueueStore
+
+
+class StoppedAtTheEnd:
+    """Engine whose download is stopped just as it exits with return_code"""
+    def __init__(self, return_code):
+        self.return_code = return_code
+
+    def download(self, cmd, control, on_line, on_progress, on_destination):
+        on_line("[download] 100% of 1.00MiB\n")
+        control.stopped = True
+        return self.return_code
+
+
+def ignore(value):
+    pass
+
+
+def new_slot():
+    return DownloadSlot(1, "https://example.com/a", ['yt-dlp', 'https://example.com/a'])
+
+
+def test_download_done_before_stop_completes():
+    slot = new_slot()
+    success, message = run_download(StoppedAtTheEnd(0), slot, ignore, ignore, ignore)
+    assert success
+    assert finished_state(slot, success, False) == COMPLETED
+
+
+def test_interrupted_download_is_stopped():
+    slot = new_slot()
+    success, message = run_download(StoppedAtTheEnd(1), slot, ignore, ignore, ignore)
+    assert (success, message) == (False, "Download stopped")
+    assert finished_state(slot, success, False) == STOPPED
+
+
+def test_finished_state_of_interrupted_slots():
+    slot = new_slot()
+    slot.paused = True
+    assert finished_state(slot, True, True) == COMPLETED
+    assert finished_state(slot, False, True) == PAUSED
+    assert finished_state(slot, False, False) == QUEUED
+    slot.no_space = True
+    assert finished_state(slot, False, True) == QUEUED
+    assert finished_state(new_slot(), False, False) == FAILED
+
+
+def new_runner(tmp_path, store):
+    settings = dict(read_settings(str(tmp_path / "settings.json")), download_archive="")
+    return QueueRunner(settings, store=store, out=io.StringIO(), log_dir=str(tmp_path / "logs"),
+                       metrics=MetricsStore(str(tmp_path / "metrics.db")))
+
+
+def test_due_retry_starts_before_stop(tmp_path):
+    store = QueueStore(":memory:")
+    item_id = store.add("https://example.com/a", {"cmd": ['yt-dlp', 'https://example.com/a']})
+    store.schedule_retry(item_id, time.time() - 1, "timed out", "network")
+    slot = new_runner(tmp_path, store).next_slot()
+    assert slot.item_id == item_id
+    assert slot.attempt == 2
+
+
+def test_due_retry_after_stop_starts_nothing(tmp_path):
+    store = QueueStore(":memory:")
+    item_id = store.add("https://example.com/a", {"cmd": ['yt-dlp', 'https://example.com/a']})
+    store.schedule_retry(item_id, time.time() - 1, "timed out", "network")
+    runner = new_runner(tmp_path, store)
+    runner.stop()
+    assert runner.next_slot() is None
+    assert store.get(item_id).state == QUEUED
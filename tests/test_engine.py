@@ -0,0 +1,47 @@
+import pytest
+
+from grab_engine import parse_progress
+
+MIB = 1024 * 1024
+
+
+def test_yt_dlp_progress():
+    progress = parse_progress("[download]  45.0% of   10.00MiB at    1.50MiB/s ETA 00:05")
+    assert progress['fraction'] == pytest.approx(0.45)
+    assert progress['total_bytes'] == 10 * MIB
+    assert progress['downloaded_bytes'] == pytest.approx(4.5 * MIB)
+    assert progress['speed'] == 1.5 * MIB
+    assert progress['eta'] == 5
+
+
+def test_yt_dlp_fragment_progress():
+    progress = parse_progress("[download]  12.0% of ~  50.00MiB at    2.00MiB/s ETA 01:02 (frag 3/25)")
+    assert progress['total_bytes'] == 50 * MIB
+    assert progress['eta'] == 62
+    assert (progress['fragment_index'], progress['fragment_count']) == (3, 25)
+
+
+def test_yt_dlp_progress_unknown_speed():
+    progress = parse_progress("[download]   0.0% of   10.00MiB at  Unknown B/s ETA Unknown")
+    assert progress == {'fraction': 0.0, 'total_bytes': 10 * MIB, 'downloaded_bytes': 0.0}
+
+
+def test_aria2c_progress():
+    progress = parse_progress("[#2089b0 400.0KiB/32.0MiB(1%) CN:4 DL:1.5MiB ETA:4m51s]")
+    assert progress['downloaded_bytes'] == 400 * 1024
+    assert progress['total_bytes'] == 32 * MIB
+    assert progress['fraction'] == pytest.approx(400 / (32 * 1024))
+    assert progress['speed'] == 1.5 * MIB
+    assert progress['eta'] == 291
+
+
+def test_aria2c_progress_without_size():
+    assert parse_progress("[#2089b0 0B/0B(0%) CN:1 DL:0B]") == {'fraction': 0.0, 'speed': 0}
+
+
+@pytest.mark.parametrize("line", [
+    "[youtube] abc: Downloading webpage",
+    "[download] Destination: a.mp4",
+])
+def test_other_lines(line):
+    assert parse_progress(line) is None
@@ -0,0 +1,83 @@
+import pytest
+
+from grab_formats import FormatRules, media_formats
+
+MIB = 1024 * 1024
+
+INFO = {
+    'duration': 60,
+    'formats': [
+        {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'},
+        {'format_id': '137', 'height': 1080, 'vcodec': 'avc1.640028', 'acodec': 'none', 'ext': 'mp4',
+         'tbr': 4000, 'filesize': 100 * MIB},
+        {'format_id': '248', 'height': 1080, 'vcodec': 'vp09.00.40.08', 'acodec': 'none', 'ext': 'webm',
+         'tbr': 3000, 'filesize': 80 * MIB},
+        {'format_id': '136', 'height': 720, 'vcodec': 'avc1.4d401f', 'acodec': 'none', 'ext': 'mp4',
+         'tbr': 2000, 'filesize': 50 * MIB},
+        {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'ext': 'm4a', 'abr': 128,
+         'filesize': 5 * MIB},
+        {'format_id': '251', 'vcodec': 'none', 'acodec': 'opus', 'ext': 'webm', 'abr': 160,
+         'filesize': 6 * MIB},
+    ],
+}
+
+
+@pytest.fixture
+def formats():
+    return media_formats(INFO)
+
+
+def test_media_formats_skip_storyboards(formats):
+    assert [fmt.format_id for fmt in formats] == ['137', '248', '136', '140', '251']
+    assert formats[0].video_codec == 'h264'
+    assert formats[4].audio_codec == 'opus'
+
+
+@pytest.mark.parametrize("rules, media_type, output_format, spec", [
+    # Codecs the container holds as they are come first
+    (FormatRules(), 'video', 'mp4', '137+140'),
+    (FormatRules(), 'video', 'webm', '248+251'),
+    (FormatRules(max_height=720), 'video', 'mp4', '136+140'),
+    # 105 MiB does not fit, 55 MiB does
+    (FormatRules(max_size_mb=60), 'video', 'mp4', '136+140'),
+    (FormatRules(codecs=['vp9'], prefer_no_reencode=False), 'video', 'mp4', '248+251'),
+    (FormatRules(), 'audio', 'm4a', '140'),
+    (FormatRules(), 'audio', 'mp3', '251'),
+    (FormatRules(codecs=['aac']), 'audio', 'best', '140'),
+])
+def test_format_spec(formats, rules, media_type, output_format, spec):
+    assert rules.format_spec(formats, media_type, output_format) == spec
+
+
+def test_choose_too_large_picks_smallest(formats):
+    chosen = FormatRules(max_size_mb=1).choose(formats, 'video', 'mp4')
+    assert [fmt.format_id for fmt in chosen] == ['136', '140']
+
+
+def test_choose_without_formats():
+    assert FormatRules().choose([]) == []
+    assert FormatRules().format_spec([]) is None
+
+
+def test_from_dict_round_trip():
+    rules = FormatRules.from_dict({'max_height': 720, 'codecs': [' AV1 ', ''], 'unknown': 1})
+    assert rules.to_dict() == {'max_height': 720, 'codecs': ['av1'], 'max_size_mb': 0, 'prefer_no_reencode': True}
+
+
+def test_selector_without_limits():
+    assert FormatRules().selector('video', 'best') == "bv*+ba/b"
+    assert FormatRules().selector('audio', 'best') == "ba/b"
+
+
+def test_selector_with_limits():
+    selector = FormatRules(max_height=720, max_size_mb=100).selector('video', 'best')
+    size = "[filesize<?100M][filesize_approx<?100M]"
+    assert selector == f"bv*[height<=?720]{size}+ba{size}/b[height<=?720]{size}/wv*+ba/w"
+
+
+def test_selector_prefers_kept_codecs():
+    choices = FormatRules(codecs=['vp9']).selector('video', 'mp4').split('/')
+    assert choices[0] == "bv*[vcodec~='^(av01|av1|hev1|hvc1|h265|hevc|avc1|avc3|h264)']+ba[acodec~='^(mp4a|aac|mp3)']"
+    # vp9 is converted for mp4, it comes after the codecs mp4 holds
+    assert choices[2] == "bv*[vcodec~='^(vp09|vp9)']+ba[acodec~='^(mp4a|aac|mp3)']"
+    assert choices[-1] == "b"
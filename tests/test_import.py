@@ -0,0 +1,35 @@
+from grab_import import UrlImport, clean_url, dropped_files, text_words
+
+TEXT = """# Watch later
+https://www.youtube.com/watch?v=a <https://youtu.be/b>
+; not this one https://example.com/skipped
+youtube.com/watch?v=a vimeo.com/1 notaurl ftp://example.com/c
+"""
+
+
+def test_text_words_skip_comments():
+    assert list(text_words(TEXT)) == [
+        "https://www.youtube.com/watch?v=a", "<https://youtu.be/b>",
+        "youtube.com/watch?v=a", "vimeo.com/1", "notaurl", "ftp://example.com/c",
+    ]
+
+
+def test_clean_url():
+    assert clean_url("<https://youtu.be/b>") == "https://youtu.be/b"
+    assert clean_url("vimeo.com/1") == "https://vimeo.com/1"
+    assert clean_url("notaurl") is None
+    assert clean_url("ftp://example.com/c") is None
+
+
+def test_url_import_counts():
+    url_import = UrlImport(known={"https://youtube.com/watch?v=b"},
+                           is_archived=lambda url: url == "https://vimeo.com/1")
+    url_import.add_text(TEXT)
+    assert url_import.urls == ["https://www.youtube.com/watch?v=a"]
+    assert (url_import.duplicates, url_import.archived, url_import.invalid) == (2, 1, 2)
+    assert url_import.summary() == "Imported 1 URL(s), skipped 2 duplicate(s), 1 already downloaded, 2 invalid"
+
+
+def test_dropped_files():
+    assert dropped_files(["file:///tmp/a%20b.txt", "https://example.com/c"]) == (
+        ["/tmp/a b.txt"], ["https://example.com/c"])
@@ -0,0 +1,37 @@
+from grab_postprocess import split_command
+
+INFO_FILE = "/tmp/grab/5.info.json"
+
+
+def test_split_without_postprocessing():
+    cmd = ['yt-dlp', '-f', '137+140', '-o', '%(title)s.%(ext)s', 'URL']
+    assert split_command(cmd, INFO_FILE) == (cmd, None)
+
+
+def test_split_moves_postprocessing_and_archive():
+    cmd = ['yt-dlp', '-f', '137+140', '--embed-metadata', '--sponsorblock-remove', 'sponsor',
+           '--download-archive', 'archive.txt', '-o', '%(title)s.%(ext)s', 'URL']
+    download, postprocess = split_command(cmd, INFO_FILE)
+    assert download == ['yt-dlp', '-f', '137+140', '-o', '%(title)s.%(ext)s',
+                        '--write-info-json', '-o', 'infojson:/tmp/grab/5', 'URL']
+    assert postprocess == cmd[:-1] + [f'--load-info-json={INFO_FILE}']
+
+
+def test_split_extract_audio_downloads_audio():
+    cmd = ['yt-dlp', '-x', '--audio-format', 'mp3', 'URL']
+    download, postprocess = split_command(cmd, INFO_FILE)
+    assert download[:3] == ['yt-dlp', '-f', 'bestaudio/best']
+    assert 'mp3' not in download
+    assert postprocess[:4] == ['yt-dlp', '-x', '--audio-format', 'mp3']
+
+
+def test_split_embed_thumbnail_agrees_on_container():
+    cmd = ['yt-dlp', '--embed-thumbnail', 'URL']
+    download, postprocess = split_command(cmd, INFO_FILE)
+    assert '--merge-output-format' in download
+    assert postprocess[-3:-1] == ['--merge-output-format', 'mp4/mkv']
+
+
+def test_split_escapes_template():
+    download, postprocess = split_command(['yt-dlp', '-x', 'URL'], "/tmp/100%/5.info.json")
+    assert 'infojson:/tmp/100%%/5' in download
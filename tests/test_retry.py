@@ -0,0 +1,53 @@
+import pytest
+
+from grab_retry import (
+    AUTH, DISK, NETWORK, POSTPROCESS, RATE_LIMITED, UNAVAILABLE, UNKNOWN, RetryPolicy, classify_failure
+)
+
+
+@pytest.mark.parametrize("line, category", [
+    ("ERROR: [youtube] abc: HTTP Error 429: Too Many Requests", RATE_LIMITED),
+    ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", NETWORK),
+    ("ERROR: unable to download video data: HTTP Error 404: Not Found", UNAVAILABLE),
+    ("ERROR: unable to download video data: HTTP Error 410: Gone", UNAVAILABLE),
+    ("ERROR: [youtube] abc: Sign in to confirm your age", AUTH),
+    ("ERROR: unable to write data: [Errno 28] No space left on device", DISK),
+    ("ERROR: unable to open for writing: [Errno 13] Permission denied: 'a.mp4'", DISK),
+    ("ERROR: unable to open for writing: [Errno 30] Read-only file system: 'a.mp4'", DISK),
+    ("ERROR: Postprocessing: ffprobe and ffmpeg not found", POSTPROCESS),
+    ("ERROR: Unable to download webpage: <urlopen error [Errno 111] Connection refused>", NETWORK),
+    ("ERROR: unable to download video data: [Errno 104] reset by peer", NETWORK),
+    ("ERROR: Unable to download webpage: <urlopen error [Errno -3] Temporary failure>", NETWORK),
+    ("ERROR: [Errno 2] No such file or directory: 'cookies.txt'", UNKNOWN),
+    ("ERROR: unable to download video data: Got error: something odd", UNKNOWN),
+])
+def test_classify_failure(line, category):
+    assert classify_failure(1, ["[download] Destination: a.mp4", line]) == category
+
+
+def test_classify_failure_bad_options():
+    assert classify_failure(2, ["ERROR: HTTP Error 503: Service Unavailable"]) == UNKNOWN
+
+
+def test_classify_failure_without_error_lines():
+    lines = ["[download] 10% of 5MiB", "Connection reset by peer"]
+    assert classify_failure(1, lines) == NETWORK
+
+
+def test_delay_doubles_with_failures():
+    policy = RetryPolicy(max_retries=3, base_delay=10, max_delay=100)
+    assert 5 <= policy.delay(NETWORK, 1) <= 10
+    assert 10 <= policy.delay(NETWORK, 2) <= 20
+    assert 20 <= policy.delay(NETWORK, 3) <= 40
+    assert policy.delay(NETWORK, 4) is None
+
+
+def test_delay_rate_limited_and_capped():
+    policy = RetryPolicy(max_retries=10, base_delay=10, max_delay=100)
+    assert 20 <= policy.delay(RATE_LIMITED, 1) <= 40
+    assert 50 <= policy.delay(NETWORK, 8) <= 100
+
+
+@pytest.mark.parametrize("failure", [UNAVAILABLE, AUTH, DISK, POSTPROCESS, UNKNOWN])
+def test_delay_permanent_failures(failure):
+    assert RetryPolicy(max_retries=3).delay(failure, 1) is None
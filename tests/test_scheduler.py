@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+from grab_scheduler import (
+    COPIES_WHILE_PROCESSING, TEMP_OVERHEAD, DiskSpace, HostLimits, MediaSize, expected_size, size_factor
+)
+
+MIB = 1024 * 1024
+
+
+class FixedDisk(DiskSpace):
+    """DiskSpace of one disk with a fixed free space"""
+    def __init__(self, free, min_free=0):
+        super().__init__(min_free)
+        self.free = free
+
+    def usage(self, directory):
+        return 1, self.free
+
+
+def running_slot(expected_bytes, bytes_done=0, factor=1.0):
+    return SimpleNamespace(output_dir="/media", expected_bytes=expected_bytes, size_factor=factor,
+                           bytes_done=bytes_done)
+
+
+INFO = {
+    'duration': 10,
+    'formats': [
+        {'format_id': '137', 'vcodec': 'avc1', 'acodec': 'none', 'filesize': 1000},
+        {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128, 'filesize': 200},
+        {'format_id': '139', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 48, 'filesize': 80},
+        {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a', 'tbr': 8},
+        {'format_id': '22', 'vcodec': 'avc1', 'acodec': 'mp4a'},
+    ],
+}
+
+
+def test_expected_size_of_format_ids():
+    assert expected_size(INFO, '137+140') == 1200
+    assert expected_size(INFO, '137+bestaudio/137') == 1200
+    assert expected_size(INFO, '139') == 80
+
+
+def test_expected_size_from_bitrate():
+    # 8 kbit/s for 10 seconds
+    assert expected_size(INFO, '18') == 10000
+
+
+def test_expected_size_unknown():
+    assert expected_size(INFO, '22') is None
+    assert expected_size({'formats': []}) is None
+
+
+def test_expected_size_of_selected_formats():
+    info = dict(INFO, requested_formats=[INFO['formats'][0], INFO['formats'][2]])
+    assert expected_size(info, 'bv*+ba/b') == 1080
+
+
+def test_size_factor():
+    assert size_factor(['yt-dlp', '-f', '137', 'URL']) == TEMP_OVERHEAD
+    assert size_factor(['yt-dlp', '-f', '137+140', 'URL']) == TEMP_OVERHEAD * COPIES_WHILE_PROCESSING
+    assert size_factor(['yt-dlp', '--embed-thumbnail', 'URL']) == TEMP_OVERHEAD * COPIES_WHILE_PROCESSING
+
+
+def test_media_size_adds_files():
+    media_size = MediaSize()
+    assert media_size.on_progress({}) is None
+    assert media_size.on_progress({'total_bytes': 1000}) == 1000
+    media_size.on_destination()
+    assert media_size.on_progress({'total_bytes': 150}) == 1150
+    assert media_size.on_progress({'total_bytes': 200}) == 1200
+
+
+def test_missing_fits():
+    disk = FixedDisk(free=100 * MIB)
+    assert disk.missing(['yt-dlp', '-o', '/media/%(title)s.%(ext)s', 'URL'], 10 * MIB, []) == 0
+
+
+def test_missing_counts_running_downloads():
+    disk = FixedDisk(free=100 * MIB)
+    running = [running_slot(80 * MIB, bytes_done=20 * MIB)]
+    # 60 MiB still to come for the running one, 44 MiB for this one
+    assert disk.missing(['yt-dlp', 'URL'], 40 * MIB, running) == 4 * MIB
+
+
+def test_missing_unknown_size_below_min_free():
+    disk = FixedDisk(free=500 * MIB, min_free=1024 * MIB)
+    assert disk.missing(['yt-dlp', 'URL'], None, []) == 524 * MIB
+    disk.free = 2048 * MIB
+    assert disk.missing(['yt-dlp', 'URL'], None, []) == 0
+
+
+def test_missing_on_real_disk(tmp_path):
+    assert DiskSpace().missing(['yt-dlp', '-o', str(tmp_path / 'new' / 'a.mp4'), 'URL'], 1, []) == 0
+
+
+def test_learn_keeps_larger_size():
+    slot = running_slot(None)
+    assert DiskSpace().learn(slot, {'total_bytes': 1000})
+    assert DiskSpace().learn(slot, {'total_bytes': 1000, 'media_bytes': 1200})
+    assert not DiskSpace().learn(slot, {'total_bytes': 200, 'media_bytes': 1100})
+    assert slot.expected_bytes == 1200
+
+
+def test_still_fits():
+    disk = FixedDisk(free=100 * MIB)
+    slot = running_slot(50 * MIB, bytes_done=10 * MIB)
+    other = running_slot(50 * MIB)
+    assert disk.still_fits(slot, [slot])
+    assert disk.still_fits(slot, [slot, other])
+    other.expected_bytes = 70 * MIB
+    assert not disk.still_fits(slot, [slot, other])
+
+
+def test_saturated_hosts():
+    limits = HostLimits(max_per_host=2, overrides={'vimeo.com': 1, 'example.com': 0})
+    active = ["https://www.youtube.com/watch?v=a", "https://youtu.be/b", "https://vimeo.com/1",
+              "https://example.com/a", "https://example.com/b", "https://example.com/c"]
+    assert limits.saturated(active) == {'youtube.com', 'vimeo.com'}
+    assert HostLimits().saturated(active) == set()
+
+
+def test_check_looks_up_each_directory_once():
+    class CountingDisk(FixedDisk):
+        def usage(self, directory):
+            self.lookups.append(directory)
+            return super().usage(directory)
+
+    disk = CountingDisk(free=100 * MIB)
+    disk.lookups = []
+    running = [running_slot(10 * MIB), running_slot(20 * MIB)]
+    check = disk.check(running)
+    for n in range(100):
+        assert check.missing(['yt-dlp', '-o', '/media/%(title)s.%(ext)s', 'URL'], MIB) == 0
+    assert check.missing(['yt-dlp', '-o', '/media/%(title)s.%(ext)s', 'URL'], 80 * MIB) == 18 * MIB
+    assert disk.lookups == ["/media"]
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pytest
+
+from grab_store import (
+    ADDED_COLUMNS, COMPLETED, FAILED, PAUSED, QUEUED, STOPPED, QueueStore
+)
+
+# The items table of the first release
+FIRST_SCHEMA = """
+CREATE TABLE items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'queued',
+    position REAL NOT NULL DEFAULT 0,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    private INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+"""
+
+
+@pytest.fixture
+def store():
+    store = QueueStore(":memory:")
+    yield store
+    store.close()
+
+
+def test_migrate_first_release(tmp_path):
+    path = str(tmp_path / "queue.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(FIRST_SCHEMA)
+    conn.execute("INSERT INTO items (url, state, attempts, created_at, updated_at) VALUES (?, ?, 2, 0, 0)",
+                 ("https://m.youtube.com/watch?v=abc", QUEUED))
+    conn.commit()
+    conn.close()
+
+    store = QueueStore(path)
+    columns = {row['name'] for row in store.conn.execute("PRAGMA table_info(items)")}
+    assert set(ADDED_COLUMNS) <= columns
+    item = store.get(1)
+    assert (item.attempts, item.failures, item.failure, item.retry_at) == (2, 0, None, None)
+    assert item.host == "youtube.com"
+    # Old items are found by their canonical URL
+    assert store.pending_among(["https://www.youtube.com/watch?v=abc"]) == {"https://youtube.com/watch?v=abc"}
+    store.close()
+
+    # Opening it again changes nothing
+    store = QueueStore(path)
+    assert store.get(1).url == "https://m.youtube.com/watch?v=abc"
+    store.close()
+
+
+def test_pending_among(store):
+    store.add("https://youtube.com/watch?v=a", {})
+    done = store.add("https://youtube.com/watch?v=b", {})
+    store.set_state(done, COMPLETED)
+    urls = ["https://www.youtube.com/watch?v=a", "https://youtube.com/watch?v=b", "https://example.com/c"]
+    assert store.pending_among(urls) == {"https://youtube.com/watch?v=a"}
+    assert store.pending_among([]) == set()
+
+
+def test_failures_count_only_retries(store):
+    item_id = store.add("https://example.com/a", {})
+    store.mark_started(item_id)
+    store.schedule_retry(item_id, 1e12, "timed out", "network")
+    store.mark_started(item_id)
+    store.set_state(item_id, PAUSED)
+    store.mark_started(item_id)
+    item = store.get(item_id)
+    assert (item.attempts, item.failures) == (3, 1)
+
+
+def test_reset_retries(store):
+    item_id = store.add("https://example.com/a", {})
+    store.mark_started(item_id)
+    store.schedule_retry(item_id, 1e12, "timed out", "network")
+    assert store.pending_retries()[0] == 1
+    store.reset_retries([item_id])
+    item = store.get(item_id)
+    assert (item.attempts, item.failures, item.retry_at) == (0, 0, None)
+    assert store.pending_retries() == (0, None)
+
+
+def test_move_state_returns_ids(store):
+    ids = [store.add(f"https://example.com/{n}", {}) for n in range(3)]
+    store.set_state(ids[0], PAUSED)
+    store.set_state(ids[2], PAUSED)
+    assert store.move_state(PAUSED, STOPPED) == [ids[0], ids[2]]
+    assert store.counts() == {QUEUED: 1, STOPPED: 2}
+
+
+def test_delete_finished_returns_ids(store):
+    ids = [store.add(f"https://example.com/{n}", {}) for n in range(3)]
+    store.set_state(ids[1], FAILED)
+    assert store.delete_finished() == [ids[1]]
+    assert store.get(ids[1]) is None
+    assert store.count(QUEUED) == 2
+
+
+def test_next_queued_skips_hosts(store):
+    first = store.add("https://www.youtube.com/watch?v=a", {})
+    store.add("https://youtu.be/b", {})
+    other = store.add("https://vimeo.com/1", {})
+    assert store.next_queued().id == first
+    assert store.next_queued(skip_hosts={'youtube.com'}).id == other
+    assert store.next_queued(skip_hosts={'youtube.com', 'vimeo.com'}) is None
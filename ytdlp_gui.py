@@ -4,17 +4,175 @@ import os
 import subprocess
 import json
 import threading
+import math
 import time
 import tempfile
 import shutil
+import queue
+from collections import OrderedDict, deque
 from datetime import datetime
 import gi
 gi.require_version('Gtk', '3.0')
-gi.require_version('WebKit2', '4.0')
-from gi.repository import Gtk, Gdk, GLib, GdkPixbuf, WebKit2
+from gi.repository import Gtk, Gdk, GLib, GdkPixbuf
+
+from grab_archive import DownloadArchive, archive_key, url_archive_key
+from grab_cache import InfoCache, ThumbnailCache
+from grab_control import QueueControl
+from grab_core import (
+    DownloadSlot, PlaylistExpansion, build_download_command, check_item_options, downloader_available,
+    expand_playlist, finished_state, read_settings, run_download, run_postprocess, pick_thumbnail_url,
+    settings_command, write_settings
+)
+from grab_engine import EngineError, LibraryEngine, get_engine, looks_like_playlist
+from grab_events import (
+    Call, Destination, EventBus, JobFinished, LogLine, Notice, PlaylistDone, PlaylistEntries,
+    PostprocessQueued, Progress, QueueChange
+)
+from grab_formats import FormatRules, media_formats
+from grab_import import UrlImport, clean_url, dropped_files, text_words
+from grab_log import JobLog, export_logs, prune_logs, search_logs
+from grab_metrics import MetricsStore, average, average_speed, format_duration, format_size
+from grab_postprocess import PostprocessPool
+from grab_retry import FAILURE_LABELS, RetryPolicy
+from grab_scheduler import BandwidthBudget, DiskSpace, HostLimits, expected_size, output_directory
+from grab_status import QueueStatus, StatusServer
+from grab_store import (
+    COMPLETED, DOWNLOADING, FAILED, FINISHED_STATES, PAUSED, QUEUED, STOPPED, QueueStore
+)
+from grab_trace import span, tracer
+
+# Startup is measured from the import of this module, see on_first_draw
+START_TIME = time.perf_counter()
+
+# How often worker events are applied to the widgets, per second
+UI_FRAME_RATE = 10
+
+# Lines kept in memory for the log view, the rest is only in the log files
+LOG_VIEW_LINES = 1000
+
+# Queue item states as shown in the queue view
+STATE_LABELS = {
+    QUEUED: "Queued",
+    DOWNLOADING: "Downloading",
+    PAUSED: "Paused",
+    COMPLETED: "Completed",
+    FAILED: "Failed",
+    STOPPED: "Stopped",
+}
+
+# Seconds between saving the byte count of a running download
+BYTES_SAVE_INTERVAL = 5
+
+# Rows added to the queue view per main loop iteration
+QUEUE_INSERT_BATCH = 1000
+
+# Above this many rows added or removed at once, the queue model is
+# detached from the view while it changes
+QUEUE_DETACH_ROWS = 100
+
+# Seconds between looks at the free space while items wait for it
+DISK_CHECK_SECONDS = 30
+
+
+def import_webkit():
+    """Import WebKit2, loading it is the slowest part of starting GRAB"""
+    gi.require_version('WebKit2', '4.0')
+    from gi.repository import WebKit2
+    return WebKit2
+
+class ThumbnailLoader:
+    """Fetch, decode and scale thumbnails on background threads
+    
+    Scaled images go through an in-memory cache of pixbufs and the
+    on-disk thumbnail cache, so a thumbnail is only downloaded and
+    decoded once.
+    """
+    def __init__(self, app, workers=2, memory_size=200):
+        self.app = app
+        self.memory = OrderedDict()  # (url, width, height) -> Pixbuf
+        self.memory_size = memory_size
+        self.pending = {}  # (url, width, height) -> callbacks waiting for it
+        self.requests = queue.Queue()
+        for _ in range(workers):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+    
+    def load(self, url, width, height, callback):
+        """Call callback(pixbuf) on the main thread once the thumbnail is ready"""
+        key = (url, width, height)
+        pixbuf = self.memory.get(key)
+        if pixbuf is not None:
+            self.memory.move_to_end(key)
+            callback(pixbuf)
+            return
+        
+        if key in self.pending:
+            self.pending[key].append(callback)
+            return
+        
+        self.pending[key] = [callback]
+        self.requests.put((key, not self.app.incognito_mode))
+    
+    def worker(self):
+        """Thread function that loads requested thumbnails"""
+        while True:
+            key, persist = self.requests.get()
+            url, width, height = key
+            pixbuf = None
+            try:
+                with span("thumbnail.load", url=url):
+                    data = self.app.thumbnail_cache.get(url, width, height)
+                    if data is None:
+                        data = self.scale(self.app.engine.fetch_thumbnail(url), width, height)
+                        if persist:
+                            self.app.thumbnail_cache.put(url, width, height, data)
+                    pixbuf = self.decode(data)
+            except Exception as e:
+                print(f"Error loading thumbnail: {e}")
+            
+            self.app.events.post(Call(self.finished, (key, pixbuf)))
+    
+    def finished(self, key, pixbuf):
+        """Hand a loaded thumbnail to everyone waiting for it"""
+        callbacks = self.pending.pop(key, [])
+        if pixbuf is None:
+            return
+        
+        self.memory[key] = pixbuf
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+        
+        for callback in callbacks:
+            callback(pixbuf)
+    
+    def scale(self, data, width, height):
+        """Scale image bytes to fit width x height and return them as PNG"""
+        pixbuf = self.decode(data)
+        ratio = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+        scaled = pixbuf.scale_simple(
+            max(1, int(pixbuf.get_width() * ratio)),
+            max(1, int(pixbuf.get_height() * ratio)),
+            GdkPixbuf.InterpType.BILINEAR
+        )
+        success, buffer = scaled.save_to_bufferv("png", [], [])
+        return bytes(buffer)
+    
+    def decode(self, data):
+        """Turn image bytes into a pixbuf"""
+        loader = GdkPixbuf.PixbufLoader()
+        loader.write(data)
+        loader.close()
+        return loader.get_pixbuf()
+    
+    def clear(self):
+        """Forget every thumbnail held in memory"""
+        self.memory.clear()
 
 class GRABApp:
     def __init__(self):
+        build_started = time.perf_counter()
+        
         # Create main window
         self.window = Gtk.Window(title="GRAB - Rips All Bits")
         self.window.set_default_size(1000, 800)
@@ -111,6 +269,30 @@ class GRABApp:
         settings_tab.set_margin_end(5)
         settings_scrolled.add(settings_tab)
         
+        # Statistics tab with scroll
+        statistics_scrolled = Gtk.ScrolledWindow()
+        statistics_scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        self.notebook.append_page(statistics_scrolled, Gtk.Label(label="Statistics"))
+        
+        statistics_tab = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        statistics_tab.set_margin_top(5)
+        statistics_tab.set_margin_bottom(5)
+        statistics_tab.set_margin_start(5)
+        statistics_tab.set_margin_end(5)
+        statistics_scrolled.add(statistics_tab)
+        self.statistics_page = statistics_scrolled
+        
+        # The cookie browser, the settings and the statistics are built when first shown
+        self.web_view = None
+        self.cookie_manager = None
+        self.theme_combo = None
+        self.lazy_pages = {
+            cookie_scrolled: (cookie_tab, self.build_cookie_tab),
+            settings_scrolled: (settings_tab, self.build_settings_tab),
+            statistics_scrolled: (statistics_tab, self.build_statistics_tab),
+        }
+        self.notebook.connect("switch-page", self.on_switch_page)
+        
         # URL entry
         url_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
         download_tab.pack_start(url_box, False, False, 0)
@@ -265,6 +447,25 @@ class GRABApp:
         self.embed_thumbnail.set_active(True)
         metadata_box.pack_start(self.embed_thumbnail, False, False, 0)
         
+        # Connections per download
+        connections_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        quality_box.pack_start(connections_box, False, False, 0)
+        
+        connections_label = Gtk.Label(label="Connections:")
+        connections_box.pack_start(connections_label, False, False, 0)
+        
+        self.fragments_spin = Gtk.SpinButton.new_with_range(1, 16, 1)
+        self.fragments_spin.set_value(self.concurrent_fragments)
+        self.fragments_spin.set_tooltip_text("DASH/HLS fragments downloaded at once, or aria2c connections")
+        connections_box.pack_start(self.fragments_spin, False, False, 0)
+        
+        self.aria2c_check = Gtk.CheckButton(label="Use aria2c")
+        self.aria2c_check.set_active(self.external_downloader == "aria2c")
+        if not downloader_available("aria2c"):
+            self.aria2c_check.set_sensitive(False)
+            self.aria2c_check.set_tooltip_text("aria2c is not installed")
+        connections_box.pack_start(self.aria2c_check, False, False, 0)
+        
         # Output path
         output_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
         download_tab.pack_start(output_box, False, False, 0)
@@ -312,48 +513,152 @@ class GRABApp:
         self.status_label = Gtk.Label(label="Ready")
         download_tab.pack_start(self.status_label, False, False, 0)
         
+        # Progress event counter
+        self.event_stats_label = Gtk.Label(label="")
+        self.event_stats_label.set_halign(Gtk.Align.END)
+        self.event_stats_label.get_style_context().add_class("dim-label")
+        download_tab.pack_start(self.event_stats_label, False, False, 0)
+        
         # Download queue
         queue_frame = Gtk.Frame(label="Download Queue")
         download_tab.pack_start(queue_frame, True, True, 0)
         
+        queue_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        queue_box.set_margin_top(5)
+        queue_box.set_margin_bottom(5)
+        queue_box.set_margin_start(5)
+        queue_box.set_margin_end(5)
+        queue_frame.add(queue_box)
+        
+        queue_tools_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_box.pack_start(queue_tools_box, False, False, 0)
+        
+        self.queue_search_entry = Gtk.SearchEntry()
+        self.queue_search_entry.set_placeholder_text("Filter queue by URL")
+        self.queue_search_entry.set_hexpand(True)
+        self.queue_search_entry.connect("search-changed", self.on_queue_filter_changed)
+        queue_tools_box.pack_start(self.queue_search_entry, True, True, 0)
+        
+        self.queue_state_combo = Gtk.ComboBoxText()
+        self.queue_state_combo.append("all", "All")
+        for state, label in STATE_LABELS.items():
+            self.queue_state_combo.append(state, label)
+        self.queue_state_combo.set_active(0)
+        self.queue_state_combo.connect("changed", self.on_queue_filter_changed)
+        queue_tools_box.pack_start(self.queue_state_combo, False, False, 0)
+        
+        move_top_button = Gtk.Button(label="Move to Top")
+        move_top_button.connect("clicked", self.on_move_queue_items, True)
+        queue_tools_box.pack_start(move_top_button, False, False, 0)
+        
+        move_bottom_button = Gtk.Button(label="Move to Bottom")
+        move_bottom_button.connect("clicked", self.on_move_queue_items, False)
+        queue_tools_box.pack_start(move_bottom_button, False, False, 0)
+        
+        remove_button = Gtk.Button(label="Remove")
+        remove_button.connect("clicked", self.on_remove_queue_items)
+        queue_tools_box.pack_start(remove_button, False, False, 0)
+        
         queue_scrolled = Gtk.ScrolledWindow()
         queue_scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         queue_scrolled.set_min_content_height(100)
-        queue_frame.add(queue_scrolled)
-        
-        self.queue_list = Gtk.ListStore(str, str, str)  # URL, status, progress
-        self.queue_treeview = Gtk.TreeView(model=self.queue_list)
+        queue_box.pack_start(queue_scrolled, True, True, 0)
+        
+        self.queue_list = self.new_queue_list()
+        self.queue_filter = self.queue_list.filter_new()
+        self.queue_filter.set_visible_func(self.queue_row_visible)
+        self.queue_treeview = Gtk.TreeView(model=self.queue_filter)
+        self.queue_treeview.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+        
+        # Thumbnail column, loaded when a row is first drawn
+        thumbnail_renderer = Gtk.CellRendererPixbuf()
+        thumbnail_renderer.set_fixed_size(64, 36)
+        thumbnail_column = Gtk.TreeViewColumn("", thumbnail_renderer)
+        thumbnail_column.set_cell_data_func(thumbnail_renderer, self.render_queue_thumbnail)
+        thumbnail_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        thumbnail_column.set_fixed_width(72)
+        self.queue_treeview.append_column(thumbnail_column)
         
         # URL column
         url_renderer = Gtk.CellRendererText()
         url_column = Gtk.TreeViewColumn("URL", url_renderer, text=0)
+        url_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        url_column.set_fixed_width(300)
         url_column.set_expand(True)
         self.queue_treeview.append_column(url_column)
         
         # Status column
         status_renderer = Gtk.CellRendererText()
         status_column = Gtk.TreeViewColumn("Status", status_renderer, text=1)
+        status_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        status_column.set_fixed_width(110)
         self.queue_treeview.append_column(status_column)
         
         # Progress column
         progress_renderer = Gtk.CellRendererText()
         progress_column = Gtk.TreeViewColumn("Progress", progress_renderer, text=2)
+        progress_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        progress_column.set_fixed_width(200)
         self.queue_treeview.append_column(progress_column)
         
+        # Rows all have the same height, so only visible rows are measured
+        self.queue_treeview.set_fixed_height_mode(True)
         queue_scrolled.add(self.queue_treeview)
         
+        # URLs and files listing URLs can be dropped on the queue
+        self.queue_treeview.drag_dest_set(Gtk.DestDefaults.ALL, [], Gdk.DragAction.COPY)
+        self.queue_treeview.drag_dest_add_uri_targets()
+        self.queue_treeview.drag_dest_add_text_targets()
+        self.queue_treeview.connect("drag-data-received", self.on_queue_drop)
+        
         # Log view
         log_frame = Gtk.Frame(label="Download Log")
         download_tab.pack_start(log_frame, True, True, 0)
         
+        log_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        log_box.set_margin_top(5)
+        log_box.set_margin_bottom(5)
+        log_box.set_margin_start(5)
+        log_box.set_margin_end(5)
+        log_frame.add(log_box)
+        
+        log_tools_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        log_box.pack_start(log_tools_box, False, False, 0)
+        
+        self.log_search_entry = Gtk.SearchEntry()
+        self.log_search_entry.set_placeholder_text("Search all download logs (press Enter)")
+        self.log_search_entry.set_hexpand(True)
+        self.log_search_entry.connect("activate", self.on_search_log)
+        self.log_search_entry.connect("search-changed", self.on_log_search_changed)
+        log_tools_box.pack_start(self.log_search_entry, True, True, 0)
+        
+        export_log_button = Gtk.Button(label="Export Log")
+        export_log_button.connect("clicked", self.on_export_log)
+        log_tools_box.pack_start(export_log_button, False, False, 0)
+        
         log_scrolled = Gtk.ScrolledWindow()
         log_scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         log_scrolled.set_min_content_height(100)
-        log_frame.add(log_scrolled)
-        
-        self.log_view = Gtk.TextView()
-        self.log_view.set_editable(False)
-        self.log_view.set_wrap_mode(Gtk.WrapMode.WORD)
+        log_box.pack_start(log_scrolled, True, True, 0)
+        
+        # The tree view only renders the visible rows of the log
+        self.log_store = Gtk.ListStore(str, str)  # job, line
+        self.log_view = Gtk.TreeView(model=self.log_store)
+        self.log_view.set_headers_visible(False)
+        
+        log_job_renderer = Gtk.CellRendererText()
+        log_job_column = Gtk.TreeViewColumn("Job", log_job_renderer, text=0)
+        log_job_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        log_job_column.set_fixed_width(60)
+        self.log_view.append_column(log_job_column)
+        
+        log_line_renderer = Gtk.CellRendererText()
+        log_line_column = Gtk.TreeViewColumn("Line", log_line_renderer, text=1)
+        log_line_column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        log_line_column.set_expand(True)
+        self.log_view.append_column(log_line_column)
+        
+        self.log_view.set_fixed_height_mode(True)
         log_scrolled.add(self.log_view)
         
         # Buttons
@@ -368,6 +673,24 @@ class GRABApp:
         queue_button.connect("clicked", self.on_add_to_queue)
         button_box.pack_start(queue_button, True, True, 0)
         
+        import_button = Gtk.Button(label="Import URLs")
+        import_button.set_tooltip_text("Queue the URLs listed in text files")
+        import_button.connect("clicked", self.on_import_file)
+        button_box.pack_start(import_button, True, True, 0)
+        
+        paste_button = Gtk.Button(label="Paste URLs")
+        paste_button.set_tooltip_text("Queue the URLs on the clipboard")
+        paste_button.connect("clicked", self.on_paste_urls)
+        button_box.pack_start(paste_button, True, True, 0)
+        
+        start_queue_button = Gtk.Button(label="Start Queue")
+        start_queue_button.connect("clicked", self.on_start_queue)
+        button_box.pack_start(start_queue_button, True, True, 0)
+        
+        clear_finished_button = Gtk.Button(label="Clear Finished")
+        clear_finished_button.connect("clicked", self.on_clear_finished)
+        button_box.pack_start(clear_finished_button, True, True, 0)
+        
         self.pause_button = Gtk.Button(label="Pause")
         self.pause_button.connect("clicked", self.on_pause)
         self.pause_button.set_sensitive(False)
@@ -383,6 +706,87 @@ class GRABApp:
         report_button.connect("clicked", self.on_report_error)
         button_box.pack_start(report_button, True, True, 0)
         
+        # Initialize variables
+        self.downloading = False
+        self.paused = False
+        self.active_downloads = []  # DownloadSlot for every running download
+        self.postprocessing = []  # Downloaded slots waiting for or in post-processing
+        self.postprocess = PostprocessPool()
+        self.events = EventBus(wakeup=self.schedule_event_dispatch)
+        self.subscribe_events()
+        self.log_lines = deque(maxlen=LOG_VIEW_LINES)  # (job, line) ring buffer
+        self.log_search_active = False
+        self.job_logs = OrderedDict()  # log file path -> job label, for this session
+        prune_logs()
+        self.temp_cookie_file = None
+        self.queue_store = QueueStore()
+        self.queue_status = QueueStatus(
+            self.queue_store,
+            jobs=lambda: list(self.active_downloads),
+            playlists=lambda: list(self.expansions),
+            paused=lambda: self.paused,
+            postprocessing=lambda: list(self.postprocessing)
+        )
+        self.queue_control = QueueControl(
+            self.queue_store,
+            self.control_command,
+            is_archived=lambda key: self.is_archived(key=key),
+            on_change=lambda action, data: self.events.post(QueueChange(action, data)),
+            private=lambda: self.incognito_mode
+        )
+        self.status_server = None
+        self.metrics = MetricsStore()
+        self.statistics_hours = []  # (hour, aggregate) shown in the throughput chart
+        self.queue_rows = {}  # Item id -> TreeIter in queue_list, valid until the row is removed
+        self.queue_load_source = None
+        self.queue_thumbnails_requested = set()
+        self.queue_filter_text = ""
+        self.queue_filter_state = None
+        self.expansions = []  # PlaylistExpansion for every playlist being listed
+        self.retry_source = None  # Timer for the next retry that comes due
+        self.queue_stopped = False  # Stop was pressed, nothing starts until the queue is started again
+        self.disk_source = None  # Timer for the next look at the free space
+        self.incognito_mode = False
+        self.media_url = ""
+        self.media_thumbnail_url = None
+        self.thumbnail_loader = ThumbnailLoader(self)
+        
+        self.start_status_server()
+        
+        # Connect signals
+        self.window.connect("destroy", self.on_destroy)
+        
+        tracer.record("startup.build_widgets", build_started, time.perf_counter())
+        
+        # Show all
+        with span("startup.show_all"):
+            self.window.show_all()
+        self.first_draw_handler = self.window.connect_after("draw", self.on_first_draw)
+        
+        GLib.idle_add(self.restore_queue)
+    
+    def on_first_draw(self, widget, cr):
+        """Report the time from startup until the window was first drawn"""
+        widget.disconnect(self.first_draw_handler)
+        now = time.perf_counter()
+        tracer.record("startup.first_window", START_TIME, now)
+        print(f"Time to first window: {(now - START_TIME) * 1000:.0f} ms")
+        return False
+    
+    def on_switch_page(self, notebook, page, page_num):
+        """Build a tab the first time it is shown"""
+        lazy_page = self.lazy_pages.pop(page, None)
+        if lazy_page:
+            tab, build = lazy_page
+            with span("startup.build_tab", tab=build.__name__):
+                build(tab)
+                tab.show_all()
+        
+        if page == self.statistics_page:
+            self.refresh_statistics()
+    
+    def build_cookie_tab(self, cookie_tab):
+        """Build the Cookie Extraction tab, which starts WebKit"""
         # Cookie extraction tab content
         cookie_extraction_label = Gtk.Label()
         cookie_extraction_label.set_markup("<b>Cookie Extraction</b>\n\nEnter a URL to open in the built-in browser. Login to the website, then extract the cookies.")
@@ -413,8 +817,10 @@ class GRABApp:
         web_scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         web_frame.add(web_scrolled)
         
+        WebKit2 = import_webkit()
         self.web_view = WebKit2.WebView()
         web_scrolled.add(self.web_view)
+        self.cookie_manager = self.web_view.get_website_data_manager().get_cookie_manager()
         
         # Cookie extraction buttons
         cookie_extract_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
@@ -427,7 +833,9 @@ class GRABApp:
         save_cookie_button = Gtk.Button(label="Save Cookies")
         save_cookie_button.connect("clicked", self.on_save_cookies)
         cookie_extract_box.pack_start(save_cookie_button, True, True, 0)
-        
+    
+    def build_settings_tab(self, settings_tab):
+        """Build the Settings tab"""
         # Settings tab content
         settings_label = Gtk.Label()
         settings_label.set_markup("<b>Application Settings</b>")
@@ -444,7 +852,6 @@ class GRABApp:
         self.theme_combo.append_text("Follow System")
         self.theme_combo.append_text("Light")
         self.theme_combo.append_text("Dark")
-        self.theme_combo.set_active(0 if self.theme_follows_system else (2 if self.use_dark_theme else 1))
         self.theme_combo.connect("changed", self.on_theme_changed)
         theme_box.pack_start(self.theme_combo, True, True, 0)
         
@@ -474,7 +881,6 @@ class GRABApp:
         self.default_format_combo.append_text("m4a")
         self.default_format_combo.append_text("flac")
         self.default_format_combo.append_text("best")
-        self.default_format_combo.set_active(self.default_format)
         format_box.pack_start(self.default_format_combo, True, True, 0)
         
         # Default media type
@@ -487,7 +893,6 @@ class GRABApp:
         self.default_media_type_combo = Gtk.ComboBoxText()
         self.default_media_type_combo.append_text("Video")
         self.default_media_type_combo.append_text("Audio")
-        self.default_media_type_combo.set_active(self.default_media_type)
         media_type_box.pack_start(self.default_media_type_combo, True, True, 0)
         
         # Default output path
@@ -498,14 +903,216 @@ class GRABApp:
         output_box.pack_start(output_label, False, False, 0)
         
         self.default_output_entry = Gtk.Entry()
-        self.default_output_entry.set_text(self.default_output_path)
         self.default_output_entry.set_hexpand(True)
         output_box.pack_start(self.default_output_entry, True, True, 0)
         
         output_button = Gtk.Button(label="Browse")
         output_button.connect("clicked", self.on_browse_default_output)
         output_box.pack_start(output_button, False, False, 0)
-        
+
+        # Default connections per download
+        default_connections_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        defaults_box.pack_start(default_connections_box, False, False, 0)
+
+        default_connections_label = Gtk.Label(label="Connections per Download:")
+        default_connections_box.pack_start(default_connections_label, False, False, 0)
+
+        self.default_fragments_spin = Gtk.SpinButton.new_with_range(1, 16, 1)
+        default_connections_box.pack_start(self.default_fragments_spin, False, False, 0)
+
+        self.default_aria2c_check = Gtk.CheckButton(label="Download with aria2c when installed")
+        default_connections_box.pack_start(self.default_aria2c_check, False, False, 0)
+
+        # Queue settings
+        queue_settings_frame = Gtk.Frame(label="Download Queue")
+        settings_tab.pack_start(queue_settings_frame, False, False, 0)
+
+        queue_settings_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        queue_settings_box.set_margin_top(5)
+        queue_settings_box.set_margin_bottom(5)
+        queue_settings_box.set_margin_start(5)
+        queue_settings_box.set_margin_end(5)
+        queue_settings_frame.add(queue_settings_box)
+
+        concurrent_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(concurrent_box, False, False, 0)
+
+        concurrent_label = Gtk.Label(label="Concurrent Downloads:")
+        concurrent_box.pack_start(concurrent_label, False, False, 0)
+
+        self.concurrent_spin = Gtk.SpinButton.new_with_range(1, 16, 1)
+        concurrent_box.pack_start(self.concurrent_spin, False, False, 0)
+
+        per_host_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(per_host_box, False, False, 0)
+
+        per_host_label = Gtk.Label(label="Downloads per Site (0 = no limit):")
+        per_host_box.pack_start(per_host_label, False, False, 0)
+
+        self.per_host_spin = Gtk.SpinButton.new_with_range(0, 16, 1)
+        per_host_box.pack_start(self.per_host_spin, False, False, 0)
+
+        bandwidth_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(bandwidth_box, False, False, 0)
+
+        bandwidth_label = Gtk.Label(label="Total Bandwidth (KiB/s, 0 = no limit):")
+        bandwidth_box.pack_start(bandwidth_label, False, False, 0)
+
+        self.bandwidth_spin = Gtk.SpinButton.new_with_range(0, 1000000, 100)
+        bandwidth_box.pack_start(self.bandwidth_spin, False, False, 0)
+
+        retries_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(retries_box, False, False, 0)
+
+        retries_label = Gtk.Label(label="Automatic Retries (0 = off):")
+        retries_box.pack_start(retries_label, False, False, 0)
+
+        self.retries_spin = Gtk.SpinButton.new_with_range(0, 10, 1)
+        self.retries_spin.set_tooltip_text(
+            "Downloads failing for network reasons or rate limits are tried again after a growing delay")
+        retries_box.pack_start(self.retries_spin, False, False, 0)
+
+        free_space_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(free_space_box, False, False, 0)
+
+        free_space_label = Gtk.Label(label="Free Space to Keep (MiB):")
+        free_space_box.pack_start(free_space_label, False, False, 0)
+
+        self.free_space_spin = Gtk.SpinButton.new_with_range(0, 1000000, 256)
+        self.free_space_spin.set_tooltip_text(
+            "Downloads wait while they would leave less free space on the disk they save to")
+        free_space_box.pack_start(self.free_space_spin, False, False, 0)
+
+        engine_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(engine_box, False, False, 0)
+
+        engine_label = Gtk.Label(label="yt-dlp Engine:")
+        engine_box.pack_start(engine_label, False, False, 0)
+
+        self.engine_combo = Gtk.ComboBoxText()
+        self.engine_combo.append("subprocess", "yt-dlp command (new process per action)")
+        self.engine_combo.append("library", "yt-dlp library (in-process)")
+        engine_box.pack_start(self.engine_combo, True, True, 0)
+
+        archive_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(archive_box, False, False, 0)
+
+        archive_label = Gtk.Label(label="Download Archive:")
+        archive_box.pack_start(archive_label, False, False, 0)
+
+        self.archive_entry = Gtk.Entry()
+        self.archive_entry.set_placeholder_text("Leave empty to download media again")
+        self.archive_entry.set_tooltip_text("Media listed in this yt-dlp archive file is skipped")
+        archive_box.pack_start(self.archive_entry, True, True, 0)
+
+        status_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        queue_settings_box.pack_start(status_box, False, False, 0)
+
+        status_label = Gtk.Label(label="Status Endpoint:")
+        status_box.pack_start(status_label, False, False, 0)
+
+        self.status_endpoint_entry = Gtk.Entry()
+        self.status_endpoint_entry.set_placeholder_text("Port, host:port or socket path; empty to disable")
+        self.status_endpoint_entry.set_tooltip_text(
+            "Serves the queue state as JSON at /status and for Prometheus at /metrics")
+        status_box.pack_start(self.status_endpoint_entry, True, True, 0)
+
+        self.control_api_check = Gtk.CheckButton(label="Accept queue commands")
+        self.control_api_check.set_tooltip_text(
+            "Let other programs add, cancel, pause and reorder downloads through the status endpoint")
+        status_box.pack_start(self.control_api_check, False, False, 0)
+
+        # Format rules
+        rules_frame = Gtk.Frame(label="Format Rules")
+        settings_tab.pack_start(rules_frame, False, False, 0)
+
+        rules_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        rules_box.set_margin_top(5)
+        rules_box.set_margin_bottom(5)
+        rules_box.set_margin_start(5)
+        rules_box.set_margin_end(5)
+        rules_frame.add(rules_box)
+
+        self.auto_quality_check = Gtk.CheckButton(label="Pick the format of queued downloads by these rules")
+        self.auto_quality_check.set_tooltip_text(
+            "Downloads added without choosing a quality get the best format the rules allow")
+        rules_box.pack_start(self.auto_quality_check, False, False, 0)
+
+        max_height_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        rules_box.pack_start(max_height_box, False, False, 0)
+
+        max_height_label = Gtk.Label(label="Highest Resolution:")
+        max_height_box.pack_start(max_height_label, False, False, 0)
+
+        self.max_height_combo = Gtk.ComboBoxText()
+        self.max_height_combo.append("0", "No limit")
+        for height in (2160, 1440, 1080, 720, 480, 360):
+            self.max_height_combo.append(str(height), f"{height}p")
+        max_height_box.pack_start(self.max_height_combo, True, True, 0)
+
+        codecs_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        rules_box.pack_start(codecs_box, False, False, 0)
+
+        codecs_label = Gtk.Label(label="Preferred Codecs:")
+        codecs_box.pack_start(codecs_label, False, False, 0)
+
+        self.codecs_entry = Gtk.Entry()
+        self.codecs_entry.set_placeholder_text("Most preferred first, e.g. av1, vp9, h264, opus")
+        self.codecs_entry.set_tooltip_text("Known codecs: av1, vp9, hevc, h264, opus, aac, vorbis, mp3, flac")
+        codecs_box.pack_start(self.codecs_entry, True, True, 0)
+
+        max_size_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        rules_box.pack_start(max_size_box, False, False, 0)
+
+        max_size_label = Gtk.Label(label="Largest Download (MiB, 0 = no limit):")
+        max_size_box.pack_start(max_size_label, False, False, 0)
+
+        self.max_size_spin = Gtk.SpinButton.new_with_range(0, 1000000, 100)
+        max_size_box.pack_start(self.max_size_spin, False, False, 0)
+
+        self.no_reencode_check = Gtk.CheckButton(label="Prefer formats that need no conversion")
+        self.no_reencode_check.set_tooltip_text(
+            "Formats whose codecs the chosen output format holds as they are come first")
+        rules_box.pack_start(self.no_reencode_check, False, False, 0)
+
+        # Cache settings
+        cache_frame = Gtk.Frame(label="Cache")
+        settings_tab.pack_start(cache_frame, False, False, 0)
+
+        cache_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        cache_box.set_margin_top(5)
+        cache_box.set_margin_bottom(5)
+        cache_box.set_margin_start(5)
+        cache_box.set_margin_end(5)
+        cache_frame.add(cache_box)
+
+        ttl_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        cache_box.pack_start(ttl_box, False, False, 0)
+
+        ttl_label = Gtk.Label(label="Keep media info for (hours):")
+        ttl_box.pack_start(ttl_label, False, False, 0)
+
+        self.cache_ttl_spin = Gtk.SpinButton.new_with_range(0, 720, 1)
+        ttl_box.pack_start(self.cache_ttl_spin, False, False, 0)
+
+        cache_size_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        cache_box.pack_start(cache_size_box, False, False, 0)
+
+        cache_size_label = Gtk.Label(label="Media info cache size (MB):")
+        cache_size_box.pack_start(cache_size_label, False, False, 0)
+
+        self.cache_size_spin = Gtk.SpinButton.new_with_range(1, 10000, 10)
+        cache_size_box.pack_start(self.cache_size_spin, False, False, 0)
+
+        thumbnail_size_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        cache_box.pack_start(thumbnail_size_box, False, False, 0)
+
+        thumbnail_size_label = Gtk.Label(label="Thumbnail cache size (MB):")
+        thumbnail_size_box.pack_start(thumbnail_size_label, False, False, 0)
+
+        self.thumbnail_cache_spin = Gtk.SpinButton.new_with_range(1, 10000, 10)
+        thumbnail_size_box.pack_start(self.thumbnail_cache_spin, False, False, 0)
+
         # Settings buttons
         settings_buttons_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
         settings_tab.pack_start(settings_buttons_box, False, False, 0)
@@ -522,49 +1129,170 @@ class GRABApp:
         restore_button.connect("clicked", self.on_restore_settings)
         settings_buttons_box.pack_start(restore_button, True, True, 0)
         
-        # Initialize variables
-        self.downloading = False
-        self.paused = False
-        self.process = None
-        self.temp_cookie_file = None
-        self.cookie_manager = self.web_view.get_website_data_manager().get_cookie_manager()
-        self.current_download_name = ""
-        self.download_queue = []
-        self.current_download_index = -1
-        self.incognito_mode = False
+        self.show_settings()
+    
+    def show_settings(self):
+        """Set the Settings tab widgets to the current settings"""
+        self.theme_combo.handler_block_by_func(self.on_theme_changed)
+        self.theme_combo.set_active(0 if self.theme_follows_system else (2 if self.use_dark_theme else 1))
+        self.theme_combo.handler_unblock_by_func(self.on_theme_changed)
+        self.default_format_combo.set_active(self.default_format)
+        self.default_media_type_combo.set_active(self.default_media_type)
+        self.default_output_entry.set_text(self.default_output_path)
+        self.default_fragments_spin.set_value(self.concurrent_fragments)
+        self.default_aria2c_check.set_active(self.external_downloader == "aria2c")
+        self.concurrent_spin.set_value(self.max_concurrent_downloads)
+        self.per_host_spin.set_value(self.max_per_host)
+        self.bandwidth_spin.set_value(self.bandwidth_limit_kib)
+        self.retries_spin.set_value(self.max_retries)
+        self.free_space_spin.set_value(self.min_free_space_mb)
+        self.engine_combo.set_active_id(self.engine_name)
+        self.archive_entry.set_text(self.download_archive)
+        self.status_endpoint_entry.set_text(self.status_endpoint)
+        self.control_api_check.set_active(self.control_api)
+        self.auto_quality_check.set_active(self.auto_quality)
+        if not self.max_height_combo.set_active_id(str(self.format_rules.max_height)):
+            self.max_height_combo.append(str(self.format_rules.max_height), f"{self.format_rules.max_height}p")
+            self.max_height_combo.set_active_id(str(self.format_rules.max_height))
+        self.codecs_entry.set_text(", ".join(self.format_rules.codecs))
+        self.max_size_spin.set_value(self.format_rules.max_size_mb)
+        self.no_reencode_check.set_active(self.format_rules.prefer_no_reencode)
+        self.cache_ttl_spin.set_value(self.info_cache_ttl_hours)
+        self.cache_size_spin.set_value(self.info_cache_max_mb)
+        self.thumbnail_cache_spin.set_value(self.thumbnail_cache_max_mb)
+    
+    def build_statistics_tab(self, statistics_tab):
+        """Build the Statistics tab, filled from the saved download metrics"""
+        statistics_label = Gtk.Label()
+        statistics_label.set_markup("<b>Download Statistics</b>")
+        statistics_tab.pack_start(statistics_label, False, False, 0)
+        
+        period_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        statistics_tab.pack_start(period_box, False, False, 0)
+        
+        period_label = Gtk.Label(label="Period:")
+        period_box.pack_start(period_label, False, False, 0)
+        
+        # Ids are the number of hours shown
+        self.statistics_period_combo = Gtk.ComboBoxText()
+        self.statistics_period_combo.append("24", "Last 24 hours")
+        self.statistics_period_combo.append("168", "Last 7 days")
+        self.statistics_period_combo.append("720", "Last 30 days")
+        self.statistics_period_combo.set_active(0)
+        self.statistics_period_combo.connect("changed", lambda combo: self.refresh_statistics())
+        period_box.pack_start(self.statistics_period_combo, False, False, 0)
+        
+        refresh_button = Gtk.Button(label="Refresh")
+        refresh_button.connect("clicked", lambda button: self.refresh_statistics())
+        period_box.pack_start(refresh_button, False, False, 0)
+        
+        self.statistics_summary_label = Gtk.Label(label="Loading...")
+        self.statistics_summary_label.set_xalign(0)
+        self.statistics_summary_label.set_line_wrap(True)
+        statistics_tab.pack_start(self.statistics_summary_label, False, False, 0)
+        
+        # Throughput chart
+        chart_frame = Gtk.Frame(label="Average Throughput per Hour")
+        statistics_tab.pack_start(chart_frame, False, False, 0)
+        
+        self.throughput_chart = Gtk.DrawingArea()
+        self.throughput_chart.set_size_request(-1, 160)
+        self.throughput_chart.connect("draw", self.on_draw_throughput)
+        chart_frame.add(self.throughput_chart)
+        
+        # Per site table
+        sites_frame = Gtk.Frame(label="Per Site")
+        statistics_tab.pack_start(sites_frame, True, True, 0)
+        
+        # Site, downloads, failed, data, average speed, peak speed,
+        # time to first byte, extraction time, post-processing time
+        self.site_statistics_list = Gtk.ListStore(str, int, int, str, str, str, str, str, str)
+        site_statistics_view = Gtk.TreeView(model=self.site_statistics_list)
+        titles = ["Site", "Downloads", "Failed", "Data", "Avg Speed", "Peak Speed",
+                  "First Byte", "Extraction", "Post-processing"]
+        for index, title in enumerate(titles):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=index)
+            column.set_sort_column_id(index)
+            site_statistics_view.append_column(column)
+        sites_frame.add(site_statistics_view)
+    
+    def refresh_statistics(self):
+        """Load the metrics of the chosen period in the background"""
+        hours = int(self.statistics_period_combo.get_active_id() or 24)
+        since = time.time() - hours * 3600
         
-        # Connect signals
-        self.window.connect("destroy", self.on_destroy)
+        thread = threading.Thread(target=self.statistics_thread, args=(since,))
+        thread.daemon = True
+        thread.start()
+    
+    def statistics_thread(self, since):
+        """Thread function to aggregate the saved metrics"""
+        total, hours, sites = self.metrics.summary(since)
+        self.events.post(Call(self.show_statistics, (since, total, hours, sites)))
+    
+    def show_statistics(self, since, total, hours, sites):
+        """Fill the Statistics tab"""
+        def seconds(value):
+            return f"{value:.1f} s" if value is not None else "-"
         
-        # Show all
-        self.window.show_all()
+        def speed(value):
+            return f"{format_size(value)}/s" if value else "-"
+        
+        if not total.get('jobs'):
+            self.statistics_summary_label.set_label("No downloads in this period")
+        else:
+            self.statistics_summary_label.set_label(
+                f"{total['jobs']} download(s), {total['failed']} failed, {format_size(total['bytes'])} downloaded. "
+                f"Average speed {speed(average_speed(total))}, peak {speed(total['peak'])}. "
+                f"Average time to first byte {seconds(average(total, 'first_byte'))}, "
+                f"extraction {seconds(average(total, 'extract'))}, "
+                f"post-processing {seconds(average(total, 'postprocess'))}."
+            )
+        
+        # One bar per hour, also for hours without downloads
+        speeds = {hour: average_speed(aggregate) or 0 for hour, aggregate in hours}
+        first_hour = int(since // 3600 * 3600)
+        self.statistics_hours = [
+            (hour, speeds.get(hour, 0)) for hour in range(first_hour, int(time.time()) + 1, 3600)
+        ]
+        self.throughput_chart.queue_draw()
+        
+        self.site_statistics_list.clear()
+        for site, aggregate in sites:
+            self.site_statistics_list.append([
+                site or "-", aggregate['jobs'], aggregate['failed'], format_size(aggregate['bytes']),
+                speed(average_speed(aggregate)), speed(aggregate['peak']),
+                seconds(average(aggregate, 'first_byte')), seconds(average(aggregate, 'extract')),
+                seconds(average(aggregate, 'postprocess'))
+            ])
+    
+    def on_draw_throughput(self, widget, cr):
+        """Draw the hourly average throughput as bars"""
+        width = widget.get_allocated_width()
+        height = widget.get_allocated_height()
+        color = widget.get_style_context().get_color(Gtk.StateFlags.NORMAL)
+        cr.set_source_rgba(color.red, color.green, color.blue, color.alpha)
+        
+        peak = max((speed for hour, speed in self.statistics_hours), default=0)
+        if not peak:
+            return False
+        
+        # Room for the scale label above the bars
+        chart_height = height - 16
+        bar_width = width / len(self.statistics_hours)
+        for index, (hour, speed) in enumerate(self.statistics_hours):
+            bar_height = chart_height * speed / peak
+            cr.rectangle(index * bar_width + 1, height - bar_height, max(bar_width - 2, 1), bar_height)
+        cr.fill()
+        
+        cr.move_to(2, 12)
+        cr.show_text(f"{format_size(peak)}/s")
+        return False
     
     def load_settings(self):
         """Load application settings"""
         self.settings_file = os.path.expanduser("~/.grab_settings.json")
-        default_settings = {
-            "use_dark_theme": True,
-            "theme_follows_system": True,
-            "default_format": 6,  # best
-            "default_media_type": 0,  # Video
-            "default_output_path": os.path.expanduser("~/Downloads"),
-            "sponsorblock": 0,  # None
-            "embed_metadata": True,
-            "embed_thumbnail": True
-        }
-        
-        if os.path.exists(self.settings_file):
-            try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
-                    # Merge with default settings in case new options were added
-                    for key, value in default_settings.items():
-                        if key not in settings:
-                            settings[key] = value
-            except:
-                settings = default_settings
-        else:
-            settings = default_settings
+        settings = read_settings(self.settings_file)
         
         # Apply settings
         self.use_dark_theme = settings["use_dark_theme"]
@@ -575,12 +1303,40 @@ class GRABApp:
         self.default_sponsorblock = settings["sponsorblock"]
         self.default_embed_metadata = settings["embed_metadata"]
         self.default_embed_thumbnail = settings["embed_thumbnail"]
+        self.max_concurrent_downloads = settings["max_concurrent_downloads"]
+        self.max_per_host = settings["max_per_host"]
+        self.host_limits = HostLimits(self.max_per_host, settings["host_limits"])
+        self.bandwidth_limit_kib = settings["bandwidth_limit_kib"]
+        self.bandwidth = BandwidthBudget(self.bandwidth_limit_kib * 1024, self.max_concurrent_downloads)
+        self.concurrent_fragments = settings["concurrent_fragments"]
+        self.external_downloader = settings["external_downloader"]
+        self.max_retries = settings["max_retries"]
+        self.retry_policy = RetryPolicy(self.max_retries)
+        self.min_free_space_mb = settings["min_free_space_mb"]
+        self.disk_space = DiskSpace(self.min_free_space_mb * 1024 * 1024)
+        self.auto_quality = settings["auto_quality"]
+        self.format_rules = FormatRules.from_dict(settings["format_rules"])
+        self.engine_name = settings["engine"]
+        self.engine = get_engine(self.engine_name)
+        self.info_cache_ttl_hours = settings["info_cache_ttl_hours"]
+        self.info_cache_max_mb = settings["info_cache_max_mb"]
+        self.info_cache = InfoCache(
+            ttl=self.info_cache_ttl_hours * 3600,
+            max_bytes=self.info_cache_max_mb * 1024 * 1024
+        )
+        self.thumbnail_cache_max_mb = settings["thumbnail_cache_max_mb"]
+        self.thumbnail_cache = ThumbnailCache(max_bytes=self.thumbnail_cache_max_mb * 1024 * 1024)
+        self.download_archive = settings["download_archive"]
+        self.archive = DownloadArchive(self.download_archive) if self.download_archive else None
+        self.status_endpoint = settings["status_endpoint"]
+        self.control_api = settings["control_api"]
         
         # Apply system theme detection if needed
         if self.theme_follows_system:
             try:
                 # Try to detect system dark mode (this is a simple approach)
-                output = subprocess.check_output(["gsettings", "get", "org.gnome.desktop.interface", "gtk-theme"]).decode().strip()
+                with span("settings.gsettings"):
+                    output = subprocess.check_output(["gsettings", "get", "org.gnome.desktop.interface", "gtk-theme"]).decode().strip()
                 self.use_dark_theme = "dark" in output.lower()
             except:
                 # Fallback to dark theme if detection fails
@@ -588,7 +1344,11 @@ class GRABApp:
     
     def save_settings(self):
         """Save application settings"""
-        settings = {
+        write_settings(self.settings_values(), self.settings_file)
+    
+    def settings_values(self):
+        """Return the current settings as saved in the settings file"""
+        return {
             "use_dark_theme": self.use_dark_theme,
             "theme_follows_system": self.theme_follows_system,
             "default_format": self.default_format,
@@ -596,14 +1356,25 @@ class GRABApp:
             "default_output_path": self.default_output_path,
             "sponsorblock": self.default_sponsorblock,
             "embed_metadata": self.default_embed_metadata,
-            "embed_thumbnail": self.default_embed_thumbnail
+            "embed_thumbnail": self.default_embed_thumbnail,
+            "max_concurrent_downloads": self.max_concurrent_downloads,
+            "max_per_host": self.max_per_host,
+            "host_limits": self.host_limits.overrides,
+            "bandwidth_limit_kib": self.bandwidth_limit_kib,
+            "concurrent_fragments": self.concurrent_fragments,
+            "external_downloader": self.external_downloader,
+            "max_retries": self.max_retries,
+            "min_free_space_mb": self.min_free_space_mb,
+            "auto_quality": self.auto_quality,
+            "format_rules": self.format_rules.to_dict(),
+            "engine": self.engine_name,
+            "info_cache_ttl_hours": self.info_cache_ttl_hours,
+            "info_cache_max_mb": self.info_cache_max_mb,
+            "thumbnail_cache_max_mb": self.thumbnail_cache_max_mb,
+            "download_archive": self.download_archive,
+            "status_endpoint": self.status_endpoint,
+            "control_api": self.control_api
         }
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(self.settings_file), exist_ok=True)
-        
-        with open(self.settings_file, 'w') as f:
-            json.dump(settings, f, indent=4)
     
     def load_history(self):
         """Load download history from file"""
@@ -758,7 +1529,8 @@ class GRABApp:
         settings.set_property("gtk-application-prefer-dark-theme", self.use_dark_theme)
         
         self.theme_button.set_label("🌙" if self.use_dark_theme else "☀️")
-        self.theme_combo.set_active(2 if self.use_dark_theme else 1)
+        if self.theme_combo is not None:
+            self.theme_combo.set_active(2 if self.use_dark_theme else 1)
         self.save_settings()
     
     def on_theme_changed(self, widget):
@@ -767,7 +1539,8 @@ class GRABApp:
         if selected == "Follow System":
             self.theme_follows_system = True
             try:
-                output = subprocess.check_output(["gsettings", "get", "org.gnome.desktop.interface", "gtk-theme"]).decode().strip()
+                with span("settings.gsettings"):
+                    output = subprocess.check_output(["gsettings", "get", "org.gnome.desktop.interface", "gtk-theme"]).decode().strip()
                 self.use_dark_theme = "dark" in output.lower()
             except:
                 self.use_dark_theme = True
@@ -817,9 +1590,15 @@ class GRABApp:
                     except:
                         pass
             
+            # Clear cached media information and thumbnails
+            self.info_cache.clear()
+            self.thumbnail_cache.clear()
+            self.thumbnail_loader.clear()
+            
             # Clear web data
             try:
-                self.web_view.get_website_data_manager().clear(
+                WebKit2 = import_webkit()
+                WebKit2.WebContext.get_default().get_website_data_manager().clear(
                     WebKit2.WebsiteDataTypes.ALL,
                     time.time() - 3600,  # Last hour
                     None, None, None
@@ -830,53 +1609,42 @@ class GRABApp:
             self.show_info("Cache cleared successfully")
     
     def fetch_media_info(self):
-        """Fetch media information for the current URL"""
+        """Fetch media information and qualities for the current URL"""
         url = self.url_entry.get_text().strip()
         if not url:
             return
         
+        cookie_file = self.cookie_entry.get_text().strip()
+        
         # Run in thread to avoid blocking UI
-        thread = threading.Thread(target=self.fetch_media_info_thread, args=(url,))
+        thread = threading.Thread(
+            target=self.fetch_media_info_thread,
+            args=(url, cookie_file, self.incognito_mode)
+        )
         thread.daemon = True
         thread.start()
     
-    def fetch_media_info_thread(self, url):
-        """Thread function to fetch media information"""
-        cookie_file = self.cookie_entry.get_text().strip()
-        cmd = [
-            'yt-dlp', 
-            '--dump-json',
-            '--no-warnings',
-            url
-        ]
-        
-        if cookie_file:
-            cmd.extend(['--cookies', cookie_file])
+    def fetch_media_info_thread(self, url, cookie_file, private):
+        """Thread function to fetch media information
         
+        A single extraction feeds both the media info panel and the quality
+        combo, and is kept in the info cache for repeat lookups.
+        """
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            stdout, stderr = process.communicate()
+            info = self.info_cache.get(url, cookie_file)
+            if info is None:
+                info = self.engine.extract_info(url, cookie_file)
+                if not private:
+                    self.info_cache.put(url, cookie_file, info)
             
-            if process.returncode != 0:
-                GLib.idle_add(self.show_error, f"Error fetching media info: {stderr}")
-                return
-            
-            # Parse JSON output
-            try:
-                info = json.loads(stdout)
-                GLib.idle_add(self.update_media_info, info)
-            except json.JSONDecodeError:
-                GLib.idle_add(self.show_error, "Failed to parse media information")
-                
+            self.events.post(Call(self.update_media_info, (info, url)))
+            self.events.post(Call(self.update_quality_combo, (media_formats(info),)))
+        except EngineError as e:
+            self.events.post(Notice(str(e), True))
         except Exception as e:
-            GLib.idle_add(self.show_error, f"Error: {str(e)}")
+            self.events.post(Notice(f"Error: {str(e)}", True))
     
-    def update_media_info(self, info):
+    def update_media_info(self, info, url):
         """Update media information display"""
         # Show the media info frame
         self.media_info_frame.show()
@@ -898,38 +1666,21 @@ class GRABApp:
             duration_str = "Unknown"
         self.media_duration.set_label(f"Duration: {duration_str}")
         
-        # Try to load thumbnail
-        thumbnail_url = info.get('thumbnail')
-        if thumbnail_url:
-            try:
-                # Download thumbnail to temp file
-                fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-                os.close(fd)
-                
-                thumbnail_cmd = [
-                    'yt-dlp',
-                    '-o', temp_path,
-                    '--write-thumbnail',
-                    '--convert-thumbnails', 'jpg',
-                    '--no-download',
-                    thumbnail_url
-                ]
-                
-                process = subprocess.Popen(
-                    thumbnail_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                process.wait()
-                
-                if os.path.exists(temp_path):
-                    pixbuf = GdkPixbuf.Pixbuf.new_from_file(temp_path)
-                    # Scale to reasonable size
-                    scaled_pixbuf = pixbuf.scale_simple(200, 150, GdkPixbuf.InterpType.BILINEAR)
-                    self.media_thumbnail.set_from_pixbuf(scaled_pixbuf)
-                    os.unlink(temp_path)
-            except Exception as e:
-                print(f"Error loading thumbnail: {e}")
+        # Load thumbnail in the background
+        self.media_url = url
+        self.media_thumbnail_url = pick_thumbnail_url(info)
+        self.media_thumbnail.clear()
+        if self.media_thumbnail_url:
+            thumbnail_url = self.media_thumbnail_url
+            self.thumbnail_loader.load(
+                thumbnail_url, 200, 150,
+                lambda pixbuf: self.on_media_thumbnail_loaded(thumbnail_url, pixbuf)
+            )
+    
+    def on_media_thumbnail_loaded(self, thumbnail_url, pixbuf):
+        """Show the thumbnail unless another URL was fetched meanwhile"""
+        if thumbnail_url == self.media_thumbnail_url:
+            self.media_thumbnail.set_from_pixbuf(pixbuf)
     
     def on_fetch_qualities(self, widget):
         """Fetch available qualities for the URL"""
@@ -938,73 +1689,12 @@ class GRABApp:
             self.show_error("Please enter a URL first")
             return
         
-        # Also fetch media info when fetching qualities
-        self.fetch_media_info()
-        
         # Clear previous qualities
         self.quality_combo.remove_all()
         self.quality_combo.append_text("Fetching qualities...")
         self.quality_combo.set_active(0)
         
-        # Run in thread to avoid blocking UI
-        thread = threading.Thread(target=self.fetch_qualities_thread, args=(url,))
-        thread.daemon = True
-        thread.start()
-    
-    def fetch_qualities_thread(self, url):
-        """Thread function to fetch qualities"""
-        cookie_file = self.cookie_entry.get_text().strip()
-        cmd = [
-            'yt-dlp', 
-            '--list-formats',
-            '--no-warnings',
-            url
-        ]
-        
-        if cookie_file:
-            cmd.extend(['--cookies', cookie_file])
-        
-        try:
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                GLib.idle_add(self.show_error, f"Error fetching qualities: {stderr}")
-                return
-            
-            # Parse formats
-            formats = []
-            lines = stdout.split('\n')
-            for line in lines:
-                if line.strip() and ' ' in line and not line.startswith('['):
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        format_id = parts[0]
-                        extension = parts[1]
-                        resolution = parts[2] if len(parts) > 2 else "unknown"
-                        
-                        # Try to find filesize if available
-                        filesize = ""
-                        for part in parts:
-                            if part.endswith('KiB') or part.endswith('MiB') or part.endswith('GiB'):
-                                filesize = part
-                                break
-                        
-                        format_str = f"{format_id} - {resolution} - {extension}"
-                        if filesize:
-                            format_str += f" - {filesize}"
-                        formats.append((format_id, format_str))
-            
-            # Update UI on main thread
-            GLib.idle_add(self.update_quality_combo, formats)
-            
-        except Exception as e:
-            GLib.idle_add(self.show_error, f"Error: {str(e)}")
+        self.fetch_media_info()
     
     def update_quality_combo(self, formats):
         """Update quality combo box with fetched formats"""
@@ -1015,15 +1705,24 @@ class GRABApp:
             self.quality_combo.set_active(0)
             return
         
+        # The format rules pick, first when they are the default
+        format_spec = self.format_rules.format_spec(
+            formats, self.media_type_combo.get_active_text().lower(), self.format_combo.get_active_text())
+        auto_text = "auto - By format rules" + (f" ({format_spec})" if format_spec else "")
+        if self.auto_quality:
+            self.quality_combo.append_text(auto_text)
+        
         # Add best and worst options
-        self.quality_combo.append_text("best - Best quality (default)")
+        self.quality_combo.append_text("best - Best quality" + ("" if self.auto_quality else " (default)"))
         self.quality_combo.append_text("worst - Worst quality")
+        if not self.auto_quality:
+            self.quality_combo.append_text(auto_text)
         
         # Add all formats
-        for format_id, format_str in formats:
-            self.quality_combo.append_text(format_str)
+        for media_format in formats:
+            self.quality_combo.append_text(media_format.label())
         
-        # Select best quality by default
+        # Select the default
         self.quality_combo.set_active(0)
     
     def on_add_to_queue(self, widget):
@@ -1033,33 +1732,583 @@ class GRABApp:
             self.show_error("Please enter a URL first")
             return
         
-        # Add to queue list
-        self.queue_list.append([url, "Queued", "0%"])
-        self.download_queue.append(url)
+        if self.is_archived(url):
+            self.show_info(f"Already downloaded, skipping: {url}")
+            return
+        
+        # Queued items keep the options chosen now
+        cmd = self.build_download_command(url, default_quality="auto" if self.auto_quality else "best")
+        if cmd is None:
+            return
         
+        if self.is_playlist(url):
+            self.expand_playlist(url, cmd)
+            return
+        
+        self.add_queue_item(url, cmd)
         self.show_info(f"Added to queue: {url}")
     
+    def on_import_file(self, widget):
+        """Queue the URLs listed in text files"""
+        dialog = Gtk.FileChooserDialog(
+            title="Import URLs",
+            parent=self.window,
+            action=Gtk.FileChooserAction.OPEN
+        )
+        dialog.add_buttons(
+            Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+            Gtk.STOCK_OPEN, Gtk.ResponseType.OK
+        )
+        dialog.set_select_multiple(True)
+        
+        # Add filter for text files
+        filter_text = Gtk.FileFilter()
+        filter_text.set_name("Text files")
+        filter_text.add_mime_type("text/plain")
+        dialog.add_filter(filter_text)
+        
+        response = dialog.run()
+        paths = dialog.get_filenames() if response == Gtk.ResponseType.OK else []
+        dialog.destroy()
+        
+        if paths:
+            self.import_urls(paths=paths)
+    
+    def on_paste_urls(self, widget):
+        """Queue the URLs on the clipboard"""
+        clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        clipboard.request_text(self.on_clipboard_text, None)
+    
+    def on_clipboard_text(self, clipboard, text, data):
+        """Import the clipboard text once it has been received"""
+        if not text or not text.strip():
+            self.show_error("The clipboard has no text")
+            return
+        self.import_urls(text=text)
+    
+    def on_queue_drop(self, widget, context, x, y, selection, info, timestamp):
+        """Queue URLs, or the URLs listed in files, dropped on the queue"""
+        uris = selection.get_uris()
+        if uris:
+            paths, others = dropped_files(uris)
+            self.import_urls(text="\n".join(others), paths=paths)
+        else:
+            self.import_urls(text=selection.get_text() or "")
+    
+    def import_urls(self, text="", paths=()):
+        """Check and queue many URLs in the background with the current options"""
+        # The URL is the last argument, so one command serves every URL
+        template = self.build_download_command("", default_quality="auto" if self.auto_quality else "best")
+        if template is None:
+            return
+        
+        self.status_label.set_label("Importing URLs...")
+        thread = threading.Thread(
+            target=self.import_urls_thread,
+            args=(text, list(paths), template, self.incognito_mode)
+        )
+        thread.daemon = True
+        thread.start()
+    
+    def import_urls_thread(self, text, paths, template, private):
+        """Read, check and save imported URLs, then show them from the main loop"""
+        archive = self.archive
+        
+        def is_archived(url):
+            key = url_archive_key(url)
+            return archive is not None and key is not None and key in archive
+        
+        with span("queue.import"):
+            texts = [text]
+            for path in paths:
+                try:
+                    with open(path, 'r', errors='replace') as f:
+                        texts.append(f.read())
+                except OSError as e:
+                    self.events.post(Notice(f"Error reading {path}: {e}", True))
+            
+            # Only the imported URLs are looked up in the journal
+            submitted = (clean_url(word) for part in texts for word in text_words(part))
+            url_import = UrlImport(self.queue_store.pending_among(url for url in submitted if url), is_archived)
+            for part in texts:
+                url_import.add_text(part)
+            
+            # Playlists are listed into one item per entry like single adds
+            playlists = [url for url in url_import.urls if looks_like_playlist(url)]
+            entries = []
+            for url in url_import.urls:
+                if looks_like_playlist(url):
+                    continue
+                options = {"cmd": template[:-1] + [url]}
+                key = url_archive_key(url)
+                if key:
+                    options["archive_key"] = key
+                entries.append((url, options))
+            items = self.queue_store.add_many(entries, private=private)
+        
+        self.events.post(Call(self.urls_imported, (url_import, items, playlists, template)))
+    
+    def urls_imported(self, url_import, items, playlists, template):
+        """Show imported items and start listing imported playlists"""
+        self.insert_queue_rows(items)
+        for url in playlists:
+            self.expand_playlist(url, template[:-1] + [url])
+        
+        if not self.active_downloads:
+            self.status_label.set_label(url_import.summary())
+        return False
+    
+    def add_queue_item(self, url, cmd, state=QUEUED):
+        """Save a new item in the queue journal and show it, return its id"""
+        options = {"cmd": cmd}
+        # Reuse the thumbnail of the media shown in the info panel
+        if url == self.media_url and self.media_thumbnail_url:
+            options["thumbnail"] = self.media_thumbnail_url
+        key = self.url_archive_key(url)
+        if key:
+            options["archive_key"] = key
+        expected_bytes = self.expected_bytes(url, cmd)
+        if expected_bytes:
+            options["expected_bytes"] = expected_bytes
+        
+        item_id = self.queue_store.add(url, options, private=self.incognito_mode, state=state)
+        self.append_queue_row(self.queue_store.get(item_id))
+        return item_id
+    
+    def url_archive_key(self, url):
+        """Return the download archive key of a URL from the info cache or the URL"""
+        cookie_file = self.cookie_entry.get_text().strip() or None
+        info = self.info_cache.get(url, cookie_file)
+        if info is not None and info.get('_type') not in ('playlist', 'multi_video'):
+            return archive_key(info)
+        return url_archive_key(url)
+    
+    def expected_bytes(self, url, cmd):
+        """Estimate the size of a download from the info cache, or None"""
+        cookie_file = self.cookie_entry.get_text().strip() or None
+        info = self.info_cache.get(url, cookie_file)
+        if info is None or info.get('_type') in ('playlist', 'multi_video'):
+            return None
+        format_spec = cmd[cmd.index('-f') + 1] if '-f' in cmd else 'bestaudio/best'
+        return expected_size(info, format_spec)
+    
+    def is_archived(self, url=None, key=None):
+        """Whether a URL or archive key is listed in the download archive"""
+        if self.archive is None:
+            return False
+        key = key or self.url_archive_key(url)
+        return key is not None and key in self.archive
+    
+    def is_playlist(self, url):
+        """Whether a URL should be expanded into one queue item per entry"""
+        cookie_file = self.cookie_entry.get_text().strip() or None
+        info = self.info_cache.get(url, cookie_file)
+        if info is not None:
+            return info.get('_type') in ('playlist', 'multi_video')
+        return looks_like_playlist(url)
+    
+    def expand_playlist(self, url, cmd, start=False):
+        """List a playlist in the background, queueing entries as they are found"""
+        expansion = PlaylistExpansion(url, cmd, start)
+        expansion.private = self.incognito_mode
+        self.expansions.append(expansion)
+        cookie_file = self.cookie_entry.get_text().strip() or None
+        
+        self.status_label.set_label(f"Listing playlist: {url}")
+        self.update_download_controls()
+        
+        thread = threading.Thread(target=self.expand_playlist_thread, args=(expansion, cookie_file))
+        thread.daemon = True
+        thread.start()
+    
+    def expand_playlist_thread(self, expansion, cookie_file):
+        """List playlist entries and save them to the queue journal in batches"""
+        error = expand_playlist(
+            self.engine, expansion, self.queue_store,
+            lambda items: self.events.post(PlaylistEntries(expansion, items)),
+            lambda key: self.is_archived(key=key),
+            cookie_file
+        )
+        self.events.post(PlaylistDone(expansion, error))
+    
+    def playlist_entries_added(self, expansion, items):
+        """Show newly listed entries and start them if requested"""
+        expansion.found += len(items)
+        for item in items:
+            self.append_queue_row(item)
+        
+        if not expansion.stopped:
+            self.status_label.set_label(
+                f"Listing playlist: {expansion.found} entries found, {expansion.skipped} already downloaded")
+            if expansion.start:
+                self.start_queue()
+        return False
+    
+    def playlist_expanded(self, expansion, error):
+        """Report the end of a playlist listing"""
+        if expansion in self.expansions:
+            self.expansions.remove(expansion)
+        self.update_download_controls()
+        
+        if expansion.stopped:
+            return False
+        if error:
+            self.show_error(error)
+        elif expansion.found == 0 and expansion.skipped:
+            self.show_info(f"All {expansion.skipped} entries were downloaded before")
+        elif expansion.found == 0:
+            self.show_error("No downloadable entries found")
+        elif not self.active_downloads:
+            self.status_label.set_label(
+                f"Added {expansion.found} entries to the queue, skipped {expansion.skipped} already downloaded")
+        return False
+    
+    def restore_queue(self):
+        """Load the saved queue and report downloads interrupted last time"""
+        self.queue_store.recover()
+        self.import_unfinished_downloads()
+        self.load_queue_rows()
+        
+        interrupted = self.queue_store.count(PAUSED)
+        waiting = self.queue_store.count(QUEUED)
+        if interrupted:
+            self.paused = True
+            self.status_label.set_label(
+                f"{interrupted} interrupted download(s), press Resume to continue them")
+        elif waiting:
+            self.status_label.set_label(
+                f"{waiting} item(s) waiting in the queue, press Start Queue to begin")
+        self.update_download_controls()
+        return False
+    
+    def import_unfinished_downloads(self):
+        """Move downloads saved by older versions into the queue journal"""
+        unfinished_file = os.path.expanduser("~/.grab/unfinished.json")
+        if not os.path.exists(unfinished_file):
+            return
+        
+        try:
+            with open(unfinished_file, 'r') as f:
+                for item in json.load(f):
+                    self.queue_store.add(item["url"], {"cmd": item["cmd"]}, state=PAUSED)
+            os.unlink(unfinished_file)
+        except (OSError, ValueError, KeyError) as e:
+            self.show_error(f"Cannot import unfinished downloads: {e}")
+    
+    def new_queue_list(self):
+        """Return an empty model of the queue view"""
+        # URL, status, progress, thumbnail, item id, thumbnail URL, state
+        return Gtk.ListStore(str, str, str, GdkPixbuf.Pixbuf, int, str, str)
+    
+    def load_queue_rows(self):
+        """Fill the queue view from the journal in batches from the main loop
+        
+        The rows go into a new model that the view shows once it is full.
+        """
+        if self.queue_load_source:
+            GLib.source_remove(self.queue_load_source)
+        
+        self.queue_list = self.new_queue_list()
+        self.queue_rows.clear()
+        self.queue_thumbnails_requested.clear()
+        batches = self.queue_store.iter_items(batch_size=QUEUE_INSERT_BATCH)
+        
+        def load_batch():
+            batch = next(batches, None)
+            if batch is None:
+                self.queue_load_source = None
+                self.show_queue_list(self.hide_queue_list())
+                return False
+            self.append_queue_rows(batch)
+            return True
+        
+        self.queue_load_source = GLib.idle_add(load_batch)
+    
+    def hide_queue_list(self):
+        """Detach the queue model from the view, return the view state for show_queue_list
+        
+        Without a view and a filter, rows are added and removed without
+        either of them handling every row. The state is the selected item
+        ids, the item id at the cursor and the scroll position.
+        """
+        selected = self.selected_queue_ids()
+        cursor, column = self.queue_treeview.get_cursor()
+        cursor_id = self.queue_filter[cursor][4] if cursor is not None else None
+        scroll = self.queue_treeview.get_vadjustment().get_value()
+        self.queue_treeview.set_model(None)
+        # Dropped, since it would still follow every change of its model
+        self.queue_filter = None
+        return selected, cursor_id, scroll
+    
+    def show_queue_list(self, view_state):
+        """Show queue_list in the view again, restoring the state hide_queue_list returned"""
+        selected, cursor_id, scroll = view_state
+        self.queue_filter = self.queue_list.filter_new()
+        self.queue_filter.set_visible_func(self.queue_row_visible)
+        self.queue_treeview.set_model(self.queue_filter)
+        
+        def view_path(item_id):
+            tree_iter = self.queue_rows.get(item_id)
+            if tree_iter is None:
+                return None
+            return self.queue_filter.convert_child_path_to_path(self.queue_list.get_path(tree_iter))
+        
+        cursor = view_path(cursor_id)
+        if cursor is not None:
+            self.queue_treeview.set_cursor(cursor, None, False)
+        selection = self.queue_treeview.get_selection()
+        selection.unselect_all()
+        for item_id in selected:
+            path = view_path(item_id)
+            if path is not None:
+                selection.select_path(path)
+        # The view knows its height once it has measured the new rows
+        GLib.idle_add(self.queue_treeview.get_vadjustment().set_value, scroll)
+    
+    def append_queue_row(self, item):
+        """Add a row for a queue item unless it is already shown"""
+        if item.id in self.queue_rows:
+            return
+        
+        progress = "100%" if item.state == COMPLETED else "0%"
+        # ListStore iters stay valid while their row exists, wherever it moves
+        self.queue_rows[item.id] = self.queue_list.append([
+            item.url, STATE_LABELS.get(item.state, item.state), progress, None,
+            item.id, item.options.get("thumbnail") or "", item.state
+        ])
+    
+    def append_queue_rows(self, items):
+        """Add rows for many items, with the model detached from the view for large batches"""
+        # While the journal loads, queue_list is not shown yet
+        detach = len(items) > QUEUE_DETACH_ROWS and not self.queue_load_source
+        view_state = self.hide_queue_list() if detach else None
+        for item in items:
+            self.append_queue_row(item)
+        if detach:
+            self.show_queue_list(view_state)
+    
+    def insert_queue_rows(self, items):
+        """Add rows for many items in batches from the main loop"""
+        batches = (items[i:i + QUEUE_INSERT_BATCH] for i in range(0, len(items), QUEUE_INSERT_BATCH))
+        
+        def insert_batch():
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            self.append_queue_rows(batch)
+            return True
+        
+        if items:
+            GLib.idle_add(insert_batch)
+    
+    def remove_queue_rows(self, item_ids):
+        """Remove the rows of items, with the model detached from the view for many"""
+        removed = set(item_ids)
+        self.queue_thumbnails_requested -= removed
+        detach = len(removed) > QUEUE_DETACH_ROWS and not self.queue_load_source
+        view_state = self.hide_queue_list() if detach else None
+        for item_id in removed:
+            tree_iter = self.queue_rows.pop(item_id, None)
+            if tree_iter is not None:
+                self.queue_list.remove(tree_iter)
+        if detach:
+            self.show_queue_list(view_state)
+    
+    def set_queue_row(self, item_id, state=None, progress=None, status=None):
+        """Update the state, status text or progress of an item's row
+
+        The status text defaults to the label of the new state.
+        """
+        tree_iter = self.queue_rows.get(item_id)
+        if tree_iter is None:
+            return
+        
+        if state is not None:
+            self.queue_list.set_value(tree_iter, 6, state)
+            status = status or STATE_LABELS[state]
+        if status is not None:
+            self.queue_list.set_value(tree_iter, 1, status)
+        if progress is not None:
+            self.queue_list.set_value(tree_iter, 2, progress)
+    
+    def queue_row_visible(self, model, tree_iter, data):
+        """Filter function of the queue view"""
+        if self.queue_filter_state and model.get_value(tree_iter, 6) != self.queue_filter_state:
+            return False
+        url = model.get_value(tree_iter, 0) or ""
+        return not self.queue_filter_text or self.queue_filter_text in url.lower()
+    
+    def on_queue_filter_changed(self, widget):
+        """Show only the queue rows matching the search text and state"""
+        self.queue_filter_text = self.queue_search_entry.get_text().strip().lower()
+        state = self.queue_state_combo.get_active_id()
+        self.queue_filter_state = state if state != "all" else None
+        self.queue_filter.refilter()
+    
+    def selected_queue_ids(self):
+        """Return the item ids of the selected rows in queue order"""
+        model, paths = self.queue_treeview.get_selection().get_selected_rows()
+        return [model[path][4] for path in paths]
+    
+    def on_move_queue_items(self, widget, to_front):
+        """Move the selected items to the front or back of the queue"""
+        item_ids = self.selected_queue_ids()
+        if not item_ids:
+            return
+        
+        self.queue_store.move(item_ids, to_front)
+        self.move_queue_rows(item_ids, to_front)
+    
+    def move_queue_rows(self, item_ids, to_front):
+        """Move the rows of items to the top or bottom of the queue view"""
+        iters = [self.queue_rows[item_id] for item_id in item_ids if item_id in self.queue_rows]
+        if to_front:
+            # Without a position, move_after() moves to the start
+            for tree_iter in reversed(iters):
+                self.queue_list.move_after(tree_iter, None)
+        else:
+            # and move_before() to the end
+            for tree_iter in iters:
+                self.queue_list.move_before(tree_iter, None)
+    
+    def on_remove_queue_items(self, widget):
+        """Remove the selected items, except running downloads"""
+        selected = self.selected_queue_ids()
+        active_ids = {slot.item_id for slot in self.active_downloads + self.postprocessing}
+        item_ids = [item_id for item_id in selected if item_id not in active_ids]
+        if len(item_ids) < len(selected):
+            self.status_label.set_label("Stop running downloads before removing them")
+        if not item_ids:
+            return
+        
+        self.queue_store.delete_many(item_ids)
+        self.remove_queue_rows(item_ids)
+    
+    def render_queue_thumbnail(self, column, renderer, model, tree_iter, data):
+        """Show a row's thumbnail, requesting it the first time the row is drawn"""
+        pixbuf = model.get_value(tree_iter, 3)
+        renderer.set_property("pixbuf", pixbuf)
+        
+        thumbnail_url = model.get_value(tree_iter, 5)
+        item_id = model.get_value(tree_iter, 4)
+        if pixbuf is None and thumbnail_url and item_id not in self.queue_thumbnails_requested:
+            self.queue_thumbnails_requested.add(item_id)
+            # Not while drawing, the callback changes the model
+            GLib.idle_add(
+                self.thumbnail_loader.load, thumbnail_url, 64, 36,
+                lambda pixbuf: self.set_queue_thumbnail(item_id, pixbuf)
+            )
+    
+    def set_queue_thumbnail(self, item_id, pixbuf):
+        """Put a loaded thumbnail into an item's row"""
+        tree_iter = self.queue_rows.get(item_id)
+        if tree_iter is not None:
+            self.queue_list.set_value(tree_iter, 3, pixbuf)
+    
+    def on_start_queue(self, widget):
+        """Start downloading queued items"""
+        if self.paused:
+            self.on_pause(widget)
+        elif self.queue_store.count(QUEUED) == 0:
+            self.show_error("There are no queued items")
+        else:
+            self.start_queue()
+    
+    def on_clear_finished(self, widget):
+        """Remove completed, failed and stopped items from the queue"""
+        self.remove_queue_rows(self.queue_store.delete_finished())
+    
+    def start_queue(self):
+        """Start queued downloads, also after Stop"""
+        self.queue_stopped = False
+        self.process_queue()
+    
     def process_queue(self):
-        """Process the download queue"""
-        if not self.download_queue or self.downloading:
+        """Start queued downloads until every download slot is busy"""
+        if self.paused or self.queue_stopped:
             return
         
-        if self.current_download_index + 1 < len(self.download_queue):
-            self.current_download_index += 1
-            next_url = self.download_queue[self.current_download_index]
-            self.url_entry.set_text(next_url)
+        active_ids = {slot.item_id for slot in self.active_downloads}
+        while len(self.active_downloads) < self.max_concurrent_downloads:
+            # Items of sites that already use all their slots are passed over
+            busy_hosts = self.host_limits.saturated(slot.url for slot in self.active_downloads)
+            disk_check = self.disk_space.check(self.active_downloads + self.postprocessing)
+            held = []
+            item = self.queue_store.next_queued(exclude=active_ids, skip_hosts=busy_hosts,
+                                                accept=lambda queued: self.may_start(queued, disk_check, held))
+            if item is None:
+                self.schedule_retry_check()
+                self.schedule_disk_check(held)
+                return
             
-            # Update queue status
-            tree_iter = self.queue_list.get_iter_from_string(str(self.current_download_index))
-            self.queue_list.set_value(tree_iter, 1, "Downloading")
+            # Downloaded meanwhile, for example as part of another playlist
+            if self.is_archived(key=item.options.get("archive_key")):
+                self.queue_store.set_state(item.id, COMPLETED)
+                self.set_queue_row(item.id, COMPLETED, "100%", status="Already downloaded")
+                continue
             
-            # Start download
-            self.on_download(None)
+            self.start_download(item)
+            active_ids.add(item.id)
+    
+    def may_start(self, item, disk_check, held):
+        """Whether a queued item fits on the disk, adding (item, missing bytes) to held if not"""
+        missing = disk_check.missing(item.cmd, item.options.get("expected_bytes"))
+        if missing:
+            held.append((item, missing))
+            status = f"Waiting for disk space, {format_size(missing)} short"
+            tree_iter = self.queue_rows.get(item.id)
+            if tree_iter is not None and self.queue_list.get_value(tree_iter, 1) != status:
+                self.set_queue_row(item.id, status=status)
+        return not missing
+    
+    def missing_space(self, item):
+        """Return the free space a queued item lacks to start, 0 when it fits"""
+        return self.disk_space.missing(item.cmd, item.options.get("expected_bytes"),
+                                       self.active_downloads + self.postprocessing)
+    
+    def schedule_disk_check(self, held):
+        """Look at the free space again later while queued items wait for it
+        
+        held lists (item, missing bytes) of the items the last pass over
+        the queue held back for space.
+        """
+        if self.disk_source or not held:
+            return
+        
+        item, missing = held[0]
+        if not self.active_downloads:
+            self.status_label.set_label(f"Waiting for disk space in {output_directory(item.cmd)}, "
+                                        f"{format_size(missing)} more needed")
+        self.disk_source = GLib.timeout_add_seconds(DISK_CHECK_SECONDS, self.on_disk_check)
+    
+    def on_disk_check(self):
+        """Start the items that fit on the disk by now"""
+        self.disk_source = None
+        self.process_queue()
+        return False
+    
+    def schedule_retry_check(self):
+        """Look for queued items again when the next retry comes due"""
+        if self.retry_source:
+            GLib.source_remove(self.retry_source)
+            self.retry_source = None
+        
+        waiting, retry_at = self.queue_store.pending_retries()
+        if waiting:
+            delay = max(1, math.ceil(retry_at - time.time()))
+            self.retry_source = GLib.timeout_add_seconds(delay, self.on_retry_due)
+    
+    def on_retry_due(self):
+        """Start the items whose retry has come due"""
+        self.retry_source = None
+        self.process_queue()
+        return False
     
     def on_download(self, widget):
         """Start download process"""
-        if self.downloading and not self.paused:
-            self.show_error("Download already in progress")
+        # If resuming a paused download
+        if self.paused:
+            self.on_pause(widget)
             return
         
         url = self.url_entry.get_text().strip()
@@ -1067,25 +2316,44 @@ class GRABApp:
             self.show_error("Please enter a URL")
             return
         
-        # If resuming a paused download
-        if self.paused:
-            self.paused = False
-            self.pause_button.set_label("Pause")
-            self.status_label.set_label("Resuming download...")
+        if len(self.active_downloads) >= self.max_concurrent_downloads:
+            self.show_error("All download slots are busy")
             return
         
-        # Save to history (unless in incognito mode)
-        self.save_history(url)
+        if self.is_archived(url):
+            self.show_info(f"Already downloaded, skipping: {url}")
+            return
         
-        # Get selected quality
-        if self.quality_combo.get_active() < 0:
-            self.show_error("Please select a quality")
+        cmd = self.build_download_command(url)
+        if cmd is None:
             return
-            
-        quality_text = self.quality_combo.get_active_text()
+        
+        # Playlist entries are queued separately and downloaded as they are found
+        if self.is_playlist(url):
+            self.expand_playlist(url, cmd, start=True)
+            return
+        
+        # Direct downloads are journaled like queue items, so they survive a crash
+        item_id = self.add_queue_item(url, cmd)
+        item = self.queue_store.get(item_id)
+        missing = self.missing_space(item)
+        if missing:
+            self.set_queue_row(item.id, status=f"Waiting for disk space, {format_size(missing)} short")
+            self.show_info(f"Not enough disk space for this download yet ({format_size(missing)} short), "
+                           f"it waits in the queue")
+            self.schedule_disk_check([(item, missing)])
+            return
+        self.start_download(item)
+    
+    def build_download_command(self, url, default_quality=None):
+        """Build the yt-dlp command for a URL from the current options"""
+        # Get selected quality
+        quality_text = self.quality_combo.get_active_text() if self.quality_combo.get_active() >= 0 else None
+        if not quality_text:
+            quality_text = default_quality
         if not quality_text:
             self.show_error("Please select a quality")
-            return
+            return None
         
         # Parse quality (format id is the first part)
         if " - " in quality_text:
@@ -1095,174 +2363,363 @@ class GRABApp:
         
         # Get media type
         media_type = self.media_type_combo.get_active_text().lower()
-        
-        # Get format
         output_format = self.format_combo.get_active_text()
         
+        format_spec = None
+        if quality == "auto":
+            format_spec = self.rules_format_spec(url, media_type, output_format)
+        
         # Get output path
         output_path = self.output_entry.get_text().strip()
         if not output_path:
             output_path = os.path.expanduser("~/Downloads")
         
-        # Get cookie file
-        cookie_file = self.cookie_entry.get_text().strip()
+        return build_download_command(
+            url,
+            quality=quality,
+            media_type=media_type,
+            output_format=output_format,
+            output_path=output_path,
+            cookie_file=self.cookie_entry.get_text().strip(),
+            sponsorblock=max(self.sponsor_combo.get_active(), 0),
+            embed_metadata=self.embed_metadata.get_active(),
+            embed_thumbnail=self.embed_thumbnail.get_active(),
+            archive_path=self.archive.path if self.archive and not self.incognito_mode else None,
+            concurrent_fragments=self.fragments_spin.get_value_as_int(),
+            external_downloader="aria2c" if self.aria2c_check.get_active() else "",
+            format_spec=format_spec
+        )
+    
+    def rules_format_spec(self, url, media_type, output_format):
+        """Return the -f value the format rules give for a URL
+        
+        With the formats in the info cache the rules pick one here,
+        otherwise yt-dlp applies them when it extracts the URL.
+        """
+        cookie_file = self.cookie_entry.get_text().strip() or None
+        info = self.info_cache.get(url, cookie_file) if url else None
+        if info is not None and info.get('_type') not in ('playlist', 'multi_video'):
+            format_spec = self.format_rules.format_spec(media_formats(info), media_type, output_format)
+            if format_spec:
+                return format_spec
+        return self.format_rules.selector(media_type, output_format)
+    
+    def start_download(self, item):
+        """Run a queue item in a new slot"""
+        # Save to history (unless in incognito mode)
+        self.save_history(item.url)
         
-        # Get SponsorBlock option
-        sponsorblock_option = self.sponsor_combo.get_active()
-        sponsorblock_args = []
-        if sponsorblock_option == 1:
-            sponsorblock_args = ['--sponsorblock-remove', 'sponsor']
-        elif sponsorblock_option == 2:
-            sponsorblock_args = ['--sponsorblock-remove', 'sponsor,intro,outro']
-        elif sponsorblock_option == 3:
-            sponsorblock_args = ['--sponsorblock-remove', 'all']
-        
-        # Get metadata options
-        metadata_args = []
-        if self.embed_metadata.get_active():
-            metadata_args.append('--embed-metadata')
-        if self.embed_thumbnail.get_active() and media_type == 'video':
-            metadata_args.append('--embed-thumbnail')
-        
-        # Build command based on media type
-        cmd = ['yt-dlp']
-        
-        if media_type == 'audio':
-            cmd.extend(['-x', '--audio-format', output_format])
-        else:
-            cmd.extend(['-f', f'{quality}+bestaudio/{quality}' if quality not in ['best', 'worst'] else quality])
-            if output_format != 'best':
-                cmd.extend(['--merge-output-format', output_format])
-        
-        cmd.extend([
-            '-o', os.path.join(output_path, '%(title)s.%(ext)s'),
-            '--newline',  # Get progress updates per line
-            '--no-part',  # Don't use partial files (better for pause/resume)
-        ])
+        slot = DownloadSlot(item.id, item.url, item.cmd)
+        slot.split_stages()
+        slot.expected_bytes = item.options.get("expected_bytes")
+        slot.private = item.private
+        slot.attempt = item.failures + 1
+        slot.rate_live = self.engine.live_rate_limit
         
-        # Add optional arguments
-        if cookie_file:
-            cmd.extend(['--cookies', cookie_file])
+        # Clear log view when a new batch of downloads starts
+        if not self.active_downloads:
+            self.log_lines.clear()
+            if not self.log_search_active:
+                self.log_store.clear()
         
-        cmd.extend(sponsorblock_args)
-        cmd.extend(metadata_args)
-        cmd.append(url)
+        slot.log = JobLog(item.url, private=item.private)
+        self.job_logs[slot.log.path] = slot.label
         
-        # Update UI
-        self.downloading = True
-        self.paused = False
-        self.download_button.set_sensitive(False)
-        self.pause_button.set_sensitive(True)
-        self.pause_button.set_label("Pause")
-        self.stop_button.set_sensitive(True)
-        self.progress_bar.set_fraction(0.0)
-        self.status_label.set_label("Downloading...")
+        self.active_downloads.append(slot)
+        self.rebalance_bandwidth()
+        self.queue_store.mark_started(item.id)
         
-        # Clear log
-        buffer = self.log_view.get_buffer()
-        buffer.set_text("")
+        # Update queue status
+        self.set_queue_row(item.id, DOWNLOADING)
+        
+        # Update UI
+        self.update_download_controls()
+        self.update_overall_progress()
+        self.update_download_status()
         
         # Run download in thread
-        thread = threading.Thread(target=self.download_thread, args=(cmd,))
+        thread = threading.Thread(target=self.download_thread, args=(slot,))
         thread.daemon = True
         thread.start()
     
-    def download_thread(self, cmd):
-        """Thread function to handle download"""
-        try:
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
-            # Read output line by line
-            for line in iter(self.process.stdout.readline, ''):
-                # Check if we're paused
-                while self.paused and self.downloading:
-                    time.sleep(0.5)
-                
-                # Check if we're stopped
-                if not self.downloading:
-                    break
-                
-                GLib.idle_add(self.update_log, line)
-                
-                # Try to parse progress from line
-                if '[download]' in line and '%' in line:
-                    try:
-                        percent_str = line.split('%')[0].split()[-1]
-                        percent = float(percent_str) / 100.0
-                        GLib.idle_add(self.progress_bar.set_fraction, percent)
-                        
-                        # Update queue progress if this is a queued download
-                        if self.current_download_index >= 0:
-                            tree_iter = self.queue_list.get_iter_from_string(str(self.current_download_index))
-                            self.queue_list.set_value(tree_iter, 2, f"{percent_str}%")
-                    except:
-                        pass
-                
-                # Extract download filename
-                if 'Destination:' in line:
-                    try:
-                        self.current_download_name = line.split('Destination:')[1].strip()
-                        GLib.idle_add(self.status_label.set_label, f"Downloading: {os.path.basename(self.current_download_name)}")
-                    except:
-                        pass
+    def download_thread(self, slot):
+        """Thread function to handle one download slot"""
+        def on_line(line):
+            slot.log.write(line)
+            self.events.post(LogLine(slot, line))
+        
+        def on_progress(progress):
+            self.events.post(Progress(slot, progress))
+        
+        def on_destination(filename):
+            self.events.post(Destination(slot, filename))
+        
+        success, message = run_download(self.engine, slot, on_line, on_progress, on_destination)
+        if success and slot.postprocess_cmd:
+            # Frees the download slot before the pool gets to it
+            self.events.post(PostprocessQueued(slot))
+            self.postprocess.submit(self.postprocess_thread, slot)
+            return
+        self.events.post(JobFinished(slot, success, message))
+    
+    def postprocess_thread(self, slot):
+        """Pool thread function running the post-processing of one slot"""
+        def on_line(line):
+            slot.log.write(line)
+            self.events.post(LogLine(slot, line))
+        
+        success, message = run_postprocess(self.engine, slot, on_line)
+        self.events.post(JobFinished(slot, success, message))
+    
+    def subscribe_events(self):
+        """Route every type of worker event to the method applying it"""
+        self.events.subscribe(Progress, self.on_progress_events)
+        self.events.subscribe(Destination, self.on_destination_events)
+        self.events.subscribe(LogLine, self.update_log)
+        self.events.subscribe(PostprocessQueued, self.on_postprocess_queued_events)
+        self.events.subscribe(JobFinished, self.on_job_finished_events)
+        self.events.subscribe(PlaylistEntries, self.on_playlist_entries_events)
+        self.events.subscribe(PlaylistDone, self.on_playlist_done_events)
+        self.events.subscribe(Notice, self.on_notice_events)
+        self.events.subscribe(QueueChange, self.on_queue_change_events)
+        self.events.subscribe(Call, self.on_call_events)
+    
+    def schedule_event_dispatch(self):
+        """Called by the event bus, from any thread, when events start piling up"""
+        GLib.timeout_add(1000 // UI_FRAME_RATE, self.dispatch_events)
+    
+    def dispatch_events(self):
+        """Apply everything workers posted during the last frame at once"""
+        with span("ui.dispatch_events"):
+            self.events.dispatch()
+        
+        self.event_stats_label.set_label(
+            f"Events: {self.events.received} received, {self.events.dispatched} dispatched"
+        )
+        return False
+    
+    def on_progress_events(self, events):
+        """Apply the newest progress of every job"""
+        for slot, progress in events:
+            slot.progress = progress['fraction']
+            slot.speed = progress.get('speed')
+            slot.eta = progress.get('eta')
+            if progress.get('downloaded_bytes'):
+                slot.bytes_done = progress['downloaded_bytes']
+            self.update_slot_progress(slot, self.progress_text(progress))
             
-            if self.process:
-                self.process.stdout.close()
-                return_code = self.process.wait()
-                
-                if return_code == 0:
-                    GLib.idle_add(self.download_finished, True, "Download completed successfully")
-                    # Update queue status
-                    if self.current_download_index >= 0:
-                        tree_iter = self.queue_list.get_iter_from_string(str(self.current_download_index))
-                        self.queue_list.set_value(tree_iter, 1, "Completed")
-                        self.queue_list.set_value(tree_iter, 2, "100%")
+            # A download of unknown size that turns out too large waits for space
+            if self.disk_space.learn(slot, progress):
+                self.queue_store.set_option(slot.item_id, "expected_bytes", slot.expected_bytes)
+                if not self.disk_space.still_fits(slot, self.active_downloads + self.postprocessing):
+                    slot.no_space = True
+                    slot.paused = True
+                    slot.singled_out = True
+                    self.engine.interrupt(slot)
+    
+    def on_destination_events(self, events):
+        """Show the files jobs are now writing to"""
+        for slot, filename in events:
+            slot.download_name = filename
+        self.update_download_status()
+    
+    def on_postprocess_queued_events(self, events):
+        """Start the next downloads while downloaded jobs are post-processed"""
+        for (slot,) in events:
+            if slot in self.active_downloads:
+                self.active_downloads.remove(slot)
+            self.postprocessing.append(slot)
+            if slot.bytes_done:
+                self.queue_store.set_bytes_done(slot.item_id, slot.bytes_done)
+            self.set_queue_row(slot.item_id, progress="100%", status="Post-processing")
+        self.rebalance_bandwidth()
+        self.update_download_controls()
+        self.update_download_status()
+        self.process_queue()
+    
+    def on_job_finished_events(self, events):
+        """Handle the end of every finished download"""
+        for event in events:
+            self.download_finished(*event)
+    
+    def on_playlist_entries_events(self, events):
+        """Show the entries listed since the last frame"""
+        for event in events:
+            self.playlist_entries_added(*event)
+    
+    def on_playlist_done_events(self, events):
+        """Report every playlist listing that ended"""
+        for event in events:
+            self.playlist_expanded(*event)
+    
+    def on_notice_events(self, events):
+        """Show messages posted by workers"""
+        for text, error in events:
+            if error:
+                self.show_error(text)
+            else:
+                self.show_info(text)
+    
+    def on_queue_change_events(self, events):
+        """Show queue changes made through the control API and act on them"""
+        for action, data in events:
+            if action == 'added':
+                items, playlists, start, front = data
+                if front:
+                    self.append_queue_rows(items)
+                    self.move_queue_rows([item.id for item in items], True)
                 else:
-                    GLib.idle_add(self.download_finished, False, f"Download failed with code {return_code}")
-                    # Update queue status
-                    if self.current_download_index >= 0:
-                        tree_iter = self.queue_list.get_iter_from_string(str(self.current_download_index))
-                        self.queue_list.set_value(tree_iter, 1, "Failed")
-                
-        except Exception as e:
-            GLib.idle_add(self.download_finished, False, f"Error: {str(e)}")
+                    self.insert_queue_rows(items)
+                for url, cmd in playlists:
+                    self.expand_playlist(url, cmd, start)
+                if start:
+                    self.start_queue()
+            elif action == 'state':
+                item_ids, state = data
+                for item_id in item_ids:
+                    self.set_queue_row(item_id, state)
+                if state == QUEUED and self.active_downloads:
+                    self.process_queue()
+            elif action == 'move':
+                self.move_queue_rows(*data)
+            elif action in ('cancel', 'pause'):
+                for slot in self.active_downloads + self.postprocessing:
+                    if slot.item_id in data:
+                        slot.singled_out = True
+                        if action == 'cancel':
+                            slot.stopped = True
+                        else:
+                            slot.paused = True
+                        self.engine.interrupt(slot)
+        self.update_download_controls()
     
-    def on_pause(self, widget):
-        """Pause or resume download"""
-        if self.downloading:
-            if self.paused:
-                # Resume download
-                self.paused = False
-                self.pause_button.set_label("Pause")
-                self.status_label.set_label("Resuming download...")
+    def control_command(self, url, options):
+        """Build the download command of a control API item, from any thread"""
+        check_item_options(options)
+        return settings_command(url, self.settings_values(), **{
+            'quality': None,
+            'archive_path': self.archive.path if self.archive else None,
+            **options
+        })
+    
+    def on_call_events(self, events):
+        """Apply the results of one-off background tasks"""
+        for func, args in events:
+            func(*args)
+    
+    def progress_text(self, progress):
+        """Describe a progress dict for the queue view"""
+        parts = [f"{progress['fraction'] * 100:.1f}%"]
+        if progress.get('speed'):
+            parts.append(f"{format_size(progress['speed'])}/s")
+        if progress.get('eta') is not None:
+            parts.append(f"ETA {format_duration(progress['eta'])}")
+        if progress.get('fragment_count'):
+            parts.append(f"frag {progress.get('fragment_index', 0)}/{progress['fragment_count']}")
+        return "  ".join(parts)
+    
+    def update_slot_progress(self, slot, progress_text):
+        """Show the progress of one slot in its queue row and the overall bar"""
+        self.set_queue_row(slot.item_id, progress=progress_text)
+        self.update_overall_progress()
+        
+        # Save the byte count now and then, so a crash loses little
+        now = time.time()
+        if slot.bytes_done and now - slot.bytes_saved_at >= BYTES_SAVE_INTERVAL:
+            slot.bytes_saved_at = now
+            self.queue_store.set_bytes_done(slot.item_id, slot.bytes_done)
+    
+    def update_overall_progress(self):
+        """Set the progress bar to the average progress of all active slots"""
+        if self.active_downloads:
+            total = sum(slot.progress for slot in self.active_downloads)
+            self.progress_bar.set_fraction(total / len(self.active_downloads))
+    
+    def update_download_status(self):
+        """Describe the active downloads in the status label"""
+        if not self.active_downloads:
+            if self.postprocessing and not self.paused:
+                self.status_label.set_label(f"Post-processing {len(self.postprocessing)} items...")
+            return
+        
+        if self.paused:
+            self.status_label.set_label("Download paused")
+        elif len(self.active_downloads) == 1:
+            slot = self.active_downloads[0]
+            if slot.download_name:
+                self.status_label.set_label(f"Downloading: {os.path.basename(slot.download_name)}")
             else:
-                # Pause download
-                self.paused = True
-                self.pause_button.set_label("Resume")
-                self.status_label.set_label("Download paused")
+                self.status_label.set_label("Downloading...")
+        else:
+            self.status_label.set_label(f"Downloading {len(self.active_downloads)} items...")
     
-    def on_stop(self, widget):
-        """Stop download"""
-        if self.downloading and self.process:
-            self.process.terminate()
-            self.downloading = False
+    def rebalance_bandwidth(self):
+        """Split the bandwidth budget across the running downloads"""
+        for slot, rate in self.bandwidth.shares(self.active_downloads).items():
+            slot.rate_limit = rate
+    
+    def update_download_controls(self):
+        """Enable buttons according to the number of busy slots"""
+        self.downloading = bool(self.active_downloads or self.postprocessing)
+        busy = self.downloading or self.paused or bool(self.expansions)
+        self.download_button.set_sensitive(
+            len(self.active_downloads) < self.max_concurrent_downloads or self.paused)
+        self.pause_button.set_sensitive(busy)
+        self.stop_button.set_sensitive(busy)
+        self.pause_button.set_label("Resume" if self.paused else "Pause")
+    
+    def on_pause(self, widget):
+        """Pause or resume all downloads
+        
+        Pausing interrupts every running download and keeps its partial
+        files; resuming queues the paused items again ahead of the rest,
+        and yt-dlp continues from the data already on disk.
+        """
+        if self.paused:
+            # Resume downloads
             self.paused = False
-            self.status_label.set_label("Download stopped")
-            self.download_button.set_sensitive(True)
-            self.pause_button.set_sensitive(False)
-            self.stop_button.set_sensitive(False)
-            self.pause_button.set_label("Pause")
-            
-            # Update queue status if this was a queued download
-            if self.current_download_index >= 0:
-                tree_iter = self.queue_list.get_iter_from_string(str(self.current_download_index))
-                self.queue_list.set_value(tree_iter, 1, "Stopped")
+            self.status_label.set_label("Resuming download...")
+            self.move_queue_items(PAUSED, QUEUED)
+            self.update_download_controls()
+            self.start_queue()
+        elif self.downloading:
+            # Pause downloads
+            self.paused = True
+            self.status_label.set_label("Download paused")
+            for slot in self.active_downloads + self.postprocessing:
+                slot.paused = True
+                self.engine.interrupt(slot)
+            self.update_download_controls()
+    
+    def on_stop(self, widget):
+        """Stop all downloads"""
+        for slot in self.active_downloads + self.postprocessing:
+            slot.stopped = True
+            self.engine.interrupt(slot)
+        
+        # Stop listing playlists, entries found so far stay queued
+        for expansion in self.expansions:
+            expansion.stopped = True
+            self.engine.interrupt(expansion)
+        
+        # Paused downloads are stopped as well
+        self.move_queue_items(PAUSED, STOPPED)
+        
+        # Retries and items waiting for disk space do not start by themselves
+        for source in (self.retry_source, self.disk_source):
+            if source:
+                GLib.source_remove(source)
+        self.retry_source = None
+        self.disk_source = None
+        self.queue_stopped = True
+        self.paused = False
+        self.status_label.set_label("Download stopped")
+        self.update_download_controls()
+    
+    def move_queue_items(self, old_state, new_state):
+        """Move every item in one state to another and update their rows"""
+        for item_id in self.queue_store.move_state(old_state, new_state):
+            self.set_queue_row(item_id, new_state)
     
     def on_open_browser(self, widget):
         """Open URL in built-in browser"""
@@ -1376,8 +2833,53 @@ class GRABApp:
         self.default_format = self.default_format_combo.get_active()
         self.default_media_type = self.default_media_type_combo.get_active()
         self.default_output_path = self.default_output_entry.get_text().strip()
-        
+        self.max_concurrent_downloads = self.concurrent_spin.get_value_as_int()
+        self.max_per_host = self.per_host_spin.get_value_as_int()
+        self.host_limits.max_per_host = self.max_per_host
+        self.bandwidth_limit_kib = self.bandwidth_spin.get_value_as_int()
+        self.bandwidth.limit = self.bandwidth_limit_kib * 1024
+        self.bandwidth.slots = self.max_concurrent_downloads
+        self.rebalance_bandwidth()
+        self.concurrent_fragments = self.default_fragments_spin.get_value_as_int()
+        self.external_downloader = "aria2c" if self.default_aria2c_check.get_active() else ""
+        self.fragments_spin.set_value(self.concurrent_fragments)
+        self.aria2c_check.set_active(self.external_downloader == "aria2c")
+        self.max_retries = self.retries_spin.get_value_as_int()
+        self.retry_policy.max_retries = self.max_retries
+        self.min_free_space_mb = self.free_space_spin.get_value_as_int()
+        self.disk_space.min_free = self.min_free_space_mb * 1024 * 1024
+        self.auto_quality = self.auto_quality_check.get_active()
+        self.format_rules = FormatRules(
+            max_height=int(self.max_height_combo.get_active_id() or 0),
+            codecs=self.codecs_entry.get_text().replace(",", " ").split(),
+            max_size_mb=self.max_size_spin.get_value_as_int(),
+            prefer_no_reencode=self.no_reencode_check.get_active()
+        )
+        self.engine_name = self.engine_combo.get_active_id() or "subprocess"
+        self.engine = get_engine(self.engine_name)
+        self.info_cache_ttl_hours = self.cache_ttl_spin.get_value_as_int()
+        self.info_cache_max_mb = self.cache_size_spin.get_value_as_int()
+        self.info_cache.ttl = self.info_cache_ttl_hours * 3600
+        self.info_cache.max_bytes = self.info_cache_max_mb * 1024 * 1024
+        self.thumbnail_cache_max_mb = self.thumbnail_cache_spin.get_value_as_int()
+        self.thumbnail_cache.max_bytes = self.thumbnail_cache_max_mb * 1024 * 1024
+        download_archive = os.path.expanduser(self.archive_entry.get_text().strip())
+        if download_archive != self.download_archive:
+            self.download_archive = download_archive
+            self.archive = DownloadArchive(download_archive) if download_archive else None
+        if self.engine_name == LibraryEngine.name and not LibraryEngine.available():
+            self.show_error("The yt_dlp Python module is not installed, using the yt-dlp command instead")
+        status_endpoint = self.status_endpoint_entry.get_text().strip()
+        control_api = self.control_api_check.get_active()
+        if (status_endpoint, control_api) != (self.status_endpoint, self.control_api):
+            self.status_endpoint = status_endpoint
+            self.control_api = control_api
+            self.start_status_server()
+
         self.save_settings()
+
+        # A larger pool can pick up waiting queue items right away
+        self.process_queue()
         self.show_info("Settings saved successfully!")
     
     def on_backup_settings(self, widget):
@@ -1411,7 +2913,24 @@ class GRABApp:
                     'default_output_path': self.default_output_path,
                     'sponsorblock': self.default_sponsorblock,
                     'embed_metadata': self.default_embed_metadata,
-                    'embed_thumbnail': self.default_embed_thumbnail
+                    'embed_thumbnail': self.default_embed_thumbnail,
+                    'max_concurrent_downloads': self.max_concurrent_downloads,
+                    'max_per_host': self.max_per_host,
+                    'host_limits': self.host_limits.overrides,
+                    'bandwidth_limit_kib': self.bandwidth_limit_kib,
+                    'concurrent_fragments': self.concurrent_fragments,
+                    'external_downloader': self.external_downloader,
+                    'max_retries': self.max_retries,
+                    'min_free_space_mb': self.min_free_space_mb,
+                    'auto_quality': self.auto_quality,
+                    'format_rules': self.format_rules.to_dict(),
+                    'engine': self.engine_name,
+                    'info_cache_ttl_hours': self.info_cache_ttl_hours,
+                    'info_cache_max_mb': self.info_cache_max_mb,
+                    'thumbnail_cache_max_mb': self.thumbnail_cache_max_mb,
+                    'download_archive': self.download_archive,
+                    'status_endpoint': self.status_endpoint,
+                    'control_api': self.control_api
                 },
                 'cookies': {}
             }
@@ -1464,7 +2983,9 @@ class GRABApp:
                         json.dump(backup_data['settings'], f, indent=4)
                     
                     # Reload settings
+                    server_settings = (self.status_endpoint, self.control_api)
                     self.load_settings()
+                    self.apply_restored_settings(server_settings)
                 
                 # Restore cookies
                 if 'cookies' in backup_data:
@@ -1485,34 +3006,200 @@ class GRABApp:
         
         dialog.destroy()
     
-    def update_log(self, text):
-        """Update log view with new text"""
-        buffer = self.log_view.get_buffer()
-        end_iter = buffer.get_end_iter()
-        buffer.insert(end_iter, text)
+    def apply_restored_settings(self, server_settings):
+        """Show settings loaded from a backup and put them to use
+        
+        server_settings are the status endpoint and control API setting
+        from before, the server restarts when they changed.
+        """
+        settings = Gtk.Settings.get_default()
+        settings.set_property("gtk-application-prefer-dark-theme", self.use_dark_theme)
+        self.theme_button.set_label("🌙" if self.use_dark_theme else "☀️")
+        self.fragments_spin.set_value(self.concurrent_fragments)
+        self.aria2c_check.set_active(self.external_downloader == "aria2c")
+        # The Settings tab shows them when it is first built
+        if self.theme_combo is not None:
+            self.show_settings()
+        if (self.status_endpoint, self.control_api) != server_settings:
+            self.start_status_server()
+        self.rebalance_bandwidth()
+        self.process_queue()
+    
+    def update_log(self, lines):
+        """Add (slot, line) pairs, such as LogLine events, to the ring buffer and the log view"""
+        entries = [(slot.label, line.rstrip("\n")) for slot, line in lines]
+        self.log_lines.extend(entries)
+        if self.log_search_active:
+            return
+        
+        for entry in entries[-LOG_VIEW_LINES:]:
+            self.log_store.append(list(entry))
+        
+        # Keep only the newest lines in the view
+        overflow = len(self.log_store) - LOG_VIEW_LINES
+        tree_iter = self.log_store.get_iter_first()
+        while overflow > 0 and tree_iter:
+            if not self.log_store.remove(tree_iter):
+                break
+            overflow -= 1
         
         # Scroll to end
-        mark = buffer.get_insert()
-        end_iter = buffer.get_end_iter()
-        buffer.place_cursor(end_iter)
-        self.log_view.scroll_to_mark(mark, 0.0, True, 0.0, 1.0)
+        if len(self.log_store):
+            path = Gtk.TreePath.new_from_indices([len(self.log_store) - 1])
+            self.log_view.scroll_to_cell(path, None, False, 0.0, 0.0)
     
-    def download_finished(self, success, message):
-        """Handle download completion"""
-        self.downloading = False
-        self.paused = False
-        self.download_button.set_sensitive(True)
-        self.pause_button.set_sensitive(False)
-        self.stop_button.set_sensitive(False)
-        self.pause_button.set_label("Pause")
-        self.status_label.set_label(message)
+    def on_search_log(self, entry):
+        """Search the full log files of this session in the background"""
+        text = entry.get_text().strip()
+        if not text:
+            return
         
-        if success:
-            self.progress_bar.set_fraction(1.0)
+        thread = threading.Thread(target=self.search_log_thread, args=(text, list(self.job_logs)))
+        thread.daemon = True
+        thread.start()
+    
+    def search_log_thread(self, text, paths):
+        """Thread function to search log files"""
+        matches = search_logs(paths, text, limit=LOG_VIEW_LINES)
+        self.events.post(Call(self.show_log_search_results, (text, matches)))
+    
+    def show_log_search_results(self, text, matches):
+        """Replace the log view with the lines matching a search"""
+        if self.log_search_entry.get_text().strip() != text:
+            return
+        
+        self.log_search_active = True
+        self.log_view.set_model(None)
+        self.log_store.clear()
+        for path, line in matches:
+            self.log_store.append([self.job_logs.get(path, ""), line])
+        if not matches:
+            self.log_store.append(["", f"No log lines contain '{text}'"])
+        self.log_view.set_model(self.log_store)
+    
+    def on_log_search_changed(self, entry):
+        """Go back to the live log when the search is cleared"""
+        if entry.get_text().strip() or not self.log_search_active:
+            return
+        
+        self.log_search_active = False
+        self.log_view.set_model(None)
+        self.log_store.clear()
+        for entry_line in self.log_lines:
+            self.log_store.append(list(entry_line))
+        self.log_view.set_model(self.log_store)
+    
+    def on_export_log(self, widget):
+        """Save the full log of this session to a file"""
+        if not self.job_logs:
+            self.show_error("Nothing has been logged yet")
+            return
+        
+        dialog = Gtk.FileChooserDialog(
+            title="Export Log",
+            parent=self.window,
+            action=Gtk.FileChooserAction.SAVE
+        )
+        dialog.add_buttons(
+            Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+            Gtk.STOCK_SAVE, Gtk.ResponseType.OK
+        )
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("grab_log.txt")
+        
+        response = dialog.run()
+        destination = dialog.get_filename()
+        dialog.destroy()
+        
+        if response == Gtk.ResponseType.OK:
+            thread = threading.Thread(target=self.export_log_thread, args=(list(self.job_logs), destination))
+            thread.daemon = True
+            thread.start()
+    
+    def export_log_thread(self, paths, destination):
+        """Thread function to export log files"""
+        try:
+            export_logs(paths, destination)
+            self.events.post(Notice(f"Log exported to {destination}", False))
+        except OSError as e:
+            self.events.post(Notice(f"Error exporting log: {str(e)}", True))
+    
+    def download_finished(self, slot, success, message):
+        """Handle completion of one download slot"""
+        if slot.log:
+            slot.log.close()
+        if slot.metrics and not slot.private:
+            self.metrics.record(slot.metrics)
+        
+        if slot in self.active_downloads:
+            self.active_downloads.remove(slot)
+            self.rebalance_bandwidth()
+        elif slot in self.postprocessing:
+            self.postprocessing.remove(slot)
+        
+        state = finished_state(slot, success, self.paused)
+        
+        # Failures that may go away are tried again later
+        delay = self.retry_policy.delay(slot.failure, slot.attempt) if state == FAILED else None
+        self.queue_status.job_finished(slot, state, retrying=delay is not None)
+        
+        # Update the queue journal
+        if slot.bytes_done:
+            self.queue_store.set_bytes_done(slot.item_id, slot.bytes_done)
+        if delay is not None:
+            self.queue_store.schedule_retry(slot.item_id, time.time() + delay, message, slot.failure)
+            message += f", retry {slot.attempt} in {format_duration(delay)}"
+            state = QUEUED
+        elif slot.private and state in FINISHED_STATES:
+            self.queue_store.delete(slot.item_id)
+        else:
+            self.queue_store.set_state(slot.item_id, state, None if success else message, slot.failure)
+        
+        # Update queue status
+        if delay is not None:
+            status = f"Retry in {format_duration(delay)}: {FAILURE_LABELS[slot.failure]}"
+        elif slot.no_space:
+            status = "Waiting for disk space"
+        elif state == FAILED:
+            status = FAILURE_LABELS.get(slot.failure)
+        else:
+            status = None
+        self.set_queue_row(slot.item_id, state, "100%" if success else None, status=status)
+        
+        self.update_download_controls()
+        
+        if self.active_downloads:
+            self.update_overall_progress()
+            self.update_download_status()
+        else:
+            self.status_label.set_label(message)
+            self.progress_bar.set_fraction(1.0 if success else 0.0)
+        
+        # Pick up the entries yt-dlp added to the archive
+        if success and self.archive:
+            self.archive.refresh()
+        
+        # Only Stop and Pause for the whole queue hold it up
+        if state not in (STOPPED, PAUSED) or slot.singled_out:
             # Process next item in queue
             GLib.timeout_add(1000, self.process_queue)  # Wait 1 second before next download
-        else:
-            self.progress_bar.set_fraction(0.0)
+    
+    def start_status_server(self):
+        """(Re)start the status endpoint on the address from the settings"""
+        if self.status_server:
+            self.status_server.stop()
+            self.status_server = None
+        if not self.status_endpoint:
+            return
+        
+        server = StatusServer(self.queue_status, self.status_endpoint,
+                              self.queue_control if self.control_api else None)
+        try:
+            server.start()
+        except (OSError, ValueError) as e:
+            self.show_error(f"Cannot start the status endpoint on {self.status_endpoint}: {e}")
+            return
+        self.status_server = server
     
     def on_report_error(self, widget):
         """Open yt-dlp issue page in browser"""
@@ -1545,8 +3232,9 @@ class GRABApp:
     
     def on_destroy(self, widget):
         """Handle window close"""
-        if self.downloading and self.process:
-            self.process.terminate()
+        # Running items stay in the journal and are offered again next time
+        for slot in self.active_downloads + self.postprocessing + self.expansions:
+            self.engine.interrupt(slot)
         
         # Clean up temporary cookie file
         if self.temp_cookie_file and os.path.exists(self.temp_cookie_file):
@@ -1557,9 +3245,16 @@ class GRABApp:
         
         # Save settings
         self.save_settings()
+        if self.status_server:
+            self.status_server.stop()
+        self.queue_store.close()
         
         Gtk.main_quit()
 
-if __name__ == "__main__":
-    app = GRABApp()
+def main():
+    """Run the GRAB window"""
+    GRABApp()
     Gtk.main()
+
+if __name__ == "__main__":
+    main()